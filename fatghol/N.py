@@ -24,28 +24,23 @@ enumeration algorithms.
 import math
 import sys
 
-from decorator import *
-
-def getattr_(obj, name, default_thunk):
-    "Similar to .setdefault in dictionaries."
-    try:
-        return getattr(obj, name)
-    except AttributeError:
-        default = default_thunk()
-        setattr(obj, name, default)
-        return default
-
-@decorator
-def memoize(func, *args):
-    dic = getattr_(func, "memoize_dic", dict)
-    # memoize_dic is created at the first call
-    if args in dic:
-        return dic[args]
-    else:
-        result = func(*args)
-        dic[args] = result
-        return result
-    
+from fatghol.cache import fcache as memoize
+
+
+# number of (unique) trivalent fatgraphs, from actual computation
+TRIVALENT_GRAPHS_COUNT = {
+    (0,3): 2,
+    (0,4): 6,
+    (0,5): 26,
+    (0,6): 191,
+    (1,1): 1,
+    (1,2): 5,
+    (1,3): 46,
+    (1,4): 669,
+    (2,1): 9,
+    (2,2): 368,
+    }
+
 def m_min(g,n):
     return (2*g + n - 1)
 
@@ -124,18 +119,7 @@ def N1(g,n):
     def estimate(g,n):
         try:
             # use result from actual computation
-            return {
-                (0,3): 2,  
-                (0,4): 6,  
-                (0,5): 26, 
-                (0,6): 191,
-                (1,1): 1,  
-                (1,2): 5,  
-                (1,3): 46, 
-                (1,4): 669,
-                (2,1): 9,  
-                (2,2): 368,
-                }[g,n]
+            return TRIVALENT_GRAPHS_COUNT[g,n]
         except KeyError:
             # recurse and use as estimate
             return N1(g,n)
@@ -226,22 +210,22 @@ def print_list(func=N3, chi_max=None, g_max=None, n_max=None, maxwidth=12):
 
 ## main
 
-if len(sys.argv) <= 1:
-    max_chi = 8
-    max_g = None
-    max_n = None
-elif len(sys.argv) == 2:
-    max_chi = int(sys.argv[1])
-    max_g = None
-    max_n = None
-else:
-    max_chi = None
-    max_g = int(sys.argv[1])
-    max_n = int(sys.argv[2])
-
-for fn in N1, N2, N3:
-    print fn.__doc__
-    #print_table(fn, max_chi, max_g, max_n)
-    print_list(fn, max_chi, max_g, max_n)
-    print
-
+if __name__ == '__main__':
+    if len(sys.argv) <= 1:
+        max_chi = 8
+        max_g = None
+        max_n = None
+    elif len(sys.argv) == 2:
+        max_chi = int(sys.argv[1])
+        max_g = None
+        max_n = None
+    else:
+        max_chi = None
+        max_g = int(sys.argv[1])
+        max_n = int(sys.argv[2])
+
+    for fn in N1, N2, N3:
+        print fn.__doc__
+        #print_table(fn, max_chi, max_g, max_n)
+        print_list(fn, max_chi, max_g, max_n)
+        print
@@ -23,7 +23,7 @@ __docformat__ = 'reStructuredText'
 
 
 ## stdlib imports
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import functools
 from time import time
 import weakref
@@ -36,6 +36,7 @@ import weakref
 ## local imports
 
 from fatghol.iterators import Iterator
+import fatghol.timing as timing
 
 
 ## auxiliary classes
@@ -124,6 +125,86 @@ class _IteratorReplayer(Iterator):
             raise
 
 
+#@cython.cclass
+class LRUCache(object):
+    """A mapping that holds at most `maxsize` entries: when a new
+    entry is stored into a full cache, the least-recently-used one is
+    dropped.  A `maxsize` of 0 disables caching altogether.
+
+    Lookups are made with `get`, which returns `None` if the key is
+    not in the cache, and counts hits and misses::
+
+      >>> c = LRUCache(2)
+      >>> c.put('a', 1)
+      >>> c.put('b', 2)
+      >>> c.get('a')
+      1
+      >>> c.put('c', 3) # drops 'b', which is now the least recently used
+      >>> print c.get('b')
+      None
+      >>> (len(c), c.hits, c.misses, c.hit_rate())
+      (2, 1, 1, 0.5)
+    """
+
+    __slots__ = ['_data', 'hits', 'maxsize', 'misses', '__weakref__']
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        _lru_caches.add(self)
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        """Return the value stored under `key`, or `None` if there
+        is none; mark `key` as the most-recently-used.
+        """
+        value = self._data.pop(key, None)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._data[key] = value
+        return value
+
+    def put(self, key, value):
+        """Store `value` under `key`."""
+        if self.maxsize <= 0:
+            return
+        self._data.pop(key, None)
+        self._data[key] = value
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def resize(self, maxsize):
+        """Change the maximum number of entries to `maxsize`,
+        dropping the least-recently-used ones if needed.
+        """
+        self.maxsize = maxsize
+        while len(self._data) > max(maxsize, 0):
+            self._data.popitem(last=False)
+
+    def clear(self):
+        """Drop all entries; hit and miss counts are kept."""
+        self._data.clear()
+
+    def hit_rate(self):
+        """Return the fraction of lookups that found an entry, or
+        `None` if no lookup has been made yet.
+        """
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return None
+        return float(self.hits) / lookups
+
+
+#: All `LRUCache` instances, so that `evict` can drop their entries.
+_lru_caches = weakref.WeakSet()
+
+
 #@cython.cclass
 class Caching(object):
     """Instances of this class provide an interface for use by caches
@@ -139,6 +220,139 @@ class Caching(object):
 
 
 
+#@cython.locals(obj=Caching, slot=str)
+def clear_caches(obj):
+    """Drop all results cached in `Caching` instance `obj`."""
+    for slot in Caching.__slots__:
+        try:
+            delattr(obj, slot)
+        except AttributeError:
+            pass
+
+
+
+## LRU eviction of cached results
+
+#: Approximate memory (in bytes) taken by an entry in a cache slot,
+#: including the cached result.
+CACHE_ENTRY_BYTES = 256
+
+#: Approximate memory (in bytes) taken by each item recorded by an
+#: `_IteratorRecorder` (an `Isomorphism` and its permutations).
+RECORDED_ITEM_BYTES = 1024
+
+#: Map the `id` of each `Caching` instance that has cached results to
+#: a weak reference to it, least-recently-used first; `None` unless
+#: usage tracking has been started with `track_usage`.
+_lru = None
+
+
+def track_usage():
+    """Start tracking usage of the caches, so that cached results can
+    be dropped, least-recently-used first, with `evict`.
+
+    Only the caches used from now on are tracked.
+    """
+    global _lru
+    if _lru is None:
+        _lru = OrderedDict()
+
+
+#@cython.cfunc
+def _touch(obj):
+    key = id(obj)
+    ref = _lru.pop(key, None)
+    if ref is None or ref() is not obj:
+        # the `id` of a dead object may be reused
+        ref = weakref.ref(obj)
+    _lru[key] = ref
+
+
+#@cython.locals(obj=Caching, slot=str, size=cython.long)
+def cache_size(obj):
+    """Return the approximate memory (in bytes) taken by the results
+    cached in `Caching` instance `obj`.
+
+    Examples::
+
+      >>> from fatghol.rg import Fatgraph, Vertex
+      >>> g = Fatgraph([Vertex([1, 0, 1, 0])])
+      >>> cache_size(g)
+      0
+      >>> g.num_automorphisms()
+      4
+      >>> cache_size(g) > 0
+      True
+    """
+    size = 0
+    for slot in Caching.__slots__:
+        cache = getattr(obj, slot, None)
+        if cache is not None:
+            size += CACHE_ENTRY_BYTES * len(cache)
+    recorded = getattr(obj, '_cache_isomorphisms', None)
+    if recorded is not None:
+        for recorder in recorded.values():
+            size += RECORDED_ITEM_BYTES * len(recorder.history)
+    return size
+
+
+def cache_footprint():
+    """Return a pair `(owners, size)`: the number of tracked `Caching`
+    instances holding cached results, and the approximate memory (in
+    bytes) taken by all cached results, including those of `fcache`.
+
+    Only caches used after `track_usage` has been called are counted.
+    """
+    owners = 0
+    size = 0
+    if _lru is not None:
+        for ref in _lru.values():
+            obj = ref()
+            if obj is not None:
+                owners += 1
+                size += cache_size(obj)
+    for cache in _func_cache.itervalues():
+        size += CACHE_ENTRY_BYTES * len(cache)
+    for cache in _lru_caches:
+        size += CACHE_ENTRY_BYTES * len(cache)
+    return (owners, size)
+
+
+#@cython.locals(nbytes=cython.long, freed=cython.long)
+def evict(nbytes):
+    """Drop cached results until about `nbytes` bytes have been
+    freed; return the approximate number of bytes actually freed.
+
+    All results cached by the least-recently-used `Caching` instance
+    are dropped first, then those of the next one, and so on; if that
+    is not enough, the results cached by `fcache` and all `LRUCache`
+    instances are dropped too.  Usage must be tracked (see `track_usage`) for cached results to
+    be dropped, except for those of `fcache`.
+    """
+    freed = 0
+    evicted = 0
+    if _lru is not None:
+        while freed < nbytes and _lru:
+            (key, ref) = _lru.popitem(last=False)
+            obj = ref()
+            if obj is None:
+                continue # with next entry
+            freed += cache_size(obj)
+            clear_caches(obj)
+            evicted += 1
+    if freed < nbytes:
+        for cache in _func_cache.itervalues():
+            freed += CACHE_ENTRY_BYTES * len(cache)
+            cache.clear()
+        for cache in _lru_caches:
+            freed += CACHE_ENTRY_BYTES * len(cache)
+            cache.clear()
+    if timing.enabled:
+        timing.count('cache.evicted', evicted)
+    return freed
+
+
+
 ## caching functions
 
 # store 
@@ -161,11 +375,16 @@ def fcache(func):
         cache = _func_cache[id(func)]
         key = args
         try:
-            return cache[key]
+            result = cache[key]
         except KeyError:
+            if timing.enabled:
+                timing.count('cache.fcache.misses')
             result = func(*args)
             cache[key] = result
             return result
+        if timing.enabled:
+            timing.count('cache.fcache.hits')
+        return result
     return wrapper
 
 
@@ -184,12 +403,19 @@ def ocache0(func):
             cache = obj._cache0
         except AttributeError:
             obj._cache0 = cache = dict()
+        if _lru is not None:
+            _touch(obj)
         try:
-            return cache[func.func_name]
+            result = cache[func.func_name]
         except KeyError:
+            if timing.enabled:
+                timing.count('cache.ocache0.misses')
             result = func(obj)
             cache[func.func_name] = result
             return result
+        if timing.enabled:
+            timing.count('cache.ocache0.hits')
+        return result
     return wrapper
 
 
@@ -211,12 +437,19 @@ def ocache_contract(func):
             cache = obj._cache_contract
         except AttributeError:
             obj._cache_contract = cache = weakref.WeakValueDictionary()
+        if _lru is not None:
+            _touch(obj)
         try:
-            return cache[edgeno]
+            result = cache[edgeno]
         except KeyError:
+            if timing.enabled:
+                timing.count('cache.ocache_contract.misses')
             result = func(obj, edgeno)
             cache[edgeno] = result
             return result
+        if timing.enabled:
+            timing.count('cache.ocache_contract.hits')
+        return result
     return wrapper
 
 
@@ -242,13 +475,21 @@ def ocache_eq(func):
             cache2 = o2._cache
         except AttributeError:
             o2._cache_eq = cache2 = weakref.WeakKeyDictionary()
+        if _lru is not None:
+            _touch(o1)
+            _touch(o2)
         try:
-            return cache1[o2]
+            result = cache1[o2]
         except KeyError:
+            if timing.enabled:
+                timing.count('cache.ocache_eq.misses')
             result = func(o1, o2)
             cache1[o2] = result
             cache2[o1] = result
             return result
+        if timing.enabled:
+            timing.count('cache.ocache_eq.hits')
+        return result
     return wrapper
 
 
@@ -274,12 +515,19 @@ def ocache_isomorphisms(func):
             cache = o1._cache_isomorphisms
         except AttributeError:
             cache = o1._cache_isomorphisms = weakref.WeakKeyDictionary()
+        if _lru is not None:
+            _touch(o1)
         try:
-            return cache[o2].replay()
+            result = cache[o2]
         except KeyError:
+            if timing.enabled:
+                timing.count('cache.ocache_isomorphisms.misses')
             result = _IteratorRecorder(func(o1, o2))
             cache[o2] = result
             return result.replay()
+        if timing.enabled:
+            timing.count('cache.ocache_isomorphisms.hits')
+        return result.replay()
     return wrapper
 
 
@@ -47,3 +47,8 @@ cdef class FixedLengthPartitionIterator:
 
 cpdef PartitionIterator(N, K, min_=?, max_=?)
 
+cpdef int character(tuple la, tuple mu)
+cpdef tuple cycle_type(p)
+cpdef long centralizer_order(tuple mu)
+cpdef list young_symmetrizer(tuple la)
+
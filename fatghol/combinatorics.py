@@ -31,6 +31,7 @@ import operator
 from fatghol.cache import (
     fcache,
     )
+from fatghol.runtime import runtime
 
 
 def bernoulli(n):
@@ -401,8 +402,8 @@ class Permutation(dict):
         """
         dict.__init__(self, initial)
         # XXX: this is stuff for DBC's invariants
-        assert set(self.keys()) == set(self.values())
-        if __debug__:
+        if runtime.checks:
+            assert set(self.keys()) == set(self.values())
             for src,dst in self.iteritems():
                 assert 0 <= src
                 assert 0 <= dst
@@ -929,6 +930,136 @@ def PartitionIterator(N, K, min_=1, max_=None):
 
 
 
+## representations of the symmetric group
+
+@fcache
+def character(la, mu):
+    """Return the value of the irreducible character of the symmetric
+    group indexed by partition `la`, on permutations of cycle type
+    `mu`.
+
+    Both `la` and `mu` are tuples of positive integers in descending
+    order, with the same sum.  The value is computed by the
+    Murnaghan-Nakayama rule, removing rim hooks of length `mu[0]`,
+    `mu[1]`, ... from the Young diagram of `la`.
+
+    Examples::
+
+      >>> character((2,1), (1,1,1)) # dimension of the representation
+      2
+      >>> [ character(la, (2,1)) for la in PartitionIterator(3,3) ]
+      [1, 0, -1]
+      >>> [ character(la, (4,)) for la in PartitionIterator(4,4) ]
+      [1, -1, 0, 1, -1]
+    """
+    if len(mu) == 0:
+        return 1
+    r = mu[0]
+    # work with the beta-set of `la`: removing a rim hook of length
+    # `r` amounts to moving one bead from position `b` to `b-r`
+    L = len(la)
+    beta = [ la[i] + (L-1-i) for i in xrange(L) ]
+    result = 0
+    for b in beta:
+        if b-r < 0 or (b-r) in beta:
+            continue # with next `b`
+        height = len([ x for x in beta if b-r < x < b ])
+        new_beta = sorted([ x for x in beta if x != b ] + [b-r], reverse=True)
+        new_la = tuple(x for x in (new_beta[i] - (L-1-i) for i in xrange(L)) if x > 0)
+        result += minus_one_exp(height) * character(new_la, mu[1:])
+    return result
+
+
+def cycle_type(p):
+    """Return the cycle type of permutation `p` of `0..n-1`, given as
+    the sequence of images `p[0], p[1], ...`.
+
+    Examples::
+
+      >>> cycle_type([1,0,2])
+      (2, 1)
+      >>> cycle_type([1,2,3,0])
+      (4,)
+    """
+    seen = [ False ] * len(p)
+    lengths = [ ]
+    for x in xrange(len(p)):
+        if seen[x]:
+            continue # with next `x`
+        l = 0
+        while not seen[x]:
+            seen[x] = True
+            x = p[x]
+            l += 1
+        lengths.append(l)
+    return tuple(sorted(lengths, reverse=True))
+
+
+def centralizer_order(mu):
+    """Return the order of the centralizer of a permutation of cycle
+    type `mu`; the conjugacy class of that permutation has `n!`
+    divided by this many elements.
+
+    Examples::
+
+      >>> centralizer_order((1,1,1))
+      6
+      >>> centralizer_order((2,1,1))
+      4
+    """
+    result = 1
+    for (l, parts) in itertools.groupby(mu):
+        a = len(list(parts))
+        result *= (l ** a) * factorial(a)
+    return result
+
+
+def young_symmetrizer(la):
+    """Return the Young symmetrizer of partition `la`, as a list of
+    pairs `(p, c)`, where `p` is a permutation of `0..n-1` (given as
+    the tuple of images) and `c` is its integer coefficient.
+
+    The Young tableau used is the one filled row by row with `0`,
+    `1`, ..., `n-1`.  The symmetrizer is `sum(sgn(q) * q * p)` over
+    permutations `q` preserving the columns and `p` preserving the
+    rows of the tableau; up to a scalar, it is an idempotent of the
+    group algebra, whose image in any representation has dimension
+    equal to the multiplicity of the irreducible representation `la`.
+
+    Examples::
+
+      >>> young_symmetrizer((2,))
+      [((0, 1), 1), ((1, 0), 1)]
+      >>> young_symmetrizer((1,1))
+      [((0, 1), 1), ((1, 0), -1)]
+    """
+    n = sum(la)
+    rows = [ ]
+    start = 0
+    for l in la:
+        rows.append(range(start, start+l))
+        start += l
+    cols = [ [ row[j] for row in rows if j < len(row) ] for j in xrange(la[0]) ]
+
+    def subgroup(blocks):
+        # all permutations preserving each block
+        for images in itertools.product(*[ itertools.permutations(b) for b in blocks ]):
+            p = range(n)
+            for (block, image) in itertools.izip(blocks, images):
+                for (x, y) in itertools.izip(block, image):
+                    p[x] = y
+            yield p
+
+    result = [ ]
+    row_group = list(subgroup(rows))
+    for q in subgroup(cols):
+        s = Permutation(enumerate(q)).sign()
+        for p in row_group:
+            result.append((tuple(q[p[x]] for x in xrange(n)), s))
+    result.sort()
+    return result
+
+
 ## main: run tests
 
 if "__main__" == __name__:
@@ -0,0 +1,834 @@
+#! /usr/bin/env python
+#
+"""
+Estimate the size of the graph complex of `M_{g,n}`, and the time and
+memory needed to compute its homology, before starting the
+computation.
+
+Estimates are put together from:
+
+* the known sizes of the graph complexes of small `M_{g,n}`
+  (`KNOWN_SIZES`), and the known number of trivalent fatgraphs
+  (`fatghol.N.TRIVALENT_GRAPHS_COUNT`);
+* the trivalent graph lists found in checkpoint directories;
+* the statistics of previous runs, which `mgn` appends to file
+  ``M<g>,<n>-runs.json`` in the checkpoint directory (see
+  `record_run`);
+* candidate trivalent graphs generated from a random sample of the
+  parent graphs (see `sample_candidates`).
+
+Every estimate is a triple `(lo, mid, hi)`: a most likely value and
+a range the actual value is expected to fall into.  Ranges are
+computed by taking the extreme values of the ratios observed in the
+calibration data, so they get wider the further the target is from
+the families that have actually been computed.
+"""
+#
+#   Copyright (C) 2008-2012 Riccardo Murri <riccardo.murri@gmail.com>
+#   All rights reserved.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+__docformat__ = 'reStructuredText'
+
+
+import glob
+import json
+import logging
+import math
+import os
+import os.path
+import random
+import resource
+import socket
+import time
+
+from fatghol.combinatorics import factorial
+from fatghol.loadsave import FatgraphFile, open_graphs
+from fatghol.N import TRIVALENT_GRAPHS_COUNT, m_max, m_min
+from fatghol.runtime import runtime
+
+
+#: Sizes of the graph complexes of small `M_{g,n}`: for each number
+#: of edges `k` (starting with 1), item `k-1` of list `graphs` is the
+#: number of orientable fatgraphs with `k` edges, of list `dims` the
+#: dimension of the chain module they span (i.e., the number of
+#: orientable numbered fatgraphs), and of list `nnz` the number of
+#: non-zero entries in the boundary operator defined on that module.
+KNOWN_SIZES = {
+    (0,3): dict(graphs=[0, 1, 2],
+                dims=[0, 3, 4],
+                nnz=[0, 0, 6]),
+    (0,4): dict(graphs=[0, 0, 2, 6, 7, 6],
+                dims=[0, 0, 20, 99, 144, 64],
+                nnz=[0, 0, 0, 168, 444, 276]),
+    (0,5): dict(graphs=[0, 0, 0, 3, 21, 65, 103, 72, 26],
+                dims=[0, 0, 0, 210, 2112, 7260, 11280, 8160, 2240],
+                nnz=[0, 0, 0, 0, 3960, 24480, 52920, 48240, 15840]),
+    (1,1): dict(graphs=[0, 0, 1],
+                dims=[0, 0, 1],
+                nnz=[0, 0, 0]),
+    (1,2): dict(graphs=[0, 0, 2, 5, 8, 5],
+                dims=[0, 0, 3, 10, 15, 9],
+                nnz=[0, 0, 0, 10, 28, 23]),
+    (2,1): dict(graphs=[0, 0, 0, 3, 20, 39, 43, 28, 9],
+                dims=[0, 0, 0, 3, 20, 39, 43, 28, 9],
+                nnz=[0, 0, 0, 0, 33, 146, 217, 160, 48]),
+    }
+
+#: Number of parent graphs that `sample_candidates` picks, per pass.
+SAMPLE_SIZE = 20
+
+#: Parent graph families are only generated for sampling if their
+#: number of trivalent graphs is known to be at most this.
+SAMPLE_GENERATE_MAX = 50
+
+#: Ranges of ratios taken from calibration data are widened by this
+#: factor on each side, since few complexes are available to
+#: calibrate on.
+RATIO_SLACK = 1.25
+
+#: Range of the fraction of unique trivalent graphs among the
+#: candidates is widened by this factor on each side: leaving out
+#: one known family, its number of trivalent graphs is estimated
+#: within a factor of 3 from the others.
+TRIVALENT_SLACK = 3.0
+
+#: Stages of the computation that are timed in each run, and the
+#: total (over all edge numbers) of the complex size that each one is
+#: assumed to scale with.
+STAGES = [
+    ('graphs',   'dims', "generate graphs (Stage I)"),
+    ('boundary', 'nnz',  "compute boundary operators (Stage II)"),
+    ('ranks',    'nnz',  "compute ranks (Stage III)"),
+    ]
+
+
+## recording statistics of a run
+
+_run = { }
+
+
+def start_run(g, n):
+    """Start collecting statistics about a computation on `M_{g,n}`;
+    they are saved by `record_run`.
+    """
+    _run.clear()
+    _run.update(g=g, n=n, started=time.time(), stages=dict())
+    try:
+        checkpoint_dir = runtime.options.checkpoint_dir
+        restart = runtime.options.restart
+    except AttributeError:
+        checkpoint_dir = None
+        restart = False
+    # timings are not representative of a full computation if some
+    # of it was done by a previous run
+    _run['resumed'] = False
+    if restart and checkpoint_dir:
+        for pattern in ['M%d,%d-D*' % (g,n), 'M%d,%d-rkD*' % (g,n),
+                        'MgnGraphsIterator*', 'MgnTrivalentGraphsRecursiveGenerator%d,%d.*' % (g,n)]:
+            if len(glob.glob(os.path.join(checkpoint_dir, pattern))) > 0:
+                _run['resumed'] = True
+    _run['mark'] = (_run['started'], _cpu_time())
+
+
+def stage_done(stage):
+    """Record wall-clock time, CPU time and peak memory usage of
+    `stage` of the computation started by `start_run`; the stage is
+    taken to have started when the previous one was done.
+
+    Does nothing if no run has been started.
+    """
+    if 'mark' not in _run:
+        return
+    (wall0, cpu0) = _run['mark']
+    (wall, cpu) = (time.time(), _cpu_time())
+    _run['stages'][stage] = dict(wall=wall - wall0, cpu=cpu - cpu0,
+                                 maxrss=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    _run['mark'] = (wall, cpu)
+
+
+def note_complex(C):
+    """Record the number of graphs and the dimension of each chain
+    module of the graph complex `C`.
+
+    Does nothing if no run has been started.
+    """
+    if 'mark' not in _run:
+        return
+    _run['graphs'] = [ len(list(m.iterblocks())) for m in C.module ]
+    _run['dims'] = [ len(m) for m in C.module ]
+
+
+def note_boundary(D):
+    """Record the number of non-zero entries of each boundary
+    operator in the `DifferentialComplex` `D`.
+
+    Does nothing if no run has been started.
+    """
+    if 'mark' not in _run:
+        return
+    _run['nnz'] = [ A.nnz() for (A, ddim, cdim) in D ]
+
+
+def record_run(checkpoint_dir):
+    """Append the statistics collected since `start_run` to the run
+    history file in directory `checkpoint_dir`, and stop collecting.
+
+    The history file ``M<g>,<n>-runs.json`` has one line per run,
+    each holding a JSON dictionary.
+    """
+    if 'mark' not in _run or checkpoint_dir is None:
+        _run.clear()
+        return
+    record = dict(_run)
+    del record['mark']
+    record['host'] = socket.gethostname()
+    try:
+        record['jobs'] = runtime.options.jobs
+        record['rank_backend'] = runtime.options.rank_backend
+    except AttributeError:
+        pass
+    filename = history_file(checkpoint_dir, _run['g'], _run['n'])
+    try:
+        with open(filename, 'a') as history:
+            history.write(json.dumps(record, sort_keys=True) + '\n')
+    except IOError, error:
+        logging.warning("Could not record run statistics into file '%s': %s",
+                        filename, error)
+    _run.clear()
+
+
+def history_file(checkpoint_dir, g, n):
+    """Return the path name of the run history file of `M_{g,n}` in
+    directory `checkpoint_dir`.
+    """
+    return os.path.join(checkpoint_dir, "M%d,%d-runs.json" % (g,n))
+
+
+def _cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+## loading calibration data
+
+def load_history(dirs):
+    """Return the list of run records found in the run history files
+    in directories `dirs`; duplicate directories are only read once.
+    """
+    records = [ ]
+    seen = set()
+    for path in dirs:
+        path = os.path.realpath(path)
+        if path in seen:
+            continue # with next `path`
+        seen.add(path)
+        for filename in sorted(glob.glob(os.path.join(path, 'M*,*-runs.json'))):
+            with open(filename, 'r') as history:
+                for line in history:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        logging.warning("Ignoring malformed line in run history file '%s'",
+                                        filename)
+    return records
+
+
+def find_trivalent_counts(dirs, store=None, families=[]):
+    """Return a dictionary mapping `(g,n)` to the number of trivalent
+    fatgraphs of `M_{g,n}`, for each trivalent graph list found in
+    directories `dirs`, and for each `(g,n)` in `families` whose list
+    is found in the `SharedStore` `store`.
+    """
+    counts = dict()
+    if store is not None:
+        for (g, n) in families:
+            graphs = find_trivalent_graphs(g, n, [], store)
+            if graphs is not None:
+                counts[g,n] = len(graphs)
+                if isinstance(graphs, FatgraphFile):
+                    graphs.close()
+    for path in dirs:
+        for filename in glob.glob(os.path.join(path, 'MgnTrivalentGraphsRecursiveGenerator*.list')):
+            try:
+                (g, n) = [ int(x) for x in
+                           os.path.basename(filename)[len('MgnTrivalentGraphsRecursiveGenerator'):-len('.list')].split(',') ]
+                graphs = open_graphs(filename)
+            except (ValueError, IOError), error:
+                logging.debug("Ignoring graph list file '%s': %s", filename, error)
+                continue # with next `filename`
+            if graphs is not None:
+                counts[g,n] = len(graphs)
+                if isinstance(graphs, FatgraphFile):
+                    graphs.close()
+    return counts
+
+
+def find_trivalent_graphs(g, n, dirs, store=None):
+    """Return a sequence of the trivalent fatgraphs of `M_{g,n}`, read
+    from a graph list file in directories `dirs` or in the
+    `SharedStore` `store`; return `None` if there is no such file.
+    """
+    candidates = [ os.path.join(path, "MgnTrivalentGraphsRecursiveGenerator%d,%d.list" % (g,n))
+                   for path in dirs ]
+    if store is not None:
+        candidates.append(store.entry(('MgnTrivalentGraphsRecursiveGenerator', g, n, 4*g + 2*n - 4)))
+    for filename in candidates:
+        try:
+            graphs = open_graphs(filename)
+        except (ValueError, IOError), error:
+            logging.debug("Ignoring graph list file '%s': %s", filename, error)
+            continue # with next `filename`
+        if graphs is not None:
+            return graphs
+    return None
+
+
+## estimates
+
+def exact(x):
+    """Return the estimate of a known value `x`."""
+    return (x, x, x)
+
+
+def is_exact(r):
+    return (r[0] == r[2])
+
+
+def add(r1, r2):
+    """Return the estimate of the sum of two estimated values."""
+    return (r1[0] + r2[0], r1[1] + r2[1], r1[2] + r2[2])
+
+
+def mul(r1, r2):
+    """Return the estimate of the product of two estimated
+    (non-negative) values.
+    """
+    return (r1[0] * r2[0], r1[1] * r2[1], r1[2] * r2[2])
+
+
+def widen(r, factor):
+    """Return estimate `r` with its range widened by `factor` on
+    each side.
+
+    Examples::
+
+      >>> widen((2, 4, 8), 2)
+      (1, 4, 16)
+    """
+    return (r[0] / factor, r[1], r[2] * factor)
+
+
+def spread(values, mid=None):
+    """Return the estimate given by the range of `values`; the most
+    likely value is `mid`, or the last of `values` if `mid` is `None`.
+
+    Examples::
+
+      >>> spread([3, 1, 2])
+      (1, 2, 3)
+      >>> spread([3, 1, 2], mid=3)
+      (1, 3, 3)
+    """
+    if mid is None:
+        mid = values[-1]
+    return (min(values), mid, max(values))
+
+
+def _trivalent_parents(g, n):
+    """Return the list of triples `(g', n', c)`, such that trivalent
+    fatgraphs of `M_{g,n}` are generated from those of `M_{g',n'}`,
+    and `c` is the maximum number of candidates generated from each
+    of them (see `fatghol.N.N1`).
+    """
+    parents = [ ]
+    if _is_family(g, n-1):
+        m = m_max(g, n-1)
+        parents.append((g, n-1, 2*m + 4*m*m))
+    if _is_family(g-1, n+1):
+        m = m_max(g-1, n+1)
+        parents.append((g-1, n+1, 4*m*m))
+    return parents
+
+
+def _is_family(g, n):
+    """Return `True` if `M_{g,n}` has fatgraphs, i.e., `n>0` and
+    `2g+n>2`.
+    """
+    return (g >= 0 and n > 0 and 2*g + n > 2)
+
+
+def _ancestors(g, n):
+    """Return the set of pairs `(g',n')` such that trivalent fatgraphs
+    of `M_{g',n'}` are needed to generate those of `M_{g,n}`.
+
+    Examples::
+
+      >>> sorted(_ancestors(1, 2))
+      [(0, 3), (1, 1)]
+    """
+    result = set()
+    todo = [ (g_, n_) for (g_, n_, c) in _trivalent_parents(g, n) ]
+    while len(todo) > 0:
+        (g_, n_) = todo.pop()
+        if (g_, n_) not in result:
+            result.add((g_, n_))
+            todo.extend((g__, n__) for (g__, n__, c) in _trivalent_parents(g_, n_))
+    return result
+
+
+def _max_candidates(g, n, counts):
+    """Return the maximum number of candidate trivalent fatgraphs
+    generated for `M_{g,n}`, if the number of trivalent fatgraphs of
+    each parent family is given by `counts`; return `None` if the
+    count of some parent family is unknown.
+    """
+    result = 0
+    for (g_, n_, c) in _trivalent_parents(g, n):
+        if (g_, n_) not in counts:
+            return None
+        result += c * counts[g_, n_]
+    return result
+
+
+def estimate_trivalent(g, n, counts, cache=None):
+    """Return the estimate of the number of trivalent fatgraphs of
+    `M_{g,n}`, given the dictionary `counts` of the known ones.
+
+    The number of unique graphs is estimated as a fraction of the
+    maximum number of candidates generated from the parent families
+    (see `fatghol.N.N1`); the fraction is taken from the families of
+    the same genus (or of any genus, if there are none) for which
+    both the candidates and the unique graphs are known.
+
+    Examples::
+
+      >>> estimate_trivalent(1, 2, {(0,3):2, (1,1):1, (1,2):5})
+      (5, 5, 5)
+      >>> [ int(x) for x in estimate_trivalent(1, 3, {(0,3):2, (0,4):6, (0,5):26,
+      ...                                            (1,1):1, (1,2):5}) ]
+      [24, 72, 216]
+    """
+    if cache is None:
+        cache = dict()
+    if (g,n) in counts:
+        return exact(counts[g,n])
+    if (g,n) in cache:
+        return cache[g,n]
+    ratios = dict()
+    for ((g_, n_), u) in counts.iteritems():
+        c = _max_candidates(g_, n_, counts)
+        if c: # skip induction bases
+            ratios[g_, n_] = float(u) / c
+    same_genus = sorted((2*g_ + n_, r) for ((g_, n_), r) in ratios.iteritems() if g_ == g)
+    if len(same_genus) == 0:
+        same_genus = sorted((2*g_ + n_, r) for ((g_, n_), r) in ratios.iteritems())
+    fraction = widen(spread([ r for (size, r) in same_genus ]), TRIVALENT_SLACK)
+    result = (0, 0, 0)
+    for (g_, n_, c) in _trivalent_parents(g, n):
+        result = add(result, mul(exact(c), estimate_trivalent(g_, n_, counts, cache)))
+    result = mul(result, fraction)
+    # at least one trivalent graph exists
+    result = tuple(max(1, x) for x in result)
+    cache[g,n] = result
+    return result
+
+
+def _ratio_profile(sizes, numerator, denominator, first, scale=None):
+    """Return a list of the ratios `numerator[k]/denominator[k]`, for
+    each number of edges `k` from the largest down to the smallest
+    one, in the complex of given `sizes`; `denominator` may also be
+    a function of `k`.  Only ratios from the `first`-th onwards are
+    defined (the others are `None`).
+    """
+    lo = m_min(*sizes['gn'])
+    hi = m_max(*sizes['gn'])
+    result = [ ]
+    for (d, k) in enumerate(xrange(hi, lo-1, -1)):
+        if d < first:
+            result.append(None)
+            continue # with next `k`
+        den = denominator(k) if callable(denominator) else sizes[denominator][k-1 + first]
+        if den:
+            result.append(float(sizes[numerator][k-1]) / den)
+        else:
+            result.append(None)
+    return result
+
+
+def _interpolate(values, x):
+    """Return the linear interpolation of `values` at (fractional)
+    position `x`; `None` items are ignored.
+
+    Examples::
+
+      >>> _interpolate([1.0, 2.0, None], 0.5)
+      1.5
+      >>> _interpolate([None, 2.0, 4.0], 0.5)
+      2.0
+    """
+    points = [ (i, v) for (i, v) in enumerate(values) if v is not None ]
+    if len(points) == 0:
+        return None
+    if x <= points[0][0]:
+        return points[0][1]
+    for ((i0, v0), (i1, v1)) in zip(points[:-1], points[1:]):
+        if x <= i1:
+            return v0 + (v1 - v0) * (x - i0) / (i1 - i0)
+    return points[-1][1]
+
+
+def estimate_sizes(g, n, calibration, trivalent):
+    """Return a list of estimates of the number of graphs, the chain
+    module dimension and the number of non-zero entries in the
+    boundary operator, for each number of edges `k` in `M_{g,n}`
+    graphs, from the largest to the smallest one.
+
+    Each item in the returned list is a tuple `(k, graphs, dims,
+    nnz)`.  Argument `calibration` is a list of dictionaries holding
+    the sizes of known complexes, in the same format as the
+    `KNOWN_SIZES` values, plus key `gn` for the `(g,n)` pair, and
+    `trivalent` for the number of trivalent graphs if known.
+    Argument `trivalent` is the estimate of the number of trivalent
+    fatgraphs of `M_{g,n}`.
+
+    Moving down from the trivalent graphs, the ratio of the number of
+    graphs (chain module dimension, number of non-zero entries) of
+    consecutive edge numbers is taken from the calibration complexes
+    having the largest number of edge numbers, at the same relative
+    position in their range of edge numbers.
+
+    Examples::
+
+      >>> sizes = estimate_sizes(0, 4, [dict(KNOWN_SIZES[0,5], gn=(0,5), trivalent=26)], exact(6))
+      >>> (k, graphs, dims, nnz) = sizes[0]
+      >>> k, [ int(x) for x in dims ]
+      (6, [66, 103, 129])
+      >>> sizes[-1][3]
+      (0, 0, 0)
+
+    Sizes of calibration complexes are returned as they are::
+
+      >>> estimate_sizes(0, 4, [dict(KNOWN_SIZES[0,4], gn=(0,4))], None)[0]
+      (6, (6, 6, 6), (64, 64, 64), (276, 276, 276))
+    """
+    for sizes in calibration:
+        if sizes['gn'] == (g,n):
+            return [ (k, exact(sizes['graphs'][k-1]), exact(sizes['dims'][k-1]),
+                      exact(sizes['nnz'][k-1]))
+                     for k in xrange(m_max(g,n), m_min(g,n)-1, -1) ]
+    layers = m_max(g,n) - m_min(g,n) + 1
+    # prefer calibration complexes with as many edge numbers as the target
+    usable = sorted((m_max(*sizes['gn']) - m_min(*sizes['gn']) + 1,
+                     2*sizes['gn'][0] + sizes['gn'][1], i)
+                    for (i, sizes) in enumerate(calibration)
+                    if m_max(*sizes['gn']) - m_min(*sizes['gn']) >= 2)
+    usable = [ calibration[i] for (l, size, i) in usable[-3:] ]
+    nfact = factorial(n)
+    profiles = [ ]
+    for sizes in usable:
+        n_ = sizes['gn'][1]
+        profiles.append(dict(
+            layers = m_max(*sizes['gn']) - m_min(*sizes['gn']) + 1,
+            # orientable fraction of trivalent graphs
+            oriented = (float(sizes['graphs'][-1]) / sizes['trivalent']
+                        if sizes.get('trivalent') else None),
+            # ratio of graphs with `k-1` edges to those with `k`
+            graphs = _ratio_profile(sizes, 'graphs', 'graphs', 1),
+            # numbered graphs per graph, as a fraction of `n!`
+            dims = [ (x / factorial(n_) if x is not None else None)
+                     for x in _ratio_profile(sizes, 'dims', 'graphs', 0) ],
+            # non-zero entries per column, as a fraction of `k`
+            nnz = _ratio_profile(sizes, 'nnz', (lambda k, sizes=sizes: k * sizes['dims'][k-1]), 0),
+            ))
+    def ratio(name, d, default):
+        values = [ ]
+        for p in profiles:
+            if n == 1 and name == 'dims':
+                continue # with next profile
+            x = (_interpolate(p[name], float(d) * (p['layers'] - 1) / (layers - 1))
+                 if layers > 1 else p[name][0])
+            if x is not None:
+                values.append(x)
+        if len(values) == 0:
+            return default
+        return widen(spread(values), RATIO_SLACK)
+    oriented = widen(spread([ p['oriented'] for p in profiles if p['oriented'] is not None ]
+                            or [1.0]), RATIO_SLACK)
+    # not more orientable graphs than graphs
+    oriented = tuple(min(x, 1.0) for x in oriented)
+    result = [ ]
+    graphs = mul(trivalent, oriented)
+    for (d, k) in enumerate(xrange(m_max(g,n), m_min(g,n)-1, -1)):
+        if d > 0:
+            graphs = mul(graphs, ratio('graphs', d, exact(1.0)))
+        dims = mul(graphs, mul(exact(nfact), ratio('dims', d, exact(1.0))))
+        # a graph has at most `n!` distinct numberings
+        dims = tuple(min(x, y) for (x, y) in zip(dims, mul(graphs, exact(nfact))))
+        if d == layers - 1:
+            nnz = exact(0)
+        else:
+            nnz = mul(dims, mul(exact(k), ratio('nnz', d, exact(1.0))))
+        result.append((k, graphs, dims, nnz))
+    return result
+
+
+def fit(points, x):
+    """Return the estimate at `x` of a quantity following a power
+    law, i.e., `y = a * x**b`, fitted on `points`, a list of pairs
+    `(x_i, y_i)`; `x` is itself an estimate.  Return `None` if there
+    are no points.
+
+    The exponent `b` is computed by least squares on the logarithms;
+    the range covers twice the standard deviation of the residuals
+    (but at least a factor of 1.5 on each side).  With a single point,
+    or if all `x_i` are the same, `b` is assumed to be between 1 and
+    2.
+
+    Examples::
+
+      >>> [ round(y, 3) for y in fit([(10, 1.0)], exact(20)) ]
+      [2.0, 2.0, 4.0]
+      >>> [ round(y, 3) for y in fit([(10, 1.0), (100, 100.0)], exact(20)) ]
+      [2.667, 4.0, 6.0]
+    """
+    points = [ (math.log(px), math.log(py)) for (px, py) in points if px > 0 and py > 0 ]
+    if len(points) == 0:
+        return None
+    if len(set(px for (px, py) in points)) < 2:
+        (lx0, ly0) = max(points)
+        def at(lx):
+            return [ math.exp(ly0 + b * (lx - lx0)) for b in (1, 2) ]
+        lo = min(at(math.log(max(x[0], 1))))
+        hi = max(at(math.log(max(x[2], 1))))
+        return (lo, min(hi, max(lo, at(math.log(max(x[1], 1)))[0])), hi)
+    mx = sum(px for (px, py) in points) / len(points)
+    my = sum(py for (px, py) in points) / len(points)
+    b = (sum((px - mx) * (py - my) for (px, py) in points)
+         / sum((px - mx)**2 for (px, py) in points))
+    a = my - b*mx
+    sigma = math.sqrt(sum((py - a - b*px)**2 for (px, py) in points) / len(points))
+    width = max(2*sigma, math.log(1.5))
+    def at(lx):
+        return math.exp(a + b*lx)
+    return (at(math.log(max(x[0], 1))) / math.exp(width),
+            at(math.log(max(x[1], 1))),
+            at(math.log(max(x[2], 1))) * math.exp(width))
+
+
+def sample_candidates(g, n, dirs, store=None, size=SAMPLE_SIZE):
+    """Generate the candidate trivalent fatgraphs of `M_{g,n}` from a
+    random sample of `size` parent graphs per generation pass.
+
+    Return a tuple `(sampled, parents, candidates, valid, seconds)`:
+    the number of parent graphs sampled and in total, the estimate
+    of the total number of candidate graphs and of those having the
+    right genus and number of boundary cycles, and the estimated time
+    to generate them all.  Return `None` if the parent graph lists are
+    not available: they are looked up in directories `dirs` and in
+    the `SharedStore` `store`, or generated if they are known to be
+    small enough (see `SAMPLE_GENERATE_MAX`).
+    """
+    from fatghol.rg import MgnTrivalentGraphsRecursiveGenerator
+    passes = [ ]
+    for (g_, n_, c) in _trivalent_parents(g, n):
+        graphs = find_trivalent_graphs(g_, n_, dirs, store)
+        if graphs is None:
+            if (g_, n_) in [(0,3), (1,1)] \
+                   or TRIVALENT_GRAPHS_COUNT.get((g_, n_), SAMPLE_GENERATE_MAX+1) <= SAMPLE_GENERATE_MAX:
+                graphs = list(MgnTrivalentGraphsRecursiveGenerator(g_, n_))
+            else:
+                return None
+        if (g_, n_) == (g, n-1):
+            passes.append((graphs, _hang_circles))
+            passes.append((graphs, _bridges))
+        else:
+            passes.append((graphs, _bridges))
+    (sampled, parents, candidates, valid, seconds) = (0, 0, (0, 0, 0), (0, 0, 0), 0.0)
+    for (graphs, make) in passes:
+        total = len(graphs)
+        picks = random.sample(xrange(total), min(size, total))
+        counts = [ ]
+        started = time.time()
+        for i in picks:
+            G = graphs[i]
+            c = 0
+            v = 0
+            for K in make(G):
+                c += 1
+                if (K.genus, K.num_boundary_cycles) == (g,n):
+                    v += 1
+            counts.append((c, v))
+        elapsed = time.time() - started
+        k = len(picks)
+        sampled += k
+        parents += total
+        candidates = add(candidates, _extrapolate([ c for (c, v) in counts ], total))
+        valid = add(valid, _extrapolate([ v for (c, v) in counts ], total))
+        if k > 0:
+            seconds += elapsed * total / k
+    for (graphs, make) in passes:
+        if isinstance(graphs, FatgraphFile):
+            graphs.close()
+    return (sampled, parents, candidates, valid, seconds)
+
+
+def _hang_circles(G):
+    for x in G.edge_orbits():
+        yield G.hangcircle(x,0)
+        yield G.hangcircle(x,1)
+
+
+def _bridges(G):
+    for (x,y) in G.edge_pair_orbits():
+        yield G.bridge(x,0, y,0)
+        yield G.bridge(x,0, y,1)
+        yield G.bridge(x,1, y,0)
+        yield G.bridge(x,1, y,1)
+
+
+def _extrapolate(sample, total):
+    """Return the estimate of the sum of `total` values, given a
+    random `sample` of them; the range is twice the standard error
+    of the mean.
+
+    Examples::
+
+      >>> _extrapolate([1, 2, 3], 3)
+      (6, 6, 6)
+      >>> _extrapolate([2, 2], 10)
+      (20.0, 20.0, 20.0)
+    """
+    k = len(sample)
+    if k == total:
+        return exact(sum(sample))
+    mean = float(sum(sample)) / k
+    var = sum((x - mean)**2 for x in sample) / max(1, k-1)
+    # standard error, with finite population correction
+    err = 2 * math.sqrt(var / k * (total - k) / max(1, total - 1))
+    return (max(0.0, mean - err) * total, mean * total, (mean + err) * total)
+
+
+## the `estimate` action
+
+def estimate(g, n, dirs, store=None, outfile=None):
+    """Print estimates of the size of the graph complex of `M_{g,n}`
+    and of the resources needed to compute its homology to `outfile`.
+
+    Calibration data is read from the checkpoint directories `dirs`
+    and the `SharedStore` `store`, see the module documentation.
+    """
+    records = load_history(dirs)
+    counts = dict(TRIVALENT_GRAPHS_COUNT)
+    counts.update(find_trivalent_counts(dirs, store, _ancestors(g, n)))
+    calibration = [ dict(sizes, gn=gn, trivalent=counts.get(gn))
+                    for (gn, sizes) in KNOWN_SIZES.iteritems() ]
+    for record in records:
+        gn = (record['g'], record['n'])
+        if gn not in KNOWN_SIZES and 'nnz' in record and 'dims' in record \
+               and gn not in [ sizes['gn'] for sizes in calibration ]:
+            calibration.append(dict(gn=gn, graphs=record['graphs'], dims=record['dims'],
+                                    nnz=record['nnz'], trivalent=counts.get(gn)))
+
+    trivalent = estimate_trivalent(g, n, counts)
+    sample = sample_candidates(g, n, dirs, store)
+    if sample is not None:
+        # no more unique graphs than valid candidates
+        valid = sample[3]
+        trivalent = tuple(min(x, max(1, valid[2])) for x in trivalent)
+    sizes = estimate_sizes(g, n, calibration, trivalent)
+    totals = dict(graphs=(0, 0, 0), dims=(0, 0, 0), nnz=(0, 0, 0))
+    for (k, graphs, dims, nnz) in sizes:
+        totals['graphs'] = add(totals['graphs'], graphs)
+        totals['dims'] = add(totals['dims'], dims)
+        totals['nnz'] = add(totals['nnz'], nnz)
+
+    outfile.write("Estimates for M_{%d,%d}" % (g,n)
+                  + " (most likely value, followed by the expected range;"
+                  + " exact values are marked with `=`)\n\n")
+    outfile.write("Trivalent fatgraphs: %s\n" % _fmt(trivalent))
+    if sample is not None:
+        (sampled, parents, candidates, valid, seconds) = sample
+        outfile.write("Candidate trivalent fatgraphs: %s, of which %s of type (%d,%d)"
+                      " (from %d of %d parent graphs)\n"
+                      % (_fmt(candidates), _fmt(valid), g, n, sampled, parents))
+        outfile.write("Time to generate candidates: %s\n" % _fmt_seconds(exact(seconds)))
+    outfile.write("\n%5s  %-30s  %-30s  %-30s\n"
+                  % ("edges", "orientable graphs", "chain module dimension",
+                     "boundary operator nnz"))
+    for (k, graphs, dims, nnz) in sizes:
+        outfile.write("%5d  %-30s  %-30s  %-30s\n" % (k, _fmt(graphs), _fmt(dims), _fmt(nnz)))
+    outfile.write("%5s  %-30s  %-30s  %-30s\n\n"
+                  % ("total", _fmt(totals['graphs']), _fmt(totals['dims']), _fmt(totals['nnz'])))
+
+    # resources needed, from the history of complete runs
+    complete = [ r for r in records
+                 if not r.get('resumed') and 'dims' in r and 'nnz' in r ]
+    for (stage, measure, title) in STAGES:
+        points = [ (sum(r[measure]), r['stages'][stage]['wall'])
+                   for r in complete if stage in r['stages'] ]
+        outfile.write("Wall-clock time to %s: %s\n"
+                      % (title, _fmt_seconds(fit(points, totals[measure]))))
+    points = [ (sum(r['nnz']), max(s['maxrss'] for s in r['stages'].values()))
+               for r in complete if len(r['stages']) > 0 ]
+    outfile.write("Peak memory usage: %s\n" % _fmt_kbytes(fit(points, totals['nnz'])))
+    outfile.write("(from %d complete runs in the run history)\n" % len(complete))
+
+
+def _fmt(r):
+    """Format estimate `r` for printing.
+
+    Examples::
+
+      >>> _fmt((5, 5, 5))
+      '=5'
+      >>> _fmt((1.5, 2.5, 40000.0))
+      '3 (1..4e+04)'
+    """
+    if is_exact(r):
+        return ('=%d' % r[0])
+    return ('%.3g (%.3g..%.3g)' % (round(r[1]), math.floor(r[0]), math.ceil(r[2])))
+
+
+def _fmt_seconds(r):
+    if r is None:
+        return "unknown (no run history)"
+    def fmt(s):
+        for (unit, length) in [('d', 86400), ('h', 3600), ('m', 60)]:
+            if s >= length:
+                return "%.1f%s" % (s / length, unit)
+        return "%.1fs" % s
+    if is_exact(r):
+        return fmt(r[0])
+    return ("%s (%s..%s)" % (fmt(r[1]), fmt(r[0]), fmt(r[2])))
+
+
+def _fmt_kbytes(r):
+    if r is None:
+        return "unknown (no run history)"
+    def fmt(kb):
+        for (unit, size) in [('GB', 1024*1024), ('MB', 1024)]:
+            if kb >= size:
+                return "%.1f%s" % (kb / size, unit)
+        return "%.0fkB" % kb
+    return ("%s (%s..%s)" % (fmt(r[1]), fmt(r[0]), fmt(r[2])))
+
+
+## main: run tests
+
+if "__main__" == __name__:
+    import doctest
+    doctest.testmod(name="estimate",
+                    optionflags=doctest.NORMALIZE_WHITESPACE|doctest.ELLIPSIS)
@@ -6,7 +6,9 @@ from rg import Fatgraph
 
 cdef class MgnChainComplex(ChainComplex):
     cdef readonly Fraction orbifold_euler_characteristics
-    cpdef DifferentialComplex compute_boundary_operators(MgnChainComplex self)
+    cpdef DifferentialComplex compute_boundary_operators(MgnChainComplex self, bint discard=*)
+    cdef _discard(MgnChainComplex self, int i)
+    cpdef dict compute_isotypic_boundary_operators(MgnChainComplex self, DifferentialComplex D, int n)
 
 
 cdef class NumberedFatgraph(Fatgraph):
@@ -27,6 +29,13 @@ cdef class NumberedFatgraphPool(object):
     cdef _push_fwd(f, g1, g2)
     cdef tuple _compute_nb_map(pb_map, NumberedFatgraphPool src, NumberedFatgraphPool dst)
     cdef _index(self, list numbering)
+    cpdef dict _numbering_table(self)
+
+
+cdef class _Echelon(object):
+    cdef public dict rows
+    cdef public int rank
+    cpdef bint add(self, dict v)
 
 
 cpdef MgnChainComplex FatgraphComplex(int g, int n)
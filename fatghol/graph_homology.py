@@ -25,7 +25,8 @@ __docformat__ = 'reStructuredText'
 
 ## stdlib imports
 
-from fractions import Fraction
+from array import array
+from fractions import Fraction, gcd
 import itertools
 import logging
 import os
@@ -36,11 +37,17 @@ import types
 from fatghol.aggregate import AggregateList
 from fatghol.combinatorics import (
     bernoulli,
+    centralizer_order,
+    character,
+    cycle_type,
     factorial,
     minus_one_exp,
+    PartitionIterator,
     Permutation,
+    young_symmetrizer,
     )
 from fatghol.cache import (
+    clear_caches,
     ocache_contract,
     ocache_isomorphisms,
     Caching,
@@ -48,9 +55,13 @@ from fatghol.cache import (
 from fatghol.homology import (
     ChainComplex,
     DifferentialComplex,
-    NullMatrix,
+    LazyMatrix,
+    null_matrix,
     )
 from fatghol.iterators import IndexedIterator
+from fatghol.loadsave import checkpoint_writer
+import fatghol.memory as memory
+from fatghol.progress import Progress
 from fatghol.rg import (
     Fatgraph,
     Isomorphism,
@@ -60,7 +71,6 @@ from fatghol.rg import (
     BoundaryCycle,
     )
 from fatghol.runtime import runtime
-from fatghol.simplematrix import SimpleMatrix
 import fatghol.timing as timing
 
 
@@ -76,67 +86,451 @@ class MgnChainComplex(ChainComplex):
             self.module[i] = AggregateList()
 
     #@cython.ccall(DifferentialComplex))
-    #@cython.locals(m=list, D=DifferentialComplex,
+    #@cython.locals(discard=cython.bint, m=list, D=DifferentialComplex,
     #               i=cython.int, p=cython.int, q=cython.int,
     #               j0=cython.int, k0=cython.int, s=cython.int,
     #               j=cython.int, k=cython.int, edgeno=cython.int)
     #               #pool1=NumberedFatgraphPool, pool2=NumberedFatgraphPool)
-    def compute_boundary_operators(self):
+    def compute_boundary_operators(self, discard=False):
+        """Return the `DifferentialComplex` of the matrix form of the
+        boundary operators.
+
+        If a checkpoint directory is set, each matrix `D[i]` is saved
+        into a file as soon as it has been computed, and it is only
+        kept in the returned complex as a `LazyMatrix` handle, so that
+        at most one matrix is held in memory at any time.
+
+        If `discard` is `True`, the graph pools of `C[i-1]` are
+        dropped (together with the caches of their graphs) as soon as
+        `D[i]` has been computed, since no other matrix needs them:
+        `self.module[i-1]` is then replaced by `None`.
+        """
         #: Matrix form of boundary operators; the `i`-th differential
         #: `D[i]` is `dim C[i-1]` rows (range) by `dim C[i]` columns
         #: (domain).
+        from fatghol.simplematrix import SimpleMatrix
         m = self.module # micro-optimization
+        checks = runtime.checks # micro-optimization
         D = DifferentialComplex()
-        D.append(NullMatrix, 0, len(m[0]))
+        D.append(null_matrix(), 0, len(m[0]))
         for i in xrange(1, len(self)):
             timing.start("D[%d]" % i)
             p = len(m[i-1]) # == dim C[i-1]
             q = len(m[i])   # == dim C[i]
             try:
                 checkpoint = os.path.join(runtime.options.checkpoint_dir,
-                                          ('M%d,%d-D%d.sms' % (runtime.g, runtime.n, i)))
+                                          ('M%d,%d-D%d.csr' % (runtime.g, runtime.n, i)))
             except AttributeError:
                 checkpoint = None
-            # maybe load `D[i]` from persistent storage
+            # maybe load `D[i]` from persistent storage; checkpoints
+            # saved in the older SMS text format are still accepted
             if checkpoint and p>0 and q>0 and runtime.options.restart:
-                d = SimpleMatrix(p, q)
-                if d.load(checkpoint):
-                    D.append(d, p, q)
+                # the file may still be being written in the background
+                checkpoint_writer.wait(checkpoint)
+                loaded = False
+                for filename in [checkpoint, checkpoint[:-len('.csr')] + '.sms']:
+                    d = SimpleMatrix(p, q)
+                    if d.load(filename):
+                        loaded = True
+                        break
+                if loaded:
+                    # the file has been checked, it will be read again
+                    # when the matrix is needed
+                    D.append(LazyMatrix(filename, p, q, d.nnz()), p, q)
+                    del d
                     logging.info("  Loaded %dx%d matrix D[%d] from file '%s'",
-                                 p, q, i, checkpoint)
+                                 p, q, i, filename)
+                    if discard:
+                        self._discard(i-1)
+                    if memory.enabled:
+                        memory.census("D[%d]" % i)
                     continue # with next `i`
             # compute `D[i]`
             d = SimpleMatrix(p, q)
+            progress = Progress("D[%d], columns assembled" % i, q)
             j0 = 0
             for pool1 in m[i].iterblocks():
+                progress.update(j0)
+                if memory.max_memory is not None:
+                    memory.check_budget("D[%d]" % i)
+                # collect entries in a column block, and add them to
+                # `d` all at once
+                rows = array('i')
+                cols = array('i')
+                values = array('i')
                 k0 = 0
                 for pool2 in m[i-1].iterblocks():
                     for edgeno in xrange(pool1.graph.num_edges):
                         if pool1.graph.is_loop(edgeno):
                             continue # with next `edgeno`
                         for (j, k, s) in NumberedFatgraphPool.facets(pool1, edgeno, pool2):
-                            assert k < len(pool2)
-                            assert j < len(pool1)
-                            assert k+k0 < p
-                            assert j+j0 < q
-                            d.addToEntry(k+k0, j+j0, s)
+                            if checks:
+                                assert k < len(pool2)
+                                assert j < len(pool1)
+                                assert k+k0 < p
+                                assert j+j0 < q
+                            rows.append(k+k0)
+                            cols.append(j+j0)
+                            values.append(s)
                     k0 += len(pool2)
+                d.addToEntries(rows, cols, values)
                     # # `pool2` will never be used again, so clear it from the cache.
                     # # XXX: using implementation detail!
                     # pool2.graph._cache_isomorphisms.clear()
                 j0 += len(pool1)
                 # `pool1` will never be used again, so clear it from the cache.
                 # XXX: using implementation detail!
-                pool1.graph._cache_isomorphisms.clear()
+                try:
+                    pool1.graph._cache_isomorphisms.clear()
+                except AttributeError:
+                    # cache already dropped (see `memory.check_budget`)
+                    pass
             timing.stop("D[%d]" % i)
             if checkpoint:
-                d.save(checkpoint)
-            D.append(d, p, q)
+                # the matrix is written in the background, and read
+                # back from the file when it is needed again
+                checkpoint_writer.submit(checkpoint, _save_boundary_operator, d, checkpoint)
+                D.append(LazyMatrix(checkpoint, p, q, d.nnz()), p, q)
+            else:
+                D.append(d, p, q)
+            del d
             logging.info("  Computed %dx%d matrix D[%d] (elapsed: %.3fs)", 
                          p, q, i, timing.get("D[%d]" % i))
+            if memory.over_budget():
+                _spill(D)
+            if discard:
+                self._discard(i-1)
+            if memory.enabled:
+                memory.census("D[%d]" % i)
         return D
 
 
+    #@cython.locals(i=cython.int)
+    #@cython.cfunc
+    def _discard(self, i):
+        """Drop the graph pools of `C[i]`, and the caches of their graphs."""
+        for pool in self.module[i].iterblocks():
+            clear_caches(pool.graph)
+        self.module[i] = None
+
+
+    #@cython.locals(D=DifferentialComplex, n=cython.int, L=cython.int,
+    #               partitions=list, symmetrizers=dict, dims=dict,
+    #               bases=dict, pivots=dict, result=dict,
+    #               i=cython.int, j=cython.int, j0=cython.int, k=cython.int,
+    #               u=cython.int, s=cython.int, scale=cython.long,
+    #               #pool=NumberedFatgraphPool,
+    #               table=dict, traces=dict, mult=Fraction,
+    #               M=object)
+    #@cython.ccall(dict)
+    def compute_isotypic_boundary_operators(self, D, n):
+        """Split the boundary operators `D` into blocks, one for each
+        irreducible representation of the symmetric group `S_n`.
+
+        The symmetric group `S_n` acts on the graphs in each
+        `NumberedFatgraphPool` by permuting the boundary cycle
+        numbers, and the boundary operators commute with this action.
+        For each partition `la` of `n`, the image of the Young
+        symmetrizer of `la` (see `combinatorics.young_symmetrizer`) is
+        a sub-complex, whose dimension in each degree is the
+        multiplicity of the irreducible representation `la` in the
+        chain module; these dimensions are computed from the
+        character of the action on each pool, and a basis of each
+        image is made of symmetrized graphs.
+
+        Return a dictionary, mapping each partition `la` to the
+        `DifferentialComplex` of the boundary operators restricted to
+        the image of the Young symmetrizer of `la`.  The homology of
+        this complex is the multiplicity space of `la` in the homology
+        of `D`, so the homology rank of `D` is the sum, over all
+        partitions `la`, of the dimension of `la` times the homology
+        rank of the corresponding complex.
+        """
+        L = len(self)
+        m = self.module
+        partitions = list(PartitionIterator(n, n))
+        symmetrizers = dict((la, young_symmetrizer(la)) for la in partitions)
+        dims = dict((la, character(la, (1,)*n)) for la in partitions)
+        # one representative permutation for each conjugacy class
+        classes = [ ]
+        for mu in partitions:
+            sigma = [ ]
+            for l in mu:
+                start = len(sigma)
+                sigma.extend(range(start+1, start+l) + [start])
+            classes.append((mu, sigma))
+        # relabeling boundary cycles also permutes the coordinates of
+        # the simplex of boundary lengths, so the action on the graph
+        # complex is twisted by the sign of the permutation w.r.t. the
+        # action on the homology of `M_{g,n}`; compensate for that
+        sign = dict((tuple(sigma), minus_one_exp(n - len(cycle_type(sigma))))
+                    for sigma in itertools.permutations(range(n)))
+
+        #: `bases[la][i]` is the list of basis vectors of the image of
+        #: the Young symmetrizer of `la` in `C[i]`, in reduced echelon
+        #: form; each vector is a list of pairs `(index, coefficient)`
+        #: and `pivots[la][i]` maps the pivot index of each vector to
+        #: its position in `bases[la][i]`
+        bases = dict((la, [ [ ] for i in xrange(L) ]) for la in partitions)
+        pivots = dict((la, [ dict() for i in xrange(L) ]) for la in partitions)
+        for i in xrange(L):
+            j0 = 0
+            for pool in m[i].iterblocks():
+                table = pool._numbering_table()
+                numberings = [ tuple(nb) for nb in pool.numberings ]
+                def act(sigma, j):
+                    return table[tuple(sigma[x] for x in numberings[j])]
+                # character of the `S_n` action on the pool
+                traces = dict()
+                for (mu, sigma) in classes:
+                    traces[mu] = 0
+                    for j in xrange(len(pool)):
+                        (k, s) = act(sigma, j)
+                        if k == j:
+                            traces[mu] += s * sign[tuple(sigma)]
+                total = 0
+                for la in partitions:
+                    mult = sum(Fraction(character(la, mu) * traces[mu], centralizer_order(mu))
+                               for mu in partitions)
+                    assert mult.denominator == 1 and mult >= 0, \
+                           "Non-integral multiplicity %s of representation %s in %s" \
+                           % (mult, la, pool)
+                    total += dims[la] * mult
+                    if mult == 0:
+                        continue # with next `la`
+                    # pick `mult` linearly independent symmetrized graphs
+                    echelon = _Echelon()
+                    for j in xrange(len(pool)):
+                        v = dict()
+                        for (tau, c) in symmetrizers[la]:
+                            (k, s) = act(tau, j)
+                            v[k] = v.get(k, 0) + c * s * sign[tau]
+                        echelon.add(v)
+                        if echelon.rank == mult:
+                            break
+                    assert echelon.rank == mult, \
+                           "Found only %d out of %d independent vectors for representation %s in %s" \
+                           % (echelon.rank, mult, la, pool)
+                    for (q, row) in sorted(echelon.rows.iteritems()):
+                        pivots[la][i][j0+q] = len(bases[la][i])
+                        bases[la][i].append([ (j0+k, c) for (k, c) in row.iteritems() ])
+                assert total == len(pool), \
+                       "Dimensions of isotypic components of %s sum to %d instead of %d" \
+                       % (pool, total, len(pool))
+                j0 += len(pool)
+        for la in partitions:
+            logging.info("  Isotypic component %s: dimensions %s",
+                         _partition_str(la), [ len(b) for b in bases[la] ])
+
+        result = dict()
+        for la in partitions:
+            result[la] = DifferentialComplex()
+            result[la].rank_checkpoint_format = ("M%%d,%%d-S%s-rkD%%d.txt" % _partition_str(la))
+            result[la].append(null_matrix(), 0, len(bases[la][0]))
+        for i in xrange(1, L):
+            A = D[i][0]
+            #: non-zero entries of `D[i]`, by column
+            dcols = dict()
+            if A.num_rows > 0 and A.num_columns > 0:
+                for (k, j, c) in itertools.izip(*D.matrix(i).entries()):
+                    dcols.setdefault(j, []).append((k, c))
+                D.release(i)
+            for la in partitions:
+                # since the basis of `C[i-1]` is in reduced echelon
+                # form, the coordinates of a vector in its span are
+                # the vector components at the pivot indices; all
+                # basis vectors of `C[i]` are scaled by the same
+                # factor to get integer coefficients, which does not
+                # affect the composition `D[i-1]*D[i]`
+                scale = 1
+                for b in bases[la][i]:
+                    for (j, c) in b:
+                        scale = _lcm(scale, c.denominator)
+                rows = array('i')
+                cols = array('i')
+                # entries are multiplied by `scale`, so they may not
+                # fit in a C `int`; see `_isotypic_matrix`
+                values = [ ]
+                for (u, b) in enumerate(bases[la][i]):
+                    y = dict()
+                    for (j, c) in b:
+                        for (k, d) in dcols.get(j, ()):
+                            if k in pivots[la][i-1]:
+                                y[k] = y.get(k, 0) + c*d
+                    for (k, c) in y.iteritems():
+                        if c != 0:
+                            c *= scale
+                            assert c.denominator == 1
+                            rows.append(pivots[la][i-1][k])
+                            cols.append(u)
+                            values.append(int(c))
+                M = _isotypic_matrix(len(bases[la][i-1]), len(bases[la][i]),
+                                     rows, cols, values,
+                                     ('M%d,%d-S%s-D%d.sms'
+                                      % (runtime.g, runtime.n, _partition_str(la), i)))
+                result[la].append(M, len(bases[la][i-1]), len(bases[la][i]))
+        return result
+
+
+#@cython.locals(num_rows=cython.int, num_columns=cython.int,
+#               rows=object, cols=object, values=list, name=str, filename=str)
+def _isotypic_matrix(num_rows, num_columns, rows, cols, values, name):
+    """Return a matrix with the given dimensions and entries.
+
+    If all `values` fit in a C `int`, return a `SimpleMatrix`.
+    Otherwise, they cannot be inserted into a `SimpleMatrix`, but
+    SMS files are read with integers of any size: the entries are
+    written into scratch file `name` (see `memory.spill_file`), in
+    SMS format, and a `LazyMatrix` handle to it is returned.
+
+    Examples::
+
+      >>> M = _isotypic_matrix(2, 2, array('i', [0, 1]), array('i', [0, 1]),
+      ...                      [1, 2], 'small.sms')
+      >>> isinstance(M, LazyMatrix)
+      False
+      >>> M = _isotypic_matrix(2, 2, array('i', [0, 1]), array('i', [0, 1]),
+      ...                      [1, 2**40], 'large.sms')
+      >>> isinstance(M, LazyMatrix)
+      True
+      >>> M.get().rank()
+      2
+    """
+    try:
+        values = array('i', values)
+    except OverflowError:
+        filename = memory.spill_file(name)
+        with open(filename, 'w') as sms:
+            sms.write("%d %d M\n" % (num_rows, num_columns))
+            for (r, c, v) in itertools.izip(rows, cols, values):
+                sms.write("%d %d %d\n" % (r+1, c+1, v))
+            sms.write("0 0 0\n")
+        logging.info("  Entries of %dx%d matrix exceed the C `int` range;"
+                     " saved it in SMS format into file '%s'",
+                     num_rows, num_columns, filename)
+        return LazyMatrix(filename, num_rows, num_columns, len(values))
+    from fatghol.simplematrix import SimpleMatrix
+    M = SimpleMatrix(num_rows, num_columns)
+    M.addToEntries(rows, cols, values)
+    return M
+
+
+#@cython.locals(D=DifferentialComplex, k=cython.int)
+def _spill(D):
+    """Write the matrices of `D` that are held in memory into scratch
+    files (see `memory.spill_file`), and replace them with
+    `LazyMatrix` handles.
+    """
+    for k in xrange(1, len(D)):
+        (A, p, q) = D[k]
+        if isinstance(A, LazyMatrix) or p == 0 or q == 0:
+            continue # with next `k`
+        filename = memory.spill_file('M%d,%d-D%d.csr' % (runtime.g, runtime.n, k))
+        checkpoint_writer.submit(filename, _save_boundary_operator, A, filename)
+        D[k] = (LazyMatrix(filename, p, q, A.nnz()), p, q)
+        logging.info("  Moved %dx%d matrix D[%d] out of memory, into file '%s'",
+                     p, q, k, filename)
+
+
+def _save_boundary_operator(d, checkpoint):
+    """Save matrix `d` into file `checkpoint`, in the binary format;
+    if its entries are too large for it, use the SMS format instead,
+    in the file with the same name and extension ``.sms``.
+
+    Return the name of the file written.
+    """
+    try:
+        d.saveBinary(checkpoint)
+        return checkpoint
+    except OverflowError:
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        filename = checkpoint[:-len('.csr')] + '.sms'
+        d.save(filename)
+        return filename
+
+
+def _partition_str(la):
+    """Return a compact string representation of partition `la`."""
+    return str.join(",", [ str(x) for x in la ])
+
+
+def _lcm(a, b):
+    """Return the least common multiple of integers `a` and `b`."""
+    return a * b // gcd(a, b)
+
+
+#@cython.cclass
+class _Echelon(object):
+    """Incrementally build a basis in reduced row echelon form of the
+    span of a sequence of sparse vectors with rational coefficients.
+
+    Attribute `rows` maps the pivot index of each basis vector to the
+    vector itself, as a dictionary mapping indices to (non-zero)
+    `Fraction` coefficients; the coefficient at the pivot index is 1,
+    and all basis vectors vanish at the pivot indices of the others.
+
+    Examples::
+
+      >>> e = _Echelon()
+      >>> e.add({0:2, 1:2})
+      True
+      >>> e.add({0:1, 1:1})
+      False
+      >>> e.add({1:1, 2:1})
+      True
+      >>> e.rank
+      2
+      >>> for q in sorted(e.rows):
+      ...   print q, [ (k, str(c)) for (k, c) in sorted(e.rows[q].items()) ]
+      0 [(0, '1'), (2, '-1')]
+      1 [(1, '1'), (2, '1')]
+    """
+
+    def __init__(self):
+        self.rows = dict()
+        self.rank = 0
+
+    #@cython.locals(v=dict, w=dict, q=cython.int, k=cython.int)
+    #@cython.ccall(cython.bint)
+    def add(self, v):
+        """Add vector `v` (a dictionary mapping indices to integer or
+        `Fraction` coefficients) to the basis and return `True`, if
+        it is linearly independent of the vectors added so far; else
+        return `False`.
+        """
+        w = dict((k, Fraction(c)) for (k, c) in v.iteritems() if c != 0)
+        for (q, row) in self.rows.iteritems():
+            c = w.get(q, 0)
+            if c != 0:
+                _axpy(w, -c, row)
+        if len(w) == 0:
+            return False
+        q = min(w)
+        c = w[q]
+        w = dict((k, x / c) for (k, x) in w.iteritems())
+        # keep the basis reduced
+        for row in self.rows.itervalues():
+            c = row.get(q, 0)
+            if c != 0:
+                _axpy(row, -c, w)
+        self.rows[q] = w
+        self.rank += 1
+        return True
+
+
+def _axpy(y, a, x):
+    """Add `a*x` to `y` in place; `x` and `y` are sparse vectors,
+    represented as dictionaries mapping indices to coefficients.
+    """
+    for (k, c) in x.iteritems():
+        z = y.get(k, 0) + a*c
+        if z != 0:
+            y[k] = z
+        else:
+            del y[k]
+
+
 
 #@cython.cclass
 class NumberedFatgraph(Fatgraph):
@@ -270,7 +664,7 @@ class NumberedFatgraph(Fatgraph):
         self.underlying = underlying
         assert len(numbering) == self.num_boundary_cycles
         self.numbering = dict(numbering)
-        if __debug__:
+        if runtime.checks:
             count = [ 0 for x in xrange(self.num_boundary_cycles) ]
             for (bcy,n) in self.numbering.iteritems():
                 assert type(n) is types.IntType, \
@@ -613,6 +1007,8 @@ class NumberedFatgraphPool(object):
         assert not self.graph.is_loop(edge)
         assert self.is_orientable
         assert other.is_orientable
+        if timing.enabled:
+            timing.count('facets')
         
         g0 = self.graph
         g1 = g0.contract(edge)
@@ -686,6 +1082,31 @@ class NumberedFatgraphPool(object):
                 * minus_one_exp(g0.edge_numbering[edge])
             yield (j, k, s)
 
+    #@cython.locals(table=dict, n=cython.int, j=cython.int, t=cython.int,
+    #               s=cython.int, p=Permutation, nb=list, x=list)
+    #@cython.ccall(dict)
+    def _numbering_table(self):
+        """Return a dictionary mapping every numbering of the
+        boundary cycles (as a tuple) to a pair `(j, s)`, where `j` is
+        the index of the equivalent numbering in `self.numberings`
+        and `s` is the orientation sign of the graph automorphism
+        relating the two; this agrees with `_index`, but answers in
+        constant time.
+        """
+        table = dict()
+        n = len(self.graph.boundary_cycles)
+        for (p, a) in itertools.izip(self.P, self.A):
+            s = a.compare_orientations()
+            for (j, nb) in enumerate(self.numberings):
+                # find `x` such that `p.rearranged(x) == nb`
+                x = [ None ] * n
+                for t in xrange(n):
+                    x[p[t]] = nb[t]
+                x = tuple(x)
+                if x not in table:
+                    table[x] = (j, s)
+        return table
+
     #@cython.cfunc
     #@cython.locals(numbering=Permutation,
     #               i=cython.int, j=cython.int, p=Permutation)
@@ -4,10 +4,26 @@ cdef class VectorSpace(object):
     cdef readonly int dimension
     cpdef dict coordinates(self, list combo)
 
+cdef class LazyMatrix(object):
+    cdef readonly str filename
+    cdef readonly int num_rows
+    cdef readonly int num_columns
+    cdef object _nnz
+    cdef object _matrix
+    cpdef get(self)
+    cpdef bint is_loaded(self)
+    cpdef long nnz(self)
+    cpdef release(self)
+
 cdef class DifferentialComplex(list):
+    cdef public str rank_checkpoint_format
     # FIXME: `bd` should be of `SimpleMatrix` type
     cpdef append(self, bd, int ddim, int cdim)
-    cpdef compute_homology_ranks(self)
+    cpdef matrix(self, int i)
+    cpdef release(self, int i)
+    cpdef bint check_complex(self, bint exact=*)
+    cpdef morse_reduce(self, int max_fill=*)
+    cpdef compute_homology_ranks(self, dict known=*)
 
 cdef class ChainComplex(object):
     cdef readonly int length
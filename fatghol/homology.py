@@ -26,22 +26,53 @@ __docformat__ = 'reStructuredText'
 
 ## stdlib imports
 
+from array import array
 from collections import defaultdict
+import itertools
 import logging
 import os.path
 import numbers
+import Queue
+import random
+import threading
+import time
 
 ## application-local imports
 
-from fatghol.loadsave import load, save
+from fatghol.loadsave import checkpoint_writer, load, load_matrix, save
+import fatghol.memory as memory
 from fatghol.runtime import runtime
-from fatghol.simplematrix import SimpleMatrix, is_null_product
-import fatghol.timing as timing
+# the `fatghol.simplematrix` extension module (and the libraries it
+# links to) takes a noticeable time to load, so it is only imported
+# by the functions that actually build or operate on matrices
 
 
 ## main
 
-NullMatrix = SimpleMatrix(0,0)
+_null_matrix = None
+
+def null_matrix():
+    """Return a `SimpleMatrix` instance with 0 rows and 0 columns.
+
+    The same instance is returned by all calls::
+
+      >>> null_matrix() is null_matrix()
+      True
+    """
+    global _null_matrix
+    if _null_matrix is None:
+        from fatghol.simplematrix import SimpleMatrix
+        _null_matrix = SimpleMatrix(0,0)
+    return _null_matrix
+
+#: Largest fill-in (number of new non-zero entries) that a single
+#: step of `DifferentialComplex.morse_reduce` may cause by default.
+MORSE_MAX_FILL = 64
+
+#: Rough estimate of the memory (in bytes) taken by each non-zero entry
+#: of a matrix during the rank computation, including fill-in; only
+#: used for scheduling concurrent rank computations.
+RANK_MEMORY_PER_ENTRY = 64
 
 
 #@cython.cclass
@@ -104,6 +135,101 @@ class VectorSpace(object):
 
 
 
+#@cython.cclass
+class LazyMatrix(object):
+    """A matrix stored in a file, which is only held in memory while
+    it is being used.
+
+    Attributes `num_rows` and `num_columns` (and, if it was given to
+    the constructor, the number of non-zero entries returned by
+    `nnz`) are available without loading the matrix.  Method `get`
+    returns the `SimpleMatrix` instance, loading it from the file if
+    needed; method `release` frees the memory it takes, until the
+    next call to `get`.
+
+    Examples::
+
+      >>> import tempfile
+      >>> from fatghol.simplematrix import SimpleMatrix
+      >>> (fd, path) = tempfile.mkstemp(suffix='.csr'); os.close(fd)
+      >>> A = SimpleMatrix(2, 3)
+      >>> A.addToEntry(0, 1, 1)
+      >>> A.saveBinary(path)
+      >>> L = LazyMatrix(path, 2, 3, A.nnz())
+      >>> L.is_loaded()
+      False
+      >>> L.nnz()
+      1
+      >>> L.get().rank()
+      1
+      >>> L.is_loaded()
+      True
+      >>> L.release()
+      >>> L.is_loaded()
+      False
+      >>> os.remove(path)
+    """
+
+    #@cython.locals(filename=str, num_rows=cython.int, num_columns=cython.int)
+    def __init__(self, filename, num_rows, num_columns, nnz=None):
+        self.filename = filename
+        self.num_rows = num_rows
+        self.num_columns = num_columns
+        self._nnz = nnz
+        self._matrix = None
+
+    def __repr__(self):
+        return ("LazyMatrix(%r, %d, %d)"
+                % (self.filename, self.num_rows, self.num_columns))
+
+    #@cython.ccall
+    def get(self):
+        """Return the `SimpleMatrix` instance, loading it from file
+        if it is not already in memory.
+
+        Raise `IOError` if the file cannot be loaded.
+        """
+        if self._matrix is None:
+            # the file may still be being written in the background,
+            # possibly in another format than requested
+            filename = checkpoint_writer.wait(self.filename)
+            if filename is not None:
+                self.filename = filename
+            self._matrix = load_matrix(self.filename)
+            if self._matrix is None:
+                raise IOError("Cannot load matrix from file '%s'" % self.filename)
+            if (self._matrix.num_rows != self.num_rows
+                or self._matrix.num_columns != self.num_columns):
+                self._matrix = None
+                raise IOError("Matrix in file '%s' has the wrong dimensions:"
+                              " expected %dx%d"
+                              % (self.filename, self.num_rows, self.num_columns))
+            if self._nnz is None:
+                self._nnz = self._matrix.nnz()
+        return self._matrix
+
+    #@cython.ccall(cython.bint)
+    def is_loaded(self):
+        """Return `True` if the matrix is currently held in memory."""
+        return (self._matrix is not None)
+
+    #@cython.ccall(cython.long)
+    def nnz(self):
+        """Return the number of non-zero entries; the matrix is loaded
+        if this was not given to the constructor.
+        """
+        if self._nnz is None:
+            self.get()
+        return self._nnz
+
+    #@cython.ccall
+    def release(self):
+        """Free the memory taken by the matrix; it will be loaded
+        again from file by the next call to `get`.
+        """
+        self._matrix = None
+
+
 #@cython.cclass
 class DifferentialComplex(list):
     """A finite-length complex of differential operators.
@@ -111,9 +237,15 @@ class DifferentialComplex(list):
     A `DifferentialComplex` is an ordered sequence of differential
     operators `D[i]`; each `D[i]` maps `C[i]` into `C[i+1]`.  The
     differential operators *must* be instances of the `SimpleMatrix`
-    class; matrices are assumed to operate on column vectors, so that
-    the number of rows equals the dimension of the domain vector
-    space.
+    class, or `LazyMatrix` handles to matrices saved in a file;
+    matrices are assumed to operate on column vectors, so that the
+    number of rows equals the dimension of the domain vector space.
+
+    Use `matrix` to access the `SimpleMatrix` instance of `D[i]`, and
+    `release` to free the memory it takes once it is no longer needed:
+    matrices saved in a file are only held in memory while they are
+    being used, so that the memory needed to compute homology is not
+    the sum of the sizes of all matrices.
 
     Indices of the operators `D[i]` run from 0 to `len(D)-1`
     (inclusive).  The Python `len` operator returns the total length
@@ -128,8 +260,8 @@ class DifferentialComplex(list):
       | >>> D.compute_homology_ranks()
       | [1, 0]
 
-    An assertion is thrown if the matrix product of
-    `D[i]` and `D[i+1]` is not null.
+    An error is logged if the matrix product of `D[i]` and `D[i+1]`
+    is not null; see `check_complex`.
     """
 
     def __init__(self, len_or_bds=[]):
@@ -137,14 +269,18 @@ class DifferentialComplex(list):
         if isinstance(len_or_bds, numbers.Integral):
             list.__init__(self, [None]*len_or_bds)
         else:
-            if __debug__:
+            if runtime.checks:
+                from fatghol.simplematrix import SimpleMatrix
                 for elt in len_or_bds:
                     assert len(elt) == 3
                     A, dom, codom = elt
-                    assert isinstance(A, SimpleMatrix)
+                    assert isinstance(A, (SimpleMatrix, LazyMatrix))
                     assert isinstance(dom, numbers.Integral)
                     assert isinstance(codom, numbers.Integral)
             list.__init__(self, len_or_bds)
+        #: name of the files where ranks of `D[i]` are saved, see
+        #: `compute_homology_ranks`
+        self.rank_checkpoint_format = "M%d,%d-rkD%d.txt"
 
     def __repr__(self):
         return "DifferentialComplex(%s)" % list.__str__(self)
@@ -160,11 +296,697 @@ class DifferentialComplex(list):
         list.append(self, (bd, ddim, cdim))
 
 
+    #@cython.locals(i=cython.int)
+    #@cython.ccall
+    def matrix(self, i):
+        """Return the `SimpleMatrix` instance of `D[i]`, loading it
+        into memory if needed.
+        """
+        A = self[i][0]
+        if isinstance(A, LazyMatrix):
+            return A.get()
+        else:
+            return A
+
+
+    #@cython.locals(i=cython.int)
+    #@cython.ccall
+    def release(self, i):
+        """Free the memory taken by `D[i]`, if it can be loaded again
+        when needed (i.e., if it is a `LazyMatrix`); otherwise, do
+        nothing.
+        """
+        A = self[i][0]
+        if isinstance(A, LazyMatrix):
+            A.release()
+
+
+    #@cython.locals(exact=cython.bint, ok=cython.bint, i=cython.int,
+    #               A=SimpleMatrix, B=SimpleMatrix, seed=cython.ulong)
+    #@cython.ccall(cython.bint)
+    def check_complex(self, exact=False):
+        """Return `True` if the product of any two consecutive
+        differentials `D[i-1]` and `D[i]` is null, and log an error
+        message for each pair for which it is not.
+
+        By default, a randomized test is used: the product is applied
+        to a few random vectors (modulo a large prime), which takes
+        time linear in the number of non-zero entries of the matrices,
+        but can wrongly report a non-null product as null (with
+        negligible probability).  If `exact` is `True`, then the full
+        matrix product is computed instead.
+        """
+        from fatghol.simplematrix import is_null_product, is_null_product_randomized
+        ok = True
+        seed = random.getrandbits(32) or 1
+        for i in xrange(1, len(self)):
+            # only two consecutive matrices are needed at any time
+            if i > 1:
+                self.release(i-2)
+            A = self[i-1][0]
+            B = self[i][0]
+            if A.num_rows == 0 or A.num_columns == 0 or B.num_columns == 0:
+                continue # with next `i`
+            if A.num_columns != B.num_rows:
+                logging.error("Boundary operator matrices D[%d] and D[%d] cannot be composed:"
+                              " D[%d] is %dx%d and D[%d] is %dx%d",
+                              i-1, i, i-1, A.num_rows, A.num_columns,
+                              i, B.num_rows, B.num_columns)
+                ok = False
+                continue # with next `i`
+            A = self.matrix(i-1)
+            B = self.matrix(i)
+            start = time.time()
+            if exact:
+                null = is_null_product(A, B)
+            else:
+                null = is_null_product_randomized(A, B, 2, seed)
+            if null:
+                logging.info("  D[%d]*D[%d] is null (%s check, %.3fs)",
+                             i-1, i, ('exact' if exact else 'randomized'),
+                             time.time() - start)
+            else:
+                logging.error("Product of boundary operator matrices D[%d] and D[%d]"
+                              " is not null!", i-1, i)
+                ok = False
+        for i in xrange(max(0, len(self)-2), len(self)):
+            self.release(i)
+        return ok
+
+
+    #@cython.locals(max_fill=cython.int, L=cython.int, k=cython.int,
+    #               rows=object, cols=object, alive=list, reduced=list,
+    #               A=SimpleMatrix, ddim=cython.int, cdim=cython.int, limit=cython.int,
+    #               changed=cython.bint, r=cython.int, c=cython.int,
+    #               u=cython.int, cost=cython.int, best=tuple,
+    #               index=list, result=object)
+    #@cython.ccall
+    def morse_reduce(self, max_fill=MORSE_MAX_FILL):
+        """Return a smaller differential complex, having the same
+        homology as this one.
+
+        Whenever a generator `c` of `C[k]` hits a generator `r` of
+        `C[k-1]` with coefficient +1 or -1, the pair `(r, c)` can be
+        removed from the complex without changing its homology
+        (algebraic Morse theory, or Gaussian elimination on chain
+        complexes): row `c` is removed from `D[k+1]`, column `r` from
+        `D[k-1]`, and `D[k]` is replaced by its Schur complement with
+        respect to entry `(r, c)`.  Pairs are matched greedily, those
+        that cause the least fill-in in `D[k]` first; pairs whose
+        elimination could add more than `max_fill` entries are never
+        matched.  Since only invertible coefficients are used as
+        pivots, the reduction is exact over the integers.
+
+        Matrices are reduced one at a time, starting from the last
+        one: while `D[k]` is being reduced, only `D[k]` and the
+        already-reduced `D[k+1]` are held in memory, as dictionaries
+        of their non-zero entries (which take several times the memory
+        of a `SimpleMatrix`); the reduced matrices are kept in memory
+        as `SimpleMatrix` instances.
+
+        The reduction of each chain module is logged; the returned
+        complex saves rank checkpoints under a different name, so
+        they do not get mixed with those of the unreduced complex.
+
+        Example::
+
+          >>> # chain complex of the boundary of a triangle
+          >>> C = ChainComplex(2)
+          >>> C[0] = VectorSpace(['v0', 'v1', 'v2'])
+          >>> C[1] = VectorSpace(['e01', 'e12', 'e20'])
+          >>> C.differential[1] = lambda e: [('v'+e[2], 1), ('v'+e[1], -1)]
+          >>> D = C.compute_boundary_operators()
+          >>> M = D.morse_reduce()
+          >>> [ cdim for (A, ddim, cdim) in M ]
+          [1, 1]
+          >>> M.compute_homology_ranks()
+          [1, 1]
+        """
+        from fatghol.simplematrix import SimpleMatrix
+        L = len(self)
+        #: sets of generators of `C[k]` that have not been matched yet
+        alive = [ set(xrange(cdim)) for (A, ddim, cdim) in self ]
+        #: reduced matrices, indexed like `D[k]`
+        reduced = [ None ] * L
+
+        def remove(entries, transposed, i):
+            # remove line `i` from matrix given by (`entries`, `transposed`)
+            for j in entries.pop(i, {}):
+                del transposed[j][i]
+                if len(transposed[j]) == 0:
+                    del transposed[j]
+
+        def eliminate(R, C, k, r, c, u):
+            col = [ (r2, a) for (r2, a) in C[c].iteritems() if r2 != r ]
+            row = [ (c2, b) for (c2, b) in R[r].iteritems() if c2 != c ]
+            remove(R, C, r)
+            remove(C, R, c)
+            # Schur complement: D[k] - D[k][:,c] * D[k][r,:] / u
+            for (r2, a) in col:
+                for (c2, b) in row:
+                    x = R[r2].get(c2, 0) - a*b*u
+                    if x != 0:
+                        R[r2][c2] = x
+                        C[c2][r2] = x
+                    elif c2 in R[r2]:
+                        del R[r2][c2]
+                        del C[c2][r2]
+                        if len(C[c2]) == 0:
+                            del C[c2]
+                if len(R[r2]) == 0:
+                    del R[r2]
+            # `c` is no longer in the range of `D[k+1]`, and `r` is
+            # no longer in the domain of `D[k-1]`
+            alive[k].discard(c)
+            alive[k-1].discard(r)
+
+        def finalize(k, R):
+            # turn the reduced entries `R` of `D[k]` into a
+            # `SimpleMatrix`, renumbering surviving generators; rows
+            # matched by the reduction of `D[k-1]` are dropped here
+            row_index = dict((x, n) for (n, x) in enumerate(sorted(alive[k-1])))
+            col_index = dict((x, n) for (n, x) in enumerate(sorted(alive[k])))
+            A = SimpleMatrix(len(alive[k-1]), len(alive[k]))
+            r_ = array('i')
+            c_ = array('i')
+            v_ = array('i')
+            for (r, row) in R.iteritems():
+                if r not in row_index:
+                    continue # with next `r`
+                for (c, u) in row.iteritems():
+                    r_.append(row_index[r])
+                    c_.append(col_index[c])
+                    v_.append(u)
+            A.addToEntries(r_, c_, v_)
+            reduced[k] = A
+
+        #: non-zero entries of the reduced `D[k+1]`, by row
+        next_rows = None
+        for k in xrange(L-1, 0, -1):
+            (A, ddim, cdim) = self[k]
+            #: `rows` maps each row index `r` of `D[k]` to a dictionary
+            #: `{c: D[k][r,c]}` of the non-zero entries in that row;
+            #: `cols` is the same, by column
+            rows = defaultdict(dict)
+            cols = defaultdict(dict)
+            if A.num_rows > 0 and A.num_columns > 0:
+                for (r, c, u) in itertools.izip(*self.matrix(k).entries()):
+                    # columns matched by the reduction of `D[k+1]` are gone
+                    if u != 0 and c in alive[k]:
+                        rows[r][c] = u
+                        cols[c][r] = u
+                self.release(k)
+            # greedily match pairs, cheapest first
+            limit = 0
+            while limit <= max_fill:
+                changed = True
+                while changed:
+                    changed = False
+                    for r in rows.keys():
+                        if r not in rows:
+                            continue # with next `r`
+                        best = None
+                        for (c, u) in rows[r].iteritems():
+                            if u == 1 or u == -1:
+                                cost = (len(rows[r]) - 1) * (len(cols[c]) - 1)
+                                if best is None or cost < best[0]:
+                                    best = (cost, c, u)
+                        if best is not None and best[0] <= limit:
+                            eliminate(rows, cols, k, r, best[1], best[2])
+                            changed = True
+                limit = (2*limit if limit > 0 else 1)
+            del cols
+            # now the rows of `D[k+1]` are final
+            if next_rows is not None:
+                finalize(k+1, next_rows)
+            next_rows = rows
+        if next_rows is not None:
+            finalize(1, next_rows)
+        del next_rows
+
+        # build the reduced complex
+        result = DifferentialComplex()
+        # ranks of the reduced matrices are checkpointed separately
+        result.rank_checkpoint_format = self.rank_checkpoint_format.replace("-rkD", "-morse-rkD")
+        result.append(null_matrix(), 0, len(alive[0]))
+        for k in xrange(1, L):
+            result.append(reduced[k], len(alive[k-1]), len(alive[k]))
+        for k in xrange(L):
+            logging.info("  Morse reduction: C[%d] has %d generators, down from %d (-%.1f%%)",
+                         k, len(alive[k]), self[k][2],
+                         (100.0 * (self[k][2] - len(alive[k])) / self[k][2]
+                          if self[k][2] > 0 else 0.0))
+        return result
+
+
+    @staticmethod
+    #@cython.ccall(cython.long)
+    def _estimate_rank_cost(A):
+        """Return a rough estimate of the cost of computing the rank
+        of `A`, which can be a `SimpleMatrix` or a `LazyMatrix`.
+
+        The estimate is the number of non-zero entries times the
+        smaller dimension of the matrix: it is only meant for
+        comparing matrices of the same complex against each other.
+        """
+        return A.nnz() * min(A.num_rows, A.num_columns)
+
+
+    #@cython.locals(ranks=list, known=dict, i=cython.int, j=cython.int,
+    #               costs=list, chain=list, to_compute=list)
+    #@cython.ccall(list)
+    def _plan_rank_computations(self, ranks, known):
+        """Return list of indices `i` such that the rank of `D[i]`
+        must be computed.
+
+        Argument `ranks` holds the ranks that are already known (or
+        `None` in the place of those that are not); it has one more
+        element than the complex itself, accounting for the null map
+        that augments the complex at the end.  Argument `known` maps
+        homology degrees to the a-priori known homology ranks (see
+        `compute_homology_ranks`).
+
+        Each item `(i, h)` in `known` ties together the ranks of
+        `D[i]` and `D[i+1]`, so consecutive indices in `known` form
+        chains of ranks, any one of which determines all the others.
+        If a rank in the chain is already known, no rank in the chain
+        is computed; this is always the case for a chain reaching the
+        end of the complex, as the augmentation map has rank 0.
+        Otherwise, only the least expensive rank in the chain is
+        computed, and the more expensive ones are derived from it.
+
+        Example::
+
+          >>> # chain complex of a filled triangle
+          >>> C = ChainComplex(3)
+          >>> C[0] = VectorSpace(['v0', 'v1', 'v2'])
+          >>> C[1] = VectorSpace(['e01', 'e12', 'e20'])
+          >>> C[2] = VectorSpace(['f'])
+          >>> C.differential[1] = lambda e: [('v'+e[2], 1), ('v'+e[1], -1)]
+          >>> C.differential[2] = lambda f: [('e01', 1), ('e12', 1), ('e20', 1)]
+          >>> D = C.compute_boundary_operators()
+
+        Knowing `h_1` allows skipping either `D[1]` (a 3x3 matrix) or
+        `D[2]` (a 3x1 matrix); the rank of the latter is computed, and
+        the former derived from it::
+
+          >>> D._plan_rank_computations([0, None, None, 0], {1: 0})
+          [2]
+          >>> D.compute_homology_ranks(known={1: 0})
+          [1, 0, 0]
+
+        Knowing also `h_2`, the chain of ranks reaches the
+        augmentation map, and no rank needs computing::
+
+          >>> D._plan_rank_computations([0, None, None, 0], {1: 0, 2: 0})
+          []
+        """
+        costs = [ (DifferentialComplex._estimate_rank_cost(A) if ranks[i] is None else 0)
+                  for (i, (A, ddim, cdim)) in enumerate(self) ]
+        costs.append(0)
+        for (i, c) in enumerate(costs[:-1]):
+            if ranks[i] is None:
+                logging.debug("  Estimated cost of computing rank D[%d]: %d", i, c)
+        to_compute = [ ]
+        i = 0
+        while i < len(ranks):
+            # collect chain of ranks starting at `i`
+            chain = [i]
+            while chain[-1] in known and chain[-1]+1 < len(ranks):
+                chain.append(chain[-1]+1)
+            i = chain[-1] + 1
+            if any((ranks[j] is not None) for j in chain):
+                for k in chain:
+                    if ranks[k] is None:
+                        logging.info("  Will derive rank D[%d] from known homology"
+                                     " and ranks (estimated cost: %d)",
+                                     k, costs[k])
+                continue # with next chain
+            j = min(chain, key=(lambda j: costs[j]))
+            to_compute.append(j)
+            for k in chain:
+                if k != j:
+                    logging.info("  Will derive rank D[%d] from known homology,"
+                                 " instead of computing it (estimated cost: %d)",
+                                 k, costs[k])
+        return to_compute
+
+
+    @staticmethod
+    #@cython.locals(A=SimpleMatrix)
+    #@cython.ccall(cython.long)
+    def _estimate_rank_memory(A):
+        """Return a rough estimate of the memory (in bytes) needed to
+        compute the rank of `A`.
+        """
+        return A.nnz() * RANK_MEMORY_PER_ENTRY
+
+
+    @staticmethod
+    #@cython.locals(A=SimpleMatrix, B=SimpleMatrix,
+    #               rows=object, cols=object, local=object,
+    #               n=cython.int, c=cython.int, i=cython.int, j=cython.int,
+    #               block_rows=list, num_cols=list, blocks=list, trivial=cython.int,
+    #               copy=cython.bint)
+    #@cython.ccall(tuple)
+    def _split_into_blocks(A, copy=False):
+        """Return a pair `(blocks, trivial)`, describing the blocks
+        into which matrix `A` splits.
+
+        Rows and columns of `A` are grouped according to the
+        connected components of the bipartite graph joining row `i`
+        to column `j` iff entry `(i,j)` is non-zero; up to a
+        permutation of rows and columns, `A` is then a block-diagonal
+        matrix, and its rank is the sum of the ranks of the blocks.
+
+        Blocks consisting of a single row or a single column have rank
+        1, so they are just counted in `trivial`; all the other blocks
+        are returned as `SimpleMatrix` instances in list `blocks`.  If
+        `A` does not split, then `blocks` is the list `[A]`, unless
+        `copy` is true: then the only block is a copy of `A`, so that
+        it can be modified in place.
+        """
+        from fatghol.simplematrix import SimpleMatrix
+        rows = array('i', [0]) * A.num_rows
+        cols = array('i', [0]) * A.num_columns
+        n = A.getComponents(rows, cols)
+        block_rows = [ array('i') for c in xrange(n) ]
+        for (i, c) in enumerate(rows):
+            if c >= 0:
+                block_rows[c].append(i)
+        # map each column to its index within its own block
+        num_cols = [ 0 ] * n
+        local = array('i', [-1]) * A.num_columns
+        for (j, c) in enumerate(cols):
+            if c >= 0:
+                local[j] = num_cols[c]
+                num_cols[c] += 1
+        blocks = [ ]
+        trivial = 0
+        for c in xrange(n):
+            if len(block_rows[c]) == 1 or num_cols[c] == 1:
+                trivial += 1
+            elif n == 1 and not copy:
+                blocks.append(A)
+            else:
+                B = SimpleMatrix(len(block_rows[c]), num_cols[c])
+                B.addRows(A, block_rows[c], local)
+                blocks.append(B)
+        return (blocks, trivial)
+
+
+    @staticmethod
+    #@cython.locals(i=cython.int, blocks=list, trivial=cython.int,
+    #               sizes=dict, B=SimpleMatrix, k=cython.int)
+    def _log_block_sizes(i, blocks, trivial):
+        """Log how many blocks `D[i]` splits into, and the
+        distribution of their sizes (number of rows, in powers of 2).
+        """
+        if trivial == 0 and len(blocks) == 1:
+            logging.debug("  D[%d] does not split into blocks", i)
+            return
+        sizes = defaultdict(int)
+        for B in blocks:
+            k = 1
+            while 2*k <= B.num_rows:
+                k *= 2
+            sizes[k] += 1
+        logging.info("  D[%d] splits into %d blocks: %d trivial, %d to compute%s",
+                     i, len(blocks) + trivial, trivial, len(blocks),
+                     ((" (rows: %s)" % str.join(", ", [ ("%d-%d: %d" % (k, 2*k-1, sizes[k]))
+                                                         for k in sorted(sizes.keys()) ]))
+                      if len(blocks) > 0 else ""))
+
+
+    #@cython.locals(indices=list, checkpoints=list,
+    #               jobs=cython.int, budget=cython.long, in_use=list,
+    #               pending=list, blocks=list, splitting=list,
+    #               results=dict, done=object, schedule=object,
+    #               partial=dict, outstanding=dict, elapsed=dict, snapshots=dict,
+    #               workers=list, i=cython.int, r=cython.int, t=cython.double)
+    #@cython.ccall(dict)
+    def _compute_ranks(self, indices, checkpoints):
+        """Compute the ranks of `D[i]` for all `i` in `indices`, and
+        return a dictionary mapping each `i` to the rank of `D[i]`.
+
+        Each matrix is first split into independent blocks (see
+        `_split_into_blocks`), and its rank computed as the sum of the
+        ranks of the blocks.
+
+        If the `reorder` runtime option is ``'degree'``, rows and
+        columns of each block are permuted (in place) before the rank
+        computation to limit fill-in, see
+        `SimpleMatrix.reorderByDegree`; the matrices of the complex are
+        left untouched::
+
+          >>> # chain complex of a square, cut into two triangles
+          >>> C = ChainComplex(3)
+          >>> C[0] = VectorSpace(['a', 'b', 'c', 'd'])
+          >>> C[1] = VectorSpace(['ab', 'bc', 'cd', 'ad', 'ac'])
+          >>> C[2] = VectorSpace(['abc', 'acd'])
+          >>> C.differential[1] = lambda e: [(e[1], 1), (e[0], -1)]
+          >>> C.differential[2] = lambda f: [(f[1:], 1), (f[0]+f[2], -1), (f[:2], 1)]
+          >>> D = C.compute_boundary_operators()
+          >>> from fatghol.mgn import configure
+          >>> checks = runtime.checks
+          >>> options = configure(checkpoint_dir=None, reorder='degree')
+          >>> D.compute_homology_ranks()
+          [1, 0, 0]
+          >>> D.check_complex(exact=True)
+          True
+          >>> del runtime.options
+          >>> runtime.checks = checks
+
+        If the `rank_backend` runtime option is ``'resumable'``, ranks
+        are computed by `SimpleMatrix.rankResumable`, which saves the
+        state of the elimination every `rank_checkpoint_interval`
+        seconds into a file next to the rank checkpoint file
+        (one per block); an interrupted computation resumes from
+        there, unless the `restart` runtime option is false.  These
+        files are removed once the rank has been saved.  Otherwise,
+        `SimpleMatrix.rank` is used.
+
+        Ranks are computed concurrently by the number of threads given
+        by the `jobs` runtime option, which share two kinds of jobs:
+        loading and splitting a matrix, and computing the rank of one
+        of its blocks.  Each matrix is only loaded when its turn
+        comes, and released as soon as it has been split; its blocks
+        are then ranked in parallel, largest first, and take
+        precedence over loading further matrices.  Matrices are scheduled
+        largest-first, but a matrix is only loaded if the estimated
+        memory needed by all blocks and matrices being worked on stays
+        within the `rank_memory` runtime option (in MiB; if `None`,
+        the memory budget set with `memory.set_budget`, if any); the
+        estimates only need the number of non-zero entries and the
+        dimensions, so a `LazyMatrix` is not loaded for scheduling.
+        The rank of each matrix is saved into the corresponding file
+        in `checkpoints` as soon as the ranks of all its blocks have
+        been computed.
+        """
+        try:
+            jobs = runtime.options.jobs
+            budget = runtime.options.rank_memory
+        except AttributeError:
+            # running tests, so no `runtime.options`
+            jobs = 1
+            budget = None
+        try:
+            reorder = runtime.options.reorder
+        except AttributeError:
+            reorder = 'none'
+        try:
+            backend = runtime.options.rank_backend
+            interval = runtime.options.rank_checkpoint_interval
+            restart = runtime.options.restart
+        except AttributeError:
+            backend = 'linbox'
+            interval = 0
+            restart = False
+        if budget is not None:
+            budget *= 1024*1024
+        else:
+            # the whole memory budget is available for rank computations
+            budget = memory.max_memory
+
+        results = dict()
+        #: sum of the ranks of the blocks of `D[i]` computed so far
+        partial = dict()
+        #: number of blocks of `D[i]` whose rank is still to be computed
+        outstanding = dict()
+        #: time spent splitting `D[i]` and computing the ranks of its blocks
+        elapsed = dict()
+        #: elimination state files of the blocks of `D[i]`
+        snapshots = dict()
+
+        #: indices `i` of the matrices `D[i]` still to be loaded, largest first
+        pending = sorted(indices,
+                         key=(lambda i: DifferentialComplex._estimate_rank_cost(self[i][0])),
+                         reverse=True)
+        #: quadruples `(i, B, S, mem)` of blocks `B` of `D[i]` whose
+        #: rank is still to be computed, their elimination state
+        #: files `S` and estimated memory `mem`, largest first
+        blocks = [ ]
+        #: number of matrices being loaded and split
+        splitting = [ 0 ]
+        #: estimated memory used by the loaded blocks and matrices
+        in_use = [ 0 ]
+        schedule = threading.Condition()
+        done = Queue.Queue()
+
+        def next_job():
+            # return next job, or `None` if all jobs have been
+            # scheduled; must be called with `schedule` held
+            while len(blocks) > 0 or len(pending) > 0 or splitting[0] > 0:
+                # the memory of blocks is accounted for when they are
+                # created, so they can always be run
+                if len(blocks) > 0:
+                    return blocks.pop(0)
+                for i in pending:
+                    mem = DifferentialComplex._estimate_rank_memory(self[i][0])
+                    # run at least one computation, even if it exceeds the budget
+                    if budget is None or in_use[0] == 0 or in_use[0] + mem <= budget:
+                        pending.remove(i)
+                        in_use[0] += mem
+                        splitting[0] += 1
+                        return (i, None, None, mem)
+                # wait for a block to be created, or memory to be freed
+                schedule.wait()
+            return None
+
+        def split(i, mem):
+            # load and split `D[i]`, and queue its blocks for rank computation
+            start = time.time()
+            #: new block jobs, see `blocks`
+            jobs_ = [ ]
+            try:
+                # reordering permutes a block in place, so it must not
+                # be `D[i]` itself, unless that can be loaded again
+                (Bs, trivial) = DifferentialComplex._split_into_blocks(
+                    self.matrix(i),
+                    copy=(reorder == 'degree' and not isinstance(self[i][0], LazyMatrix)))
+                # the blocks are all that is needed from now on; a block
+                # may still be the whole matrix, which is then freed as
+                # soon as its rank is known
+                self.release(i)
+                DifferentialComplex._log_block_sizes(i, Bs, trivial)
+                if backend == 'resumable' and checkpoints[i] is not None:
+                    Ss = [ ("%s-b%d.elim" % (os.path.splitext(checkpoints[i])[0], k))
+                           for k in xrange(len(Bs)) ]
+                    if not restart:
+                        for S in Ss:
+                            if os.path.exists(S):
+                                os.remove(S)
+                else:
+                    Ss = [ None ] * len(Bs)
+                jobs_ = [ (i, B, S, DifferentialComplex._estimate_rank_memory(B))
+                          for (B, S) in itertools.izip(Bs, Ss) ]
+                del Bs
+                # the main thread must learn about the blocks before
+                # their ranks come in
+                done.put((i, trivial, len(jobs_), Ss, time.time() - start, None))
+            finally:
+                schedule.acquire()
+                try:
+                    blocks.extend(jobs_)
+                    blocks.sort(key=(lambda job: DifferentialComplex._estimate_rank_cost(job[1])),
+                                reverse=True)
+                    # the estimate for the whole matrix is replaced by
+                    # those of its blocks
+                    in_use[0] += sum(job[3] for job in jobs_) - mem
+                    splitting[0] -= 1
+                    schedule.notifyAll()
+                finally:
+                    schedule.release()
+
+        def rank(i, B, S, mem):
+            # compute the rank of block `B` of `D[i]`
+            try:
+                start = time.time()
+                # permuting rows and columns does not change the
+                # rank, but may reduce fill-in during elimination
+                if reorder == 'degree':
+                    B.reorderByDegree()
+                # `SimpleMatrix.rank` and `.rankResumable` release the GIL
+                if backend == 'resumable':
+                    r = B.rankResumable(S, interval)
+                else:
+                    r = B.rank()
+                done.put((i, r, None, None, time.time() - start, None))
+            finally:
+                schedule.acquire()
+                try:
+                    in_use[0] -= mem
+                    schedule.notifyAll()
+                finally:
+                    schedule.release()
+
+        def worker():
+            while True:
+                schedule.acquire()
+                try:
+                    job = next_job()
+                finally:
+                    schedule.release()
+                if job is None:
+                    return
+                (i, B, S, mem) = job
+                del job
+                try:
+                    if B is None:
+                        split(i, mem)
+                    else:
+                        rank(i, B, S, mem)
+                except Exception, error:
+                    self.release(i)
+                    done.put((i, None, None, None, 0, error))
+                # drop the reference to the block while waiting for the next job
+                del B
+
+        def finish(i):
+            # checkpoint the computation so far
+            if checkpoints[i] is not None:
+                checkpoint_writer.submit(checkpoints[i], _save_rank,
+                                         partial[i], checkpoints[i], snapshots[i])
+            logging.info("  rank D[%d]=%d (computed in %.3fs)", i, partial[i], elapsed[i])
+            results[i] = partial[i]
+
+        workers = [ ]
+        for n in xrange(jobs if len(pending) > 0 else 0):
+            worker_thread = threading.Thread(target=worker, name=("rank worker %d" % n))
+            worker_thread.daemon = True
+            worker_thread.start()
+            workers.append(worker_thread)
+
+        while len(results) < len(indices):
+            (i, r, num_blocks, Ss, t, error) = done.get()
+            if error is not None:
+                raise error
+            if Ss is not None:
+                # `D[i]` has been split: `r` is the number of trivial blocks
+                partial[i] = r
+                outstanding[i] = num_blocks
+                snapshots[i] = Ss
+                elapsed[i] = t
+            else:
+                partial[i] += r
+                outstanding[i] -= 1
+                elapsed[i] += t
+            if outstanding[i] == 0:
+                finish(i)
+        # all jobs are done, so workers are just about to exit; wait
+        # for them, lest they outlive the interpreter
+        for worker_thread in workers:
+            worker_thread.join()
+        return results
+
+
     #@cython.locals(ranks=list, i=cython.int,
     #               A=SimpleMatrix, ddim=cython.int, cdim=cython.int,
-    #               r=cython.int, rs=list, domain_dim=list)
+    #               r=cython.int, rs=list, domain_dim=list,
+    #               known=dict, verify=cython.bint, to_compute=list,
+    #               derived=cython.bint, j=cython.int)
     #@cython.ccall
-    def compute_homology_ranks(self):
+    def compute_homology_ranks(self, known=None):
         """Compute and return (list of) homology group ranks.
 
         Returns a list of integers: item at index `n` is the rank of
@@ -172,49 +994,38 @@ class DifferentialComplex(list):
         the differential complex has finite length, homology group
         indices can only run from 0 to the length of the complex (all
         other groups being, trivially, null).
+
+        Optional argument `known` maps indices `n` into the rank of
+        the `n`-th homology group, if that is known in advance by
+        other means.  Since `h_n = dim C[n] - rk D[n] - rk D[n+1]`,
+        the rank of one of `D[n]`, `D[n+1]` can then be derived from
+        the other one, and there's no need to compute it.  Where the
+        ranks tied together this way are all unknown, only the least
+        expensive one is computed, according to a rough estimate of
+        the cost based on the number of non-zero entries and the
+        matrix dimensions; where one of them is known (e.g., the null
+        augmentation map at the end of the complex), none is computed.
+        See `_plan_rank_computations` for details.  Derived ranks are
+        saved into the rank checkpoint files, just like computed ones.
+        If the `verify` runtime option is set, all ranks are computed
+        anyway and checked against the known homology ranks.
+
+        Ranks are computed concurrently, see `_compute_ranks` for
+        details.
         """
-        # check that the differentials form a complex
-        # if __debug__:
-        #     for i in xrange(1, len(self)-1):
-        #         assert is_null_product(self[i-1][0], self[i][0]), \
-        #                "DifferentialComplex.compute_homology_ranks:" \
-        #                " Product of boundary operator matrices D[%d] and D[%d]" \
-        #                " is not null!" \
-        #                % (i-1, i)
+        try:
+            verify = runtime.options.verify
+            check = runtime.options.check_complex
+        except AttributeError:
+            # running tests, so no `runtime.options`
+            verify = False
+            check = 'random'
+        if known is None:
+            known = dict()
 
-        #: ranks of `D[n]` matrices, for 0 <= n < len(self); the differential
-        #: `D[0]` is the null map.
-        ranks = list()
-        # only compute those ranks that were not saved
-        for (i, (A, ddim, cdim)) in enumerate(self):
-            try:
-                checkpoint = (os.path.join(runtime.options.checkpoint_dir,
-                                           "M%d,%d-rkD%d.txt" % (runtime.g, runtime.n, i)))
-            except AttributeError:
-                # running tests, so no `runtime.options`
-                checkpoint = None
-            # XXX: LinBox segfaults if asked to compute the rank of a 0xL matrix
-            if A.num_rows > 0 and A.num_columns > 0:
-                rs = None
-                if checkpoint is not None and runtime.options.restart:
-                    rs = load(checkpoint)
-                    if rs:
-                        r = rs[0]
-                        logging.info("  rank D[%d]=%d (loaded from file '%s')",
-                                     i, r, checkpoint)
-                if rs is None: # `rs` was not loaded from checkpoint file
-                    timing.start("rank D[%d]" % i)
-                    r = A.rank()
-                    timing.stop("rank D[%d]" % i)
-                    # checkpoint the computation so far
-                    if checkpoint is not None:
-                        save([r], checkpoint)
-                    logging.info("  rank D[%d]=%d (computed in %.3fs)",
-                                 i, r, timing.get("rank D[%d]" % i))
-            else: # A is a 0xL matrix
-                r = 0
-                logging.info("  rank D[%d]=%d (immediate)", i, r)
-            ranks.append(r)
+        # check that the differentials form a complex
+        if check != 'none':
+            self.check_complex(exact=(check == 'exact'))
 
         ## compute homology group ranks from rank and nullity
         ## of boundary operators.
@@ -231,12 +1042,85 @@ class DifferentialComplex(list):
         ##
         domain_dim = [ ddim for (A, ddim, cdim) in self ]
         domain_dim.append(self[-1][2]) # add dimension of last vector space
-        ranks.append(0) # augment complex with the null map.
         # note: `domain_dim` indices are offset by 1 w.r.t. to `ranks` indices
+
+        #: ranks of `D[n]` matrices, for 0 <= n < len(self); the differential
+        #: `D[0]` is the null map, and so is the augmentation `D[len(self)]`.
+        ranks = [ None ] * len(self)
+        ranks.append(0)
+        checkpoints = [ ]
+        # only compute those ranks that were not saved
+        for (i, (A, ddim, cdim)) in enumerate(self):
+            try:
+                checkpoint = (os.path.join(runtime.options.checkpoint_dir,
+                                           self.rank_checkpoint_format % (runtime.g, runtime.n, i)))
+            except AttributeError:
+                # running tests, so no `runtime.options`
+                checkpoint = None
+            checkpoints.append(checkpoint)
+            # XXX: LinBox segfaults if asked to compute the rank of a 0xL matrix
+            if A.num_rows > 0 and A.num_columns > 0:
+                if checkpoint is not None and runtime.options.restart:
+                    rs = load(checkpoint)
+                    if rs:
+                        ranks[i] = rs[0]
+                        logging.info("  rank D[%d]=%d (loaded from file '%s')",
+                                     i, ranks[i], checkpoint)
+            else: # A is a 0xL matrix
+                ranks[i] = 0
+                logging.info("  rank D[%d]=%d (immediate)", i, ranks[i])
+
+        if verify:
+            to_compute = [ i for i in xrange(len(self)) if ranks[i] is None ]
+        else:
+            to_compute = self._plan_rank_computations(ranks, known)
+        for (i, r) in self._compute_ranks(to_compute, checkpoints).iteritems():
+            ranks[i] = r
+
+        # derive remaining ranks from the known homology ranks
+        derived = True
+        while derived:
+            derived = False
+            for (i, h) in known.iteritems():
+                if ranks[i] is None and ranks[i+1] is not None:
+                    j = i
+                    ranks[i] = domain_dim[i+1] - h - ranks[i+1]
+                elif ranks[i] is not None and ranks[i+1] is None:
+                    j = i+1
+                    ranks[i+1] = domain_dim[i+1] - h - ranks[i]
+                else:
+                    continue # with next `(i, h)`
+                derived = True
+                logging.info("  rank D[%d]=%d (derived from h_%d=%d)",
+                             j, ranks[j], i, h)
+                if checkpoints[j] is not None:
+                    checkpoint_writer.submit(checkpoints[j], _save_rank,
+                                             ranks[j], checkpoints[j], [])
+        assert None not in ranks
+
+        if verify:
+            for (i, h) in known.iteritems():
+                if domain_dim[i+1] - ranks[i] - ranks[i+1] != h:
+                    logging.error("Computed ranks of D[%d] and D[%d] do not match"
+                                  " known homology rank h_%d=%d",
+                                  i, i+1, i, h)
+
         return [ (domain_dim[i+1] - ranks[i] - ranks[i+1])
                  for i in xrange(len(self)) ]
 
 
+#@cython.locals(rank=cython.long, checkpoint=str, snapshots=list)
+def _save_rank(rank, checkpoint, snapshots):
+    """Save `rank` into file `checkpoint`, and only then remove the
+    elimination state files in `snapshots` (`None` items are
+    ignored).
+    """
+    save([rank], checkpoint)
+    for S in snapshots:
+        if S is not None and os.path.exists(S):
+            os.remove(S)
+
+
 
 #@cython.cclass
 class ChainComplex(object):
@@ -338,16 +1222,23 @@ class ChainComplex(object):
         the `i`-th differential `D[i]` is `dim C[i-1]` rows (range) by
         `dim C[i]` columns (domain).
         """
+        from fatghol.simplematrix import SimpleMatrix
         D = DifferentialComplex()
-        D.append(NullMatrix, 0, self.module[0].dimension)
+        D.append(null_matrix(), 0, self.module[0].dimension)
         for i in xrange(1, self.length):
             d = SimpleMatrix(self.module[i-1].dimension,
                              self.module[i].dimension)
+            rows = array('i')
+            cols = array('i')
+            values = array('i')
             for j in xrange(self.module[i].dimension):
                 for (k, c) in self.module[i-1].coordinates(
                                    self.differential[i](
                                         self.module[i].base[j])).iteritems():
-                    d.addToEntry(k, j, c)
+                    rows.append(k)
+                    cols.append(j)
+                    values.append(c)
+            d.addToEntries(rows, cols, values)
             D.append(d, self.module[i-1].dimension, self.module[i].dimension)
             logging.info("  Computed %dx%d matrix D[%d]",
                          len(self.module[i-1].base),
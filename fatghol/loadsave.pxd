@@ -1,2 +1,45 @@
-cdef list load(filename)
-cdef void save(list items, filename)
+cpdef list load(filename)
+cpdef save(list items, filename)
+
+cdef class CheckpointWriter(object):
+    cdef object _queue
+    cdef object _lock
+    cdef dict _pending
+    cdef dict _done
+    cdef object _thread
+    cdef public double io_time
+    cdef public double wait_time
+cdef _encode_fatgraph(G)
+cdef _decode_fatgraph(list data)
+
+cdef class FatgraphFile(object):
+    cdef readonly str filename
+    cdef object _map
+    cdef bint _swap
+    cdef str _prefix
+    cdef unsigned int _block_size
+    cdef unsigned long _count
+    cdef unsigned long _index
+    cdef unsigned long _checksums
+    cdef set _checked
+    cpdef tuple _offsets(self, long k1, long k2)
+    cpdef _check_block(self, long b)
+    cpdef close(self)
+
+cpdef list load_graphs(filename)
+cpdef open_graphs(filename)
+cpdef save_graphs(graphs, filename, int block_size=*)
+cpdef append_graphs_chunk(filename, long position, list graphs)
+cpdef tuple load_graphs_chunks(filename)
+
+cdef class SharedStore(object):
+    cdef public str path
+    cpdef str entry(self, tuple key)
+    cpdef list get(self, tuple key)
+    cpdef bint put(self, tuple key, list graphs)
+    cdef bint _lock(self, str lockfile)
+cdef bint _process_exists(int pid)
+cpdef tuple matrix_dimensions(filename)
+cpdef load_matrix(filename)
+cpdef save_matrix(A, filename)
+cpdef convert_matrix(src, dst)
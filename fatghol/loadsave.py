@@ -24,9 +24,20 @@ __docformat__ = 'reStructuredText'
 
 #import cython
 
+from array import array
+import atexit
+import errno
+import hashlib
 import logging
+import mmap
 import os
 import os.path
+import Queue
+import socket
+import struct
+import sys
+import threading
+import time
 from zlib import adler32
 
 
@@ -34,9 +45,11 @@ from zlib import adler32
 #               checksum=cython.long, result=list,
 #               checkpoint_file=object, checksum_file=object,
 #               error=Exception)
-#@cython.cfunc(list)
+#@cython.ccall(list)
 def load(filename):
     from rg import Fatgraph, Vertex, BoundaryCycle
+    # the file may still be being written in the background
+    checkpoint_writer.wait(filename)
     result = list()
     checksum = 0
     try:
@@ -67,7 +80,7 @@ def load(filename):
 #               checksum=cython.long,
 #               checkpoint_file=object, checksum_file=object,
 #               line=str, error=Exception)
-#@cython.cfunc
+#@cython.ccall
 def save(items, filename):
     checksum = 0
     try:
@@ -98,6 +111,864 @@ def save(items, filename):
 
 
 
+## background writing of checkpoint files
+
+#: Maximum number of checkpoint files that may be waiting to be
+#: written by `checkpoint_writer`; further requests block until one
+#: has been written.
+CHECKPOINT_QUEUE_SIZE = 4
+
+
+#@cython.cclass
+class CheckpointWriter(object):
+    """Write checkpoint files in a background thread.
+
+    A call to `submit(filename, func, *args)` queues the call
+    `func(*args)`, which is expected to write file `filename`, and
+    returns immediately, unless `max_pending` files are already
+    waiting to be written.  The writing functions in this module
+    (`save`, `save_graphs`, `save_matrix`) write checksums last and
+    remove partially-written files on failure, so these guarantees
+    hold for files written in the background as well.
+
+    Method `wait` blocks until a given file, or all files, have been
+    written.  Attribute `io_time` is the total time spent writing
+    files, and `wait_time` the total time the caller was blocked
+    waiting for the writer.
+
+    Examples::
+
+      >>> import tempfile
+      >>> (fd, path) = tempfile.mkstemp(); os.close(fd)
+      >>> writer = CheckpointWriter()
+      >>> writer.submit(path, save, [1, 2, 3], path)
+      >>> writer.wait(path)
+      >>> load(path)
+      [1, 2, 3]
+      >>> os.remove(path); os.remove(path + '.sum')
+
+    Errors are logged, and raised again by `wait`::
+
+      >>> writer.submit('/no/such/dir/x', save, [1], '/no/such/dir/x')
+      >>> writer.wait()
+      Traceback (most recent call last):
+        ...
+      IOError: [Errno 2] No such file or directory: '/no/such/dir/x'
+    """
+
+    #@cython.locals(max_pending=cython.int)
+    def __init__(self, max_pending=CHECKPOINT_QUEUE_SIZE):
+        self._queue = Queue.Queue(max_pending)
+        self._lock = threading.Condition()
+        #: number of queued or running writes, by file name
+        self._pending = dict()
+        #: pairs `(result, error)` of completed writes, by file name
+        self._done = dict()
+        self._thread = None
+        self.io_time = 0.0
+        self.wait_time = 0.0
+
+    #@cython.locals(filename=str, func=object, args=tuple, start=cython.double)
+    def submit(self, filename, func, *args):
+        """Write file `filename` by calling `func(*args)` in the
+        background thread.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="checkpoint writer")
+            self._thread.daemon = True
+            self._thread.start()
+        with self._lock:
+            self._pending[filename] = self._pending.get(filename, 0) + 1
+            self._done.pop(filename, None)
+        start = time.time()
+        self._queue.put((filename, func, args))
+        self.wait_time += time.time() - start
+
+    def _run(self):
+        while True:
+            (filename, func, args) = self._queue.get()
+            start = time.time()
+            try:
+                outcome = (func(*args), None)
+            except Exception, error:
+                logging.error("Could not write checkpoint file '%s': %s", filename, error)
+                outcome = (None, error)
+            with self._lock:
+                self.io_time += time.time() - start
+                self._pending[filename] -= 1
+                if self._pending[filename] == 0:
+                    del self._pending[filename]
+                self._done[filename] = outcome
+                self._lock.notifyAll()
+
+    #@cython.locals(filename=str, start=cython.double)
+    def wait(self, filename=None):
+        """Wait until file `filename` has been written, and return
+        the value returned by the function that wrote it (or `None`
+        if no such file was submitted).  If `filename` is `None`,
+        wait until all submitted files have been written.
+
+        If writing failed, the exception raised by the writing
+        function is raised again (once).
+        """
+        start = time.time()
+        with self._lock:
+            if filename is None:
+                while len(self._pending) > 0:
+                    self._lock.wait()
+                outcomes = self._done.values()
+                self._done.clear()
+            else:
+                while filename in self._pending:
+                    self._lock.wait()
+                outcome = self._done.pop(filename, None)
+                outcomes = ([outcome] if outcome is not None else [ ])
+        self.wait_time += time.time() - start
+        for (result, error) in outcomes:
+            if error is not None:
+                raise error
+        if filename is not None and len(outcomes) > 0:
+            return outcomes[0][0]
+        return None
+
+
+#: The `CheckpointWriter` used by FatGHoL; files still being written
+#: are waited for before the program exits.
+checkpoint_writer = CheckpointWriter()
+
+def _flush_checkpoints():
+    try:
+        checkpoint_writer.wait()
+    except Exception:
+        # error has already been logged
+        pass
+atexit.register(_flush_checkpoints)
+
+
+
+## fatgraph lists
+
+# A binary fatgraph list file is laid out as follows (all integers in
+# the byte order of the machine that wrote it):
+#
+#   - a header (see `_FGL_HEADER`): magic string ``FGGL``, format
+#     version, byte order mark, number of graphs per block, and
+#     total number of graphs;
+#   - one record per graph, made of 32-bit signed integers (see
+#     `_encode_fatgraph`);
+#   - the index: offsets (from the start of the file) of each graph
+#     record, as unsigned 64-bit integers, plus one final offset
+#     pointing past the last record;
+#   - the Adler-32 checksum of each block of consecutive records, as
+#     unsigned 32-bit integers;
+#   - a trailer (see `_FGL_TRAILER`): offsets of the index and of the
+#     checksums.
+#
+_FGL_HEADER = struct.Struct('=4sIIIQ')
+_FGL_TRAILER = struct.Struct('=QQ')
+_FGL_MAGIC = 'FGGL'
+_FGL_VERSION = 1
+_FGL_BYTEORDER = 0x01020304
+
+#: Default number of graphs in each checksummed block of a binary
+#: fatgraph list file.
+FGL_BLOCK_SIZE = 256
+
+
+#@cython.locals(G=object, record=object)
+#@cython.cfunc
+def _encode_fatgraph(G):
+    """Return an `array.array('i')` holding the record of `G` in a
+    binary fatgraph list file.
+
+    The record consists of the number of vertices, edges and
+    boundary cycles; the valence of each vertex; the cyclic sequence
+    of edges at each vertex; the edge numbering (orientation); the
+    two endpoints `(v, i)` of each edge; and, for each boundary cycle,
+    its number of corners followed by the corners `(v, i, j)`.
+    """
+    record = array('i', [G.num_vertices, G.num_edges, G.num_boundary_cycles])
+    record.extend(len(v) for v in G.vertices)
+    for v in G.vertices:
+        record.extend(v)
+    record.extend(G.edge_numbering)
+    for e in G.edges:
+        for (v, i) in e.endpoints:
+            record.append(v)
+            record.append(i)
+    for bcy in G.boundary_cycles:
+        record.append(len(bcy))
+        for corner in sorted(bcy):
+            record.extend(corner)
+    return record
+
+
+#@cython.locals(data=list, pos=cython.int, num_vertices=cython.int,
+#               num_edges=cython.int, num_boundary_cycles=cython.int,
+#               l=cython.int, k=cython.int,
+#               vertices=list, edges=list, numbering=list, bcys=list)
+#@cython.cfunc
+def _decode_fatgraph(data):
+    """Return the `Fatgraph` described by the list of integers `data`
+    (see `_encode_fatgraph`); boundary cycles and edges are taken
+    from the record instead of being computed again.
+    """
+    from rg import Fatgraph, Vertex, Edge, BoundaryCycle
+    (num_vertices, num_edges, num_boundary_cycles) = data[0:3]
+    pos = 3 + num_vertices
+    vertices = [ ]
+    for l in data[3:pos]:
+        vertices.append(Vertex(data[pos:pos+l]))
+        pos += l
+    numbering = data[pos:pos+num_edges]
+    pos += num_edges
+    edges = [ ]
+    for k in xrange(num_edges):
+        edges.append(Edge((data[pos], data[pos+1]), (data[pos+2], data[pos+3])))
+        pos += 4
+    bcys = [ ]
+    for k in xrange(num_boundary_cycles):
+        l = data[pos]
+        pos += 1
+        bcys.append(BoundaryCycle((data[pos+3*x], data[pos+3*x+1], data[pos+3*x+2])
+                                  for x in xrange(l)))
+        pos += 3*l
+    return Fatgraph(vertices,
+                    num_vertices=num_vertices,
+                    num_edges=num_edges,
+                    edges=edges,
+                    orientation=numbering,
+                    boundary_cycles=bcys)
+
+
+#@cython.cclass
+class FatgraphFile(object):
+    """Read-only sequence of the fatgraphs stored in a binary
+    fatgraph list file (see `save_graphs`).
+
+    The file is memory-mapped, and each graph is only decoded when it
+    is accessed, so single graphs can be read at random.  The checksum
+    of each block of graphs is verified the first time a graph in the
+    block is accessed: `ValueError` is raised if it does not match.
+    Files written on a machine with a different byte order can be
+    read as well.
+    """
+
+    #@cython.locals(filename=str)
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as graphs_file:
+            self._map = mmap.mmap(graphs_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < _FGL_HEADER.size + _FGL_TRAILER.size:
+            self.close()
+            raise ValueError("Truncated fatgraph list file '%s'" % filename)
+        # detect byte order of the file
+        self._swap = False
+        (magic, version, byteorder, self._block_size, self._count) = \
+                _FGL_HEADER.unpack_from(self._map, 0)
+        if byteorder != _FGL_BYTEORDER:
+            self._swap = True
+            self._prefix = ('>' if sys.byteorder == 'little' else '<')
+            (magic, version, byteorder, self._block_size, self._count) = \
+                    struct.unpack_from(self._prefix + _FGL_HEADER.format[1:], self._map, 0)
+        else:
+            self._prefix = '='
+        if magic != _FGL_MAGIC or byteorder != _FGL_BYTEORDER:
+            self.close()
+            raise ValueError("File '%s' is not a binary fatgraph list file" % filename)
+        if version != _FGL_VERSION:
+            self.close()
+            raise ValueError("Unsupported version %d of fatgraph list file '%s'"
+                             % (version, filename))
+        (self._index, self._checksums) = \
+                struct.unpack_from(self._prefix + _FGL_TRAILER.format[1:], self._map,
+                                   len(self._map) - _FGL_TRAILER.size)
+        # the header, the offsets index and the trailer must agree
+        # with each other and with the file size, otherwise the file
+        # has been truncated or overwritten
+        if self._block_size <= 0 \
+               or self._index < _FGL_HEADER.size \
+               or self._checksums != self._index + 8*(self._count + 1) \
+               or len(self._map) != (self._checksums
+                                     + 4*((self._count + self._block_size - 1)
+                                          // self._block_size)
+                                     + _FGL_TRAILER.size) \
+               or self._offsets(0, self._count) != (
+                   (_FGL_HEADER.size if self._count > 0 else self._index),
+                   self._index):
+            self.close()
+            raise ValueError("Truncated or corrupted fatgraph list file '%s'" % filename)
+        #: blocks whose checksum has already been verified
+        self._checked = set()
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for k in xrange(self._count):
+            yield self[k]
+
+    #@cython.locals(k=cython.long, b=cython.long,
+    #               start=cython.long, end=cython.long)
+    def __getitem__(self, k):
+        if k < 0:
+            k += self._count
+        if not (0 <= k < self._count):
+            raise IndexError("Fatgraph list index out of range")
+        b = k // self._block_size
+        if b not in self._checked:
+            self._check_block(b)
+        (start, end) = self._offsets(k, k+1)
+        data = array('i')
+        data.fromstring(self._map[start:end])
+        if self._swap:
+            data.byteswap()
+        return _decode_fatgraph(data.tolist())
+
+    #@cython.locals(k1=cython.long, k2=cython.long)
+    #@cython.ccall(tuple)
+    def _offsets(self, k1, k2):
+        """Return the pair of file offsets of records `k1` and `k2`."""
+        return (struct.unpack_from(self._prefix + 'Q', self._map, self._index + 8*k1)[0],
+                struct.unpack_from(self._prefix + 'Q', self._map, self._index + 8*k2)[0])
+
+    #@cython.locals(b=cython.long, start=cython.long, end=cython.long,
+    #               checksum=cython.ulong, saved_checksum=cython.ulong)
+    #@cython.ccall
+    def _check_block(self, b):
+        """Verify the checksum of block `b`; raise `ValueError` if
+        it does not match.
+        """
+        (start, end) = self._offsets(b * self._block_size,
+                                     min((b+1) * self._block_size, self._count))
+        checksum = adler32(self._map[start:end]) & 0xffffffff
+        saved_checksum = struct.unpack_from(self._prefix + 'I', self._map,
+                                            self._checksums + 4*b)[0]
+        if checksum != saved_checksum:
+            raise ValueError("Computed checksum of block %d of file '%s' is 0x%x,"
+                             " but saved checksum is 0x%x"
+                             % (b, self.filename, checksum, saved_checksum))
+        self._checked.add(b)
+
+    #@cython.ccall
+    def close(self):
+        """Release the memory map of the file."""
+        self._map.close()
+
+
+#@cython.locals(filename=str, magic=str, graphs=FatgraphFile, error=Exception)
+#@cython.ccall(list)
+def load_graphs(filename):
+    """Return the list of fatgraphs saved into file `filename` by
+    `save_graphs`, or `None` if the file does not exist or is
+    corrupted.
+
+    Files in the text format written by `save` are also accepted.
+
+    Examples::
+
+      >>> import tempfile
+      >>> from rg import Fatgraph, Vertex
+      >>> (fd, path) = tempfile.mkstemp(suffix='.list'); os.close(fd)
+      >>> graphs = [ Fatgraph([Vertex([1, 2, 1]), Vertex([2, 0, 0])]),
+      ...            Fatgraph([Vertex([1, 0, 2]), Vertex([2, 0, 1])],
+      ...                     orientation=[2, 0, 1]) ]
+      >>> save_graphs(graphs, path, block_size=1)
+      >>> loaded = load_graphs(path)
+      >>> loaded
+      [Fatgraph([Vertex([1, 2, 1]), Vertex([2, 0, 0])]),
+       Fatgraph([Vertex([1, 0, 2]), Vertex([2, 0, 1])])]
+      >>> loaded[1].edge_numbering
+      [2, 0, 1]
+      >>> [ sorted(bcy) for bcy in loaded[1].boundary_cycles ] \\
+      ...   == [ sorted(bcy) for bcy in graphs[1].compute_boundary_cycles() ]
+      True
+      >>> FatgraphFile(path)[-1] == graphs[1]
+      True
+
+    A truncated file is detected and ignored::
+
+      >>> with open(path, 'r+b') as graphs_file:
+      ...     graphs_file.truncate(os.path.getsize(path) - 4)
+      >>> load_graphs(path) is None
+      True
+      >>> os.remove(path)
+    """
+    # the file may still be being written in the background
+    checkpoint_writer.wait(filename)
+    try:
+        with open(filename, 'rb') as graphs_file:
+            magic = graphs_file.read(len(_FGL_MAGIC))
+    except IOError, error:
+        if error.errno == 2: # No such file or directory
+            return None
+        else:
+            raise error
+    if magic != _FGL_MAGIC:
+        return load(filename)
+    try:
+        graphs = FatgraphFile(filename)
+    except (ValueError, struct.error), error:
+        logging.warning("%s.  Ignoring checkpoint file.", error)
+        return None
+    try:
+        return list(graphs)
+    except (ValueError, struct.error), error:
+        logging.warning("%s.  Ignoring checkpoint file.", error)
+        return None
+    finally:
+        graphs.close()
+
+
+#@cython.locals(filename=str, magic=str, error=Exception)
+#@cython.ccall
+def open_graphs(filename):
+    """Return a sequence of the fatgraphs saved into file `filename`,
+    or `None` if the file does not exist.
+
+    Unlike `load_graphs`, binary fatgraph list files are not read in
+    full: a `FatgraphFile` instance is returned, so that the number
+    of graphs is known at once, and single graphs are only decoded
+    when they are accessed.  Files in the text format written by
+    `save` are loaded into a list.  As with `load_graphs`, `None` is
+    also returned if the file is truncated or corrupted.
+
+    Examples::
+
+      >>> import tempfile
+      >>> from rg import Fatgraph, Vertex
+      >>> (fd, path) = tempfile.mkstemp(suffix='.list'); os.close(fd)
+      >>> save_graphs([ Fatgraph([Vertex([1, 2, 1]), Vertex([2, 0, 0])]) ], path)
+      >>> graphs = open_graphs(path)
+      >>> len(graphs)
+      1
+      >>> graphs.close()
+      >>> os.remove(path)
+      >>> open_graphs(path) is None
+      True
+    """
+    # the file may still be being written in the background
+    checkpoint_writer.wait(filename)
+    try:
+        with open(filename, 'rb') as graphs_file:
+            magic = graphs_file.read(len(_FGL_MAGIC))
+    except IOError, error:
+        if error.errno == 2: # No such file or directory
+            return None
+        else:
+            raise error
+    if magic != _FGL_MAGIC:
+        return load(filename)
+    try:
+        return FatgraphFile(filename)
+    except (ValueError, struct.error), error:
+        logging.warning("%s.  Ignoring graph list file.", error)
+        return None
+
+
+#@cython.locals(graphs=list, filename=str, block_size=cython.int,
+#               offsets=list, checksums=list, checksum=cython.ulong,
+#               pos=cython.long, k=cython.long, data=str,
+#               index=cython.long, tmpfile=str, error=Exception)
+#@cython.ccall
+def save_graphs(graphs, filename, block_size=FGL_BLOCK_SIZE):
+    """Save the fatgraphs in sequence `graphs` into file `filename`,
+    in the binary fatgraph list format (see `FatgraphFile`);
+    a checksum is stored for every `block_size` graphs.
+
+    The list is written to a temporary file, which is then renamed to
+    `filename`: if the process is interrupted, `filename` is either
+    left untouched or holds the complete list.
+    """
+    offsets = [ ]
+    checksums = [ ]
+    tmpfile = filename + '.tmp'
+    try:
+        with open(tmpfile, 'wb') as graphs_file:
+            # the number of graphs is filled in at the end
+            graphs_file.write(_FGL_HEADER.pack(_FGL_MAGIC, _FGL_VERSION, _FGL_BYTEORDER,
+                                               block_size, 0))
+            pos = _FGL_HEADER.size
+            checksum = 1
+            for (k, G) in enumerate(graphs):
+                if k > 0 and k % block_size == 0:
+                    checksums.append(checksum & 0xffffffff)
+                    checksum = 1
+                data = _encode_fatgraph(G).tostring()
+                offsets.append(pos)
+                graphs_file.write(data)
+                pos += len(data)
+                checksum = adler32(data, checksum)
+            if len(offsets) > 0:
+                checksums.append(checksum & 0xffffffff)
+            offsets.append(pos)
+            index = pos
+            graphs_file.write(struct.pack('=%dQ' % len(offsets), *offsets))
+            graphs_file.write(struct.pack('=%dI' % len(checksums), *checksums))
+            graphs_file.write(_FGL_TRAILER.pack(index, index + 8*len(offsets)))
+            graphs_file.seek(0)
+            graphs_file.write(_FGL_HEADER.pack(_FGL_MAGIC, _FGL_VERSION, _FGL_BYTEORDER,
+                                               block_size, len(offsets)-1))
+            graphs_file.flush()
+            os.fsync(graphs_file.fileno())
+        os.rename(tmpfile, filename)
+        # a checksum file left over from the text format would be stale
+        if os.path.exists(filename+".sum"):
+            os.remove(filename+".sum")
+    except Exception, error:
+        # remove partially-written file
+        try:
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+        except Exception, ex:
+            # log error and ignore it: must pass original exception to caller
+            logging.warning("Error removing temporary file '%s': %s",
+                            tmpfile, str(ex))
+        raise error
+
+
+
+# Partial fatgraph lists, written while a list is being generated,
+# are a sequence of chunks, each consisting of a header (see
+# `_FGC_HEADER`: magic string ``FGCK``, format version, byte order
+# mark, position in the generation process, number of graphs, length
+# and Adler-32 checksum of the payload), followed by the payload:
+# for each graph, the length of its record (see `_encode_fatgraph`)
+# and the record itself, all as 32-bit signed integers.
+_FGC_HEADER = struct.Struct('=4sIIQIQI')
+_FGC_MAGIC = 'FGCK'
+_FGC_VERSION = 1
+
+
+#@cython.locals(filename=str, position=cython.long, graphs=list,
+#               payload=object, record=object, data=str)
+#@cython.ccall
+def append_graphs_chunk(filename, position, graphs):
+    """Append a chunk with the fatgraphs in list `graphs` to the
+    partial fatgraph list file `filename`, recording `position` as
+    the point that generation of the list has reached.
+
+    The data is flushed to disk before returning, so that the chunk
+    survives if the process is killed; see `load_graphs_chunks`.
+    """
+    payload = array('i')
+    for G in graphs:
+        record = _encode_fatgraph(G)
+        payload.append(len(record))
+        payload.extend(record)
+    data = payload.tostring()
+    with open(filename, 'ab') as chunks_file:
+        chunks_file.write(_FGC_HEADER.pack(_FGC_MAGIC, _FGC_VERSION, _FGL_BYTEORDER,
+                                           position, len(graphs), len(data),
+                                           adler32(data) & 0xffffffff))
+        chunks_file.write(data)
+        chunks_file.flush()
+        os.fsync(chunks_file.fileno())
+
+
+#@cython.locals(filename=str, position=cython.long, graphs=list,
+#               valid=cython.long, header=str, data=str,
+#               magic=str, version=cython.int, byteorder=cython.int,
+#               pos=cython.long, count=cython.int, length=cython.long,
+#               checksum=cython.ulong, ints=list, k=cython.int, l=cython.int)
+#@cython.ccall(tuple)
+def load_graphs_chunks(filename):
+    """Return a pair `(position, graphs)`, where `graphs` is the list
+    of all fatgraphs in the chunks of the partial fatgraph list file
+    `filename` (see `append_graphs_chunk`), and `position` is the one
+    recorded with the last chunk.  If the file does not exist, return
+    `(0, [])`.
+
+    Reading stops at the first incomplete or corrupted chunk (as left
+    by a process killed while writing), and the file is truncated
+    there, so that further chunks can be appended to it.
+
+    Examples::
+
+      >>> import tempfile
+      >>> from rg import Fatgraph, Vertex
+      >>> (fd, path) = tempfile.mkstemp(suffix='.partial'); os.close(fd)
+      >>> append_graphs_chunk(path, 3, [Fatgraph([Vertex([1, 2, 1]), Vertex([2, 0, 0])])])
+      >>> append_graphs_chunk(path, 5, [Fatgraph([Vertex([1, 0, 2]), Vertex([2, 0, 1])])])
+      >>> with open(path, 'ab') as f: f.write('FGCK garbage')
+      >>> load_graphs_chunks(path)
+      (5, [Fatgraph([Vertex([1, 2, 1]), Vertex([2, 0, 0])]),
+           Fatgraph([Vertex([1, 0, 2]), Vertex([2, 0, 1])])])
+      >>> os.remove(path)
+      >>> load_graphs_chunks(path)
+      (0, [])
+    """
+    position = 0
+    graphs = [ ]
+    valid = 0
+    try:
+        chunks_file = open(filename, 'r+b')
+    except IOError, error:
+        if error.errno == 2: # No such file or directory
+            return (0, [ ])
+        else:
+            raise error
+    try:
+        while True:
+            header = chunks_file.read(_FGC_HEADER.size)
+            if len(header) < _FGC_HEADER.size:
+                break
+            (magic, version, byteorder, pos, count, length, checksum) = \
+                    _FGC_HEADER.unpack(header)
+            if (magic != _FGC_MAGIC or version != _FGC_VERSION
+                or byteorder != _FGL_BYTEORDER):
+                break
+            data = chunks_file.read(length)
+            if len(data) < length or (adler32(data) & 0xffffffff) != checksum:
+                break
+            ints = array('i')
+            ints.fromstring(data)
+            ints = ints.tolist()
+            k = 0
+            for dummy in xrange(count):
+                l = ints[k]
+                graphs.append(_decode_fatgraph(ints[k+1:k+1+l]))
+                k += 1 + l
+            position = pos
+            valid = chunks_file.tell()
+        if valid < os.fstat(chunks_file.fileno()).st_size:
+            logging.warning("Discarding incomplete data at the end of file '%s'", filename)
+            chunks_file.truncate(valid)
+    finally:
+        chunks_file.close()
+    return (position, graphs)
+
+
+
+## shared store of fatgraph lists
+
+#@cython.cclass
+class SharedStore(object):
+    """A directory where fatgraph lists are shared among several
+    concurrently-running computations.
+
+    Entries are addressed by their content: a key `(kind, g, n,
+    num_vertices)` (where `kind` is the name of the generating
+    function, e.g., ``'MgnTrivalentGraphsRecursiveGenerator'``),
+    together with the version of the fatgraph list file format, is
+    hashed into the entry file name.  Entries are never overwritten:
+    method `put` writes an entry only after creating a lock file
+    next to it (which fails if another process is already writing
+    the same entry), writes into a temporary file and then renames it
+    into place; therefore, any entry file found in the store is
+    complete, and can be read by `get` without locking.
+
+    Examples::
+
+      >>> import shutil, tempfile
+      >>> from rg import Fatgraph, Vertex
+      >>> store = SharedStore(tempfile.mkdtemp())
+      >>> key = ('MgnTrivalentGraphsRecursiveGenerator', 0, 3, 2)
+      >>> store.get(key) is None
+      True
+      >>> graphs = [ Fatgraph([Vertex([1, 2, 1]), Vertex([2, 0, 0])]) ]
+      >>> store.put(key, graphs)
+      True
+      >>> store.get(key)
+      [Fatgraph([Vertex([1, 2, 1]), Vertex([2, 0, 0])])]
+
+    An existing entry is not replaced::
+
+      >>> store.put(key, [ ])
+      False
+      >>> len(store.get(key))
+      1
+      >>> shutil.rmtree(store.path)
+    """
+
+    #@cython.locals(path=str)
+    def __init__(self, path):
+        self.path = path
+
+    #@cython.locals(key=tuple, digest=str)
+    #@cython.ccall(str)
+    def entry(self, key):
+        """Return the path name of the entry file for `key`."""
+        digest = hashlib.sha1("%s:%d,%d:%d:%d" % (key + (_FGL_VERSION,))).hexdigest()
+        return os.path.join(self.path, digest[:2], digest + '.fgl')
+
+    #@cython.locals(key=tuple, filename=str, graphs=list)
+    #@cython.ccall(list)
+    def get(self, key):
+        """Return the list of fatgraphs stored under `key`, or
+        `None` if there is no such entry.
+        """
+        filename = self.entry(key)
+        try:
+            graphs = load_graphs(filename)
+        except Exception, error:
+            logging.warning("Could not read shared store entry '%s': %s",
+                            filename, error)
+            return None
+        if graphs is not None:
+            logging.debug("  Loaded %d graphs for %s%s from shared store entry '%s'",
+                          len(graphs), key[0], key[1:], filename)
+        return graphs
+
+    #@cython.locals(key=tuple, graphs=list, filename=str, lockfile=str, tmpfile=str)
+    #@cython.ccall(bint)
+    def put(self, key, graphs):
+        """Store `graphs` under `key`.  Return `True` if the entry
+        has been written, `False` if it already exists or is being
+        written by another process.
+        """
+        filename = self.entry(key)
+        if os.path.exists(filename):
+            return False
+        try:
+            os.makedirs(os.path.dirname(filename))
+        except OSError, error:
+            if error.errno != errno.EEXIST:
+                raise
+        lockfile = filename + '.lock'
+        if not self._lock(lockfile):
+            logging.debug("  Shared store entry '%s' is locked by another process,"
+                          " not writing it.", filename)
+            return False
+        try:
+            if os.path.exists(filename):
+                return False
+            tmpfile = "%s.%s.%d.tmp" % (filename, socket.gethostname(), os.getpid())
+            save_graphs(graphs, tmpfile)
+            os.rename(tmpfile, filename)
+            logging.debug("  Saved %d graphs for %s%s into shared store entry '%s'",
+                          len(graphs), key[0], key[1:], filename)
+            return True
+        finally:
+            os.remove(lockfile)
+
+    #@cython.locals(lockfile=str, owner=str, host=str, pid=cython.int, fd=cython.int)
+    #@cython.cfunc(bint)
+    def _lock(self, lockfile):
+        """Create file `lockfile`, containing the host name and PID
+        of this process; return `False` if it already exists.  A
+        lock file left over by a process that no longer runs on this
+        host is removed.
+        """
+        owner = "%s:%d" % (socket.gethostname(), os.getpid())
+        try:
+            fd = os.open(lockfile, os.O_WRONLY|os.O_CREAT|os.O_EXCL, 0644)
+        except OSError, error:
+            if error.errno != errno.EEXIST:
+                raise
+            try:
+                with open(lockfile, 'r') as lock:
+                    (host, pid) = lock.read().strip().rsplit(':', 1)
+                    pid = int(pid)
+            except (IOError, ValueError):
+                # lock file is being written or has just been removed
+                return False
+            if host != socket.gethostname() or _process_exists(pid):
+                return False
+            logging.warning("Removing stale lock file '%s' (process %d is gone)",
+                            lockfile, pid)
+            try:
+                os.remove(lockfile)
+            except OSError:
+                return False
+            return self._lock(lockfile)
+        os.write(fd, owner + '\n')
+        os.close(fd)
+        return True
+
+
+#@cython.locals(pid=cython.int)
+#@cython.cfunc(bint)
+def _process_exists(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except OSError, error:
+        return (error.errno != errno.ESRCH)
+
+
+
+## sparse matrices
+
+# header of binary CSR matrix files; see `SimpleMatrix::saveBinary`
+# in file `simplematrix.hpp` for a description of the whole layout
+_CSR_HEADER = struct.Struct('=4sIIiiIQ')
+_CSR_MAGIC = 'FGSM'
+
+
+#@cython.locals(filename=str, header=str, line=str)
+#@cython.ccall(tuple)
+def matrix_dimensions(filename):
+    """Return the pair `(rows, columns)` of dimensions of the matrix
+    stored in file `filename`.
+
+    Both the binary CSR format and the text SMS format are supported;
+    raise `ValueError` if the file is in neither format.
+    """
+    with open(filename, 'rb') as matrix_file:
+        header = matrix_file.read(_CSR_HEADER.size)
+        if header.startswith(_CSR_MAGIC):
+            if len(header) < _CSR_HEADER.size:
+                raise ValueError("Truncated matrix file '%s'" % filename)
+            (magic, version, byteorder, rows, columns, padding, nnz) = \
+                    _CSR_HEADER.unpack(header)
+            return (rows, columns)
+        matrix_file.seek(0)
+        line = matrix_file.readline().split()
+        if len(line) == 3 and line[2] == 'M':
+            return (int(line[0]), int(line[1]))
+    raise ValueError("File '%s' is neither in binary CSR nor in SMS format"
+                     % filename)
+
+
+#@cython.locals(filename=str, rows=cython.int, columns=cython.int)
+#@cython.ccall
+def load_matrix(filename):
+    """Return a `SimpleMatrix` instance holding the matrix stored in
+    file `filename`, or `None` if the file cannot be loaded.
+
+    Both the binary CSR format and the text SMS format are supported.
+    """
+    from fatghol.simplematrix import SimpleMatrix
+    # the file may still be being written in the background
+    checkpoint_writer.wait(filename)
+    (rows, columns) = matrix_dimensions(filename)
+    A = SimpleMatrix(rows, columns)
+    if A.load(filename):
+        return A
+    else:
+        return None
+
+
+#@cython.locals(filename=str)
+#@cython.ccall
+def save_matrix(A, filename):
+    """Save matrix `A` into file `filename`.
+
+    The text SMS format is used if `filename` ends with ``.sms``,
+    otherwise the binary CSR format.
+    """
+    if filename.endswith('.sms'):
+        A.save(filename)
+    else:
+        A.saveBinary(filename)
+
+
+#@cython.locals(src=str, dst=str)
+#@cython.ccall
+def convert_matrix(src, dst):
+    """Convert matrix file `src` into `dst`.
+
+    The format of the source file is detected automatically, the
+    format of the destination file depends on its name (see
+    `save_matrix`).
+    """
+    A = load_matrix(src)
+    if A is None:
+        raise ValueError("Cannot load matrix from file '%s'" % src)
+    save_matrix(A, dst)
+
+
 ## main: run tests
 
 if "__main__" == __name__:
@@ -0,0 +1,361 @@
+#! /usr/bin/env python
+#
+"""
+Memory usage accounting.
+
+When enabled (see `enable`), the memory usage of the process is
+sampled whenever a stage timed with `fatghol.timing` starts or stops,
+and a census of the objects taking most memory is taken at the end of
+each layer of the computation (each list of graphs with a given
+number of vertices, each boundary operator): the number of live
+`Fatgraph` and `NumberedFatgraph` instances, the number of entries in
+each cache slot of `Caching` instances, and the number and approximate
+size of the sparse matrices held in memory.
+
+Python allocation statistics are also sampled if the `tracemalloc`
+module is available (it is part of the standard library only from
+Python 3.4).
+
+All samples are kept in memory and can be saved into a JSON file
+with `save_report`; censuses are also logged.
+
+A memory budget can be set with `set_budget`: `check_budget` then
+drops cached results when the process gets close to it, and
+`over_budget` tells callers when to keep large objects in scratch
+files (see `spill_file`) rather than in memory.
+"""
+#
+#   Copyright (C) 2008-2012 Riccardo Murri <riccardo.murri@gmail.com>
+#   All rights reserved.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+__docformat__ = 'reStructuredText'
+
+
+import atexit
+import gc
+import json
+import logging
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+import fatghol.cache as cache
+from fatghol.loadsave import checkpoint_writer
+import fatghol.timing as timing
+
+
+#: If `False`, `sample` and `census` do nothing.
+enabled = False
+
+#: Approximate memory taken by each non-zero entry of a `SimpleMatrix`
+#: (LinBox stores a column index and a multi-precision integer).
+MATRIX_ENTRY_BYTES = 32
+
+#: Number of allocation sites listed in each census, if `tracemalloc`
+#: is available.
+TOP_ALLOCATIONS = 10
+
+#: Memory samples taken so far; each one is a dictionary, see `sample`.
+samples = [ ]
+
+_started = time.time()
+
+
+def enable():
+    """Start sampling memory usage at stage boundaries, and taking a
+    census at the end of each layer of the computation.
+    """
+    global enabled
+    enabled = True
+    if tracemalloc is not None and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    timing.boundary_hook = _on_boundary
+
+
+def _on_boundary(label, event):
+    sample(label, event)
+
+
+def rss():
+    """Return the current resident set size of the process, in bytes;
+    if it cannot be determined, return the peak resident set size
+    instead.
+    """
+    try:
+        with open('/proc/self/statm', 'r') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except (IOError, IndexError, ValueError):
+        return maxrss()
+
+
+def maxrss():
+    """Return the peak resident set size of the process, in bytes."""
+    # `ru_maxrss` is in kilobytes on Linux (but bytes on MacOSX)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def sample(label, event):
+    """Record the memory usage at `event` of stage `label`, and return
+    the recorded sample.
+
+    A sample is a dictionary with keys `label`, `event`, `time`
+    (seconds since the program started), `rss` and `maxrss` (current
+    and peak resident set size, in bytes), and `traced` (pair of
+    current and peak size of Python allocations, if `tracemalloc` is
+    tracing them, otherwise `None`).
+    """
+    if not enabled:
+        return None
+    if tracemalloc is not None and tracemalloc.is_tracing():
+        traced = list(tracemalloc.get_traced_memory())
+    else:
+        traced = None
+    current = rss()
+    # `ru_maxrss` may lag behind the current RSS by a few pages
+    result = dict(label=label, event=event, time=time.time() - _started,
+                  rss=current, maxrss=max(current, maxrss()), traced=traced)
+    samples.append(result)
+    return result
+
+
+def census(label):
+    """Record memory usage and count the objects taking memory at the
+    end of layer `label` of the computation; log a summary.
+
+    The recorded sample (see `sample`) has the additional keys:
+
+    `objects`
+      map class names (``Fatgraph``, ``NumberedFatgraph``,
+      ``NumberedFatgraphPool``) to the number of their live instances;
+
+    `caches`
+      map each `Caching` slot name to the total number of cache
+      entries held in it; key ``_cache_isomorphisms.recorded`` counts
+      the isomorphisms recorded for replay;
+
+    `matrices`
+      dictionary with keys `count`, `nnz` and `bytes` for the sparse
+      matrices held in memory;
+
+    `allocations`
+      list of the allocation sites holding most memory, as triples
+      `(site, size, count)`, if `tracemalloc` is tracing allocations.
+    """
+    if not enabled:
+        return None
+    # import here to avoid circular imports
+    from fatghol.cache import Caching, _IteratorRecorder
+    from fatghol.graph_homology import NumberedFatgraph, NumberedFatgraphPool
+    from fatghol.rg import Fatgraph
+    from fatghol.simplematrix import SimpleMatrix
+
+    result = sample(label, 'layer')
+    objects = dict(Fatgraph=0, NumberedFatgraph=0, NumberedFatgraphPool=0)
+    caches = dict((slot, 0) for slot in Caching.__slots__)
+    caches['_cache_isomorphisms.recorded'] = 0
+    matrices = dict(count=0, nnz=0, bytes=0)
+    gc.collect()
+    for obj in gc.get_objects():
+        if isinstance(obj, Caching):
+            if isinstance(obj, NumberedFatgraph):
+                objects['NumberedFatgraph'] += 1
+            elif isinstance(obj, Fatgraph):
+                objects['Fatgraph'] += 1
+            for slot in Caching.__slots__:
+                try:
+                    cache = getattr(obj, slot)
+                except AttributeError:
+                    continue # with next `slot`
+                caches[slot] += len(cache)
+                if slot == '_cache_isomorphisms':
+                    for recorder in cache.values():
+                        if isinstance(recorder, _IteratorRecorder):
+                            caches['_cache_isomorphisms.recorded'] += len(recorder.history)
+        elif isinstance(obj, NumberedFatgraphPool):
+            objects['NumberedFatgraphPool'] += 1
+        elif isinstance(obj, SimpleMatrix):
+            matrices['count'] += 1
+            matrices['nnz'] += obj.nnz()
+    matrices['bytes'] = matrices['nnz'] * MATRIX_ENTRY_BYTES
+    result.update(objects=objects, caches=caches, matrices=matrices)
+    if tracemalloc is not None and tracemalloc.is_tracing():
+        stats = tracemalloc.take_snapshot().statistics('lineno')[:TOP_ALLOCATIONS]
+        result['allocations'] = [ (str(stat.traceback), stat.size, stat.count)
+                                  for stat in stats ]
+    logging.info("Memory at end of %s: RSS %s (peak %s);"
+                 " %d Fatgraph, %d NumberedFatgraph, %d NumberedFatgraphPool;"
+                 " cache entries: %s;"
+                 " %d matrices with %d non-zero entries (about %s)",
+                 label, _fmt_bytes(result['rss']), _fmt_bytes(result['maxrss']),
+                 objects['Fatgraph'], objects['NumberedFatgraph'],
+                 objects['NumberedFatgraphPool'],
+                 str.join(", ", [ ("%s=%d" % (slot, n)) for (slot, n) in sorted(caches.items()) ]),
+                 matrices['count'], matrices['nnz'], _fmt_bytes(matrices['bytes']))
+    return result
+
+
+def _fmt_bytes(n):
+    """Format a number of bytes for printing.
+
+    Examples::
+
+      >>> _fmt_bytes(512)
+      '512B'
+      >>> _fmt_bytes(3*1024*1024)
+      '3.0MB'
+    """
+    for (unit, size) in [('GB', 1024**3), ('MB', 1024**2), ('kB', 1024)]:
+        if n >= size:
+            return "%.1f%s" % (float(n) / size, unit)
+    return "%dB" % n
+
+
+def save_report(filename):
+    """Write all samples into file `filename`, in JSON format."""
+    with open(filename, 'w') as output:
+        json.dump(dict(samples=samples, tracemalloc=(tracemalloc is not None)),
+                  output, indent=1, sort_keys=True)
+
+
+def save_report_at_exit(filename):
+    """Arrange for `save_report` to be called when the program exits;
+    if that fails, just log an error.
+    """
+    def _save():
+        try:
+            save_report(filename)
+            logging.info("Memory usage report written to file '%s'", filename)
+        except Exception, error:
+            logging.error("Could not write memory usage report to file '%s': %s",
+                          filename, error)
+    atexit.register(_save)
+
+
+## memory budget
+
+#: Maximum memory (in bytes) the process should use; `None` means no
+#: limit.  Set it with `set_budget`.
+max_memory = None
+
+#: Fraction of `max_memory` above which cached results are dropped.
+HIGH_WATER = 0.85
+
+#: Fraction of `max_memory` down to which cached results are dropped.
+LOW_WATER = 0.70
+
+#: Minimum number of seconds between two checks of memory usage in
+#: `check_budget`.
+BUDGET_CHECK_INTERVAL = 1.0
+
+_next_check = 0
+
+_spill_dir = None
+
+
+def set_budget(mb):
+    """Set the memory budget to `mb` megabytes, and start tracking
+    cache usage so that cached results can be dropped when needed.
+    """
+    global max_memory
+    max_memory = mb * 1024 * 1024
+    cache.track_usage()
+
+
+def over_budget():
+    """Return `True` if a memory budget is set and the process is
+    using more than `HIGH_WATER` of it.
+    """
+    return (max_memory is not None and rss() > HIGH_WATER * max_memory)
+
+
+def check_budget(label, force=False):
+    """Keep memory usage within the budget set with `set_budget`, at
+    stage `label` of the computation.
+
+    If the process uses more than `HIGH_WATER` of the budget, cached
+    results are dropped, least-recently-used first, until the
+    estimated usage falls to `LOW_WATER` of it.  If the process uses
+    more than the whole budget and there were no cached results left
+    to drop, raise `MemoryError`.
+
+    Unless `force` is `True`, memory usage is actually checked at
+    most once every `BUDGET_CHECK_INTERVAL` seconds, so this can be
+    called from inner loops.
+    """
+    global _next_check
+    if max_memory is None:
+        return
+    now = time.time()
+    if now < _next_check and not force:
+        return
+    _next_check = now + BUDGET_CHECK_INTERVAL
+    used = rss()
+    if used < HIGH_WATER * max_memory:
+        return
+    freed = cache.evict(used - LOW_WATER * max_memory)
+    gc.collect()
+    if timing.enabled:
+        timing.count('memory.evictions')
+    logging.info("  %s: using %s of %s memory budget, dropped about %s of cached results",
+                 label, _fmt_bytes(used), _fmt_bytes(max_memory), _fmt_bytes(freed))
+    used = rss()
+    if used < max_memory or freed > 0:
+        # memory freed by the allocator is not necessarily returned
+        # to the OS, but it is reused before the process grows again
+        return
+    raise MemoryError("%s: using %s, which exceeds the memory budget of %s"
+                      % (label, _fmt_bytes(used), _fmt_bytes(max_memory)))
+
+
+def spill_file(name):
+    """Return the path of a scratch file called `name`, for keeping
+    data that does not fit in the memory budget.
+
+    Scratch files are created in a temporary directory, which is
+    removed when the program exits.
+    """
+    global _spill_dir
+    if _spill_dir is None:
+        _spill_dir = tempfile.mkdtemp(prefix='fatghol.spill.')
+        atexit.register(_remove_spill_dir)
+        logging.info("Keeping data in excess of the memory budget in directory '%s'",
+                     _spill_dir)
+    return os.path.join(_spill_dir, name)
+
+
+def _remove_spill_dir():
+    # scratch files may still be being written in the background
+    try:
+        checkpoint_writer.wait()
+    except Exception:
+        # error has already been logged
+        pass
+    shutil.rmtree(_spill_dir, ignore_errors=True)
+
+
+## main: run tests
+
+if "__main__" == __name__:
+    import doctest
+    doctest.testmod(name="memory",
+                    optionflags=doctest.NORMALIZE_WHITESPACE)
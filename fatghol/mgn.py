@@ -43,6 +43,7 @@ except ImportError:
 from collections import defaultdict
 from fractions import Fraction
 import gc
+import glob
 import logging
 import os
 import os.path
@@ -53,15 +54,26 @@ import tempfile
 ## application-local imports
 import fatghol
 from fatghol.const import euler_characteristics, orbifold_euler_characteristics
-from fatghol.combinatorics import minus_one_exp
+from fatghol.combinatorics import character, minus_one_exp
+from fatghol import estimate
 from fatghol.graph_homology import FatgraphComplex, NumberedFatgraphPool
-from fatghol.loadsave import load
+import fatghol.memory as memory
+from fatghol.loadsave import (
+    SharedStore,
+    checkpoint_writer,
+    convert_matrix,
+    load,
+    load_matrix,
+    )
 from fatghol.rg import (
+    ISOMORPHISMS_CACHE_SIZE,
     Fatgraph,
     MgnGraphsIterator,
+    isomorphisms_cache,
+    keep_trivalent_graphs,
+    release_trivalent_graphs,
     )
 from fatghol.runtime import runtime
-from fatghol.simplematrix import SimpleMatrix
 import fatghol.timing as timing
 from fatghol.utils import concat, positive_int
 from fatghol.valences import vertex_valences_for_given_g_and_n
@@ -76,7 +88,9 @@ def compute_graphs(g,n):
 
     Return a pair `(graphs, D)`, where `graphs` is the list of
     `(g,n)`-graphs, and `D` is a list, the `k`-th element of which is
-    the list of differentials of graphs with `k` edges.
+    the list of differentials of graphs with `k` edges.  Unless the
+    `isotypic` runtime option is set, the graph pools of `graphs` are
+    discarded once the boundary operators have been computed.
     """
     timing.start("compute_graphs(%d,%d)" % (g,n))
 
@@ -86,22 +100,48 @@ def compute_graphs(g,n):
     logging.info("Stage I:"
                  " Computing fat graphs for g=%d, n=%d ...",
                  g, n)
+    timing.start("FatgraphComplex(%d,%d)" % (g,n))
     G = FatgraphComplex(g,n)
+    timing.stop("FatgraphComplex(%d,%d)" % (g,n))
+    estimate.note_complex(G)
+    estimate.stage_done('graphs')
     
     logging.info("Stage II:"
                  " Computing matrix form of boundary operators D[1],...,D[%d] ...",
                  G.length-1)
-    D = G.compute_boundary_operators()
+    # graph pools are only needed afterwards to split the complex
+    # into isotypic components, otherwise free them as soon as possible
+    try:
+        isotypic = runtime.options.isotypic
+    except AttributeError:
+        isotypic = False
+    timing.start("compute_boundary_operators(%d,%d)" % (g,n))
+    D = G.compute_boundary_operators(discard=(not isotypic))
+    timing.stop("compute_boundary_operators(%d,%d)" % (g,n))
+    estimate.note_boundary(D)
+    estimate.stage_done('boundary')
+    if isomorphisms_cache.hit_rate() is not None:
+        logging.info("Isomorphism cache: %d entries, %d hits and %d misses (hit rate %.1f%%)",
+                     len(isomorphisms_cache), isomorphisms_cache.hits,
+                     isomorphisms_cache.misses, 100.0 * isomorphisms_cache.hit_rate())
 
     timing.stop("compute_graphs(%d,%d)" % (g,n))
     return (G, D)
 
     
-def compute_homology(g, n):
+def compute_homology(g, n, characters=None):
     """
     Compute homology ranks of the graph complex of `M_{g,n}`.
 
     Return array of homology ranks.
+
+    If the `isotypic` runtime option is set, the graph complex is
+    split into isotypic components for the action of the symmetric
+    group on the boundary cycle labels, and the homology of each
+    component is computed separately.  If `characters` is a list,
+    then it is filled with one dictionary per homology degree,
+    mapping each partition of `n` into the multiplicity of the
+    corresponding irreducible representation in the homology group.
     """
     timing.start("compute_homology(%d,%d)" % (g,n))
 
@@ -109,9 +149,73 @@ def compute_homology(g, n):
     runtime.n = n
 
     (G, D) = compute_graphs(g, n)
+    #: number of homology degrees; past the splitting into isotypic
+    #: components (which all have the same length), `D` is only used
+    #: for the dimensions of the chain modules
+    num_degrees = len(D)
+
+    try:
+        morse = runtime.options.morse
+    except AttributeError:
+        morse = False
+    try:
+        isotypic = runtime.options.isotypic
+    except AttributeError:
+        isotypic = False
+    try:
+        verify = runtime.options.verify
+    except AttributeError:
+        verify = False
+
+    if isotypic:
+        logging.info("Splitting the graph complex into isotypic components ...")
+        timing.start("compute_isotypic_boundary_operators(%d,%d)" % (g,n))
+        blocks = G.compute_isotypic_boundary_operators(D, n)
+        timing.stop("compute_isotypic_boundary_operators(%d,%d)" % (g,n))
+    else:
+        blocks = { None: D }
+
+    if morse:
+        logging.info("Reducing the graph complex by algebraic Morse matching ...")
+        timing.start("morse_reduce(%d,%d)" % (g,n))
+        for (la, component) in blocks.items():
+            blocks[la] = component.morse_reduce()
+        timing.stop("morse_reduce(%d,%d)" % (g,n))
 
     logging.info("Stage III: Computing rank of homology modules ...")
-    hs = list(reversed(D.compute_homology_ranks()))
+    timing.start("compute_homology_ranks(%d,%d)" % (g,n))
+    hs = [ 0 ] * num_degrees
+    if characters is not None:
+        del characters[:]
+        characters.extend(dict() for _ in xrange(num_degrees))
+    for (la, component) in sorted(blocks.items()):
+        if la is None:
+            # `M_{g,n}` is connected, so h_0=1; Harer's SLN1337,
+            # Theorem 7.1 gives h_1=0 when g>0.  Note that the complex
+            # is indexed in the reverse order w.r.t. the homology degree.
+            # Together with the null augmentation map, these determine
+            # the ranks of the last two matrices, so neither is computed
+            # (unless `--verify` is given).
+            known = { num_degrees-1: 1 }
+            if g > 0:
+                known[num_degrees-2] = 0
+            dim = 1
+        else:
+            # h_1=0 holds for every isotypic component; `H_0` is the
+            # trivial representation, but do not rely on it so that
+            # the splitting can be checked against known results
+            known = dict()
+            if g > 0:
+                known[num_degrees-2] = 0
+            dim = character(la, (1,)*n)
+            logging.info("  Isotypic component %s (dimension %d) ...",
+                         str.join(",", [ str(x) for x in la ]), dim)
+        for (i, h) in enumerate(reversed(component.compute_homology_ranks(known))):
+            hs[i] += dim * h
+            if la is not None and characters is not None and h > 0:
+                characters[i][la] = h
+    timing.stop("compute_homology_ranks(%d,%d)" % (g,n))
+    estimate.stage_done('ranks')
 
     timing.stop("compute_homology(%d,%d)" % (g,n))
 
@@ -125,10 +229,13 @@ def compute_homology(g, n):
         logging.error("Expected and computed orbifold Euler characteristics do not match!"
                       " (computed: %s, expected: %s)" % (computed_chi, expected_chi))
 
-    # compare Euler characteristics
+    # compare Euler characteristics; the alternating sum of the
+    # `h_i` equals that of the dimensions of the chain modules,
+    # whatever the ranks, so compute the latter: this checks the
+    # graph complex, not ranks that may have been derived from `known`
     computed_e = 0
-    for i in xrange(len(hs)):
-        computed_e += minus_one_exp(i)*hs[i]
+    for (i, (A, ddim, cdim)) in enumerate(reversed(D)):
+        computed_e += minus_one_exp(i)*cdim
     expected_e = euler_characteristics(g,n)
     logging.info("Computed Euler characteristics: %s" % computed_e)
     logging.info("  Expected Euler characteristics: %s" % expected_e)
@@ -139,7 +246,11 @@ def compute_homology(g, n):
     # verify result against other known theorems
     if g>0:
         # from Harer's SLN1337, Theorem 7.1
-        if hs[1] != 0:
+        if not verify:
+            # `h_1=0` was assumed above to derive a rank, so it cannot be checked
+            logging.info("Skipping check of Harer's Theorem 7.1 (h_1=0 when g>0):"
+                         " h_1 was not computed; use `--verify` to compute it.")
+        elif hs[1] != 0:
             logging.error("Harer's Theorem 7.1 requires h_1=0 when g>0")
         ## DISABLED 2009-03-27: Harer's statement seems to be incorrect,
         ## at least for low genus...
@@ -154,6 +265,155 @@ def compute_homology(g, n):
     return hs
 
 
+def trivalent_families(targets):
+    """
+    Return the list of pairs `(g,n)` such that the trivalent fatgraphs
+    of `M_{g,n}` are needed to generate those of `M_{g',n'}`, for each
+    `(g',n')` in `targets` (targets included).
+
+    Trivalent fatgraphs of `M_{g,n}` are generated from those of
+    `M_{g,n-1}` and `M_{g-1,n+1}`: the returned list is sorted so
+    that each family comes after the ones it is generated from.
+
+    Examples::
+
+      >>> trivalent_families([(1,2)])
+      [(0, 3), (1, 1), (1, 2)]
+      >>> trivalent_families([(0,5), (1,2)])
+      [(0, 3), (1, 1), (0, 4), (1, 2), (0, 5)]
+    """
+    families = set()
+    todo = list(targets)
+    while len(todo) > 0:
+        (g, n) = todo.pop()
+        if (g,n) in families or n <= 0 or (g,n) < (0,3):
+            continue # with next family
+        families.add((g,n))
+        if (g,n) not in [(0,3), (1,1)]:
+            todo.append((g, n-1))
+            todo.append((g-1, n+1))
+    # both families that `(g,n)` depends on have `2g+n` one less
+    return sorted(families, key=(lambda (g,n): (2*g+n, g)))
+
+
+def parse_targets(args):
+    """
+    Return the list of pairs `(g,n)` given by `args`.
+
+    Argument `args` is a list of alternating G and N values; each
+    value is either a non-negative integer, or an inclusive range
+    `A-B`.  Pairs for which `M_{g,n}` is not defined (i.e., `n=0`, or
+    `g=0` and `n<3`) are skipped.
+
+    Examples::
+
+      >>> parse_targets(['0', '3-5', '1-2', '1'])
+      [(0, 3), (0, 4), (0, 5), (1, 1), (2, 1)]
+    """
+    if len(args) % 2 != 0:
+        raise ValueError("expected pairs of G and N values, got '%s'"
+                         % str.join(" ", args))
+    def values(arg):
+        if '-' in arg:
+            (a, b) = arg.split('-', 1)
+            return range(int(a), int(b)+1)
+        else:
+            return [ int(arg) ]
+    targets = [ ]
+    for k in xrange(0, len(args), 2):
+        for g in values(args[k]):
+            for n in values(args[k+1]):
+                if g < 0 or n <= 0 or (g == 0 and n < 3):
+                    continue # with next `n`
+                if (g,n) not in targets:
+                    targets.append((g,n))
+    return targets
+
+
+def compute_homology_batch(targets, checkpoint_dir=None):
+    """
+    Compute homology ranks of the graph complexes of `M_{g,n}` for
+    all `(g,n)` in `targets`.
+
+    Iterate over tuples `(g, n, hs, characters)`, where `hs` and
+    `characters` are the homology ranks and the `S_n` characters (if
+    any) of `M_{g,n}`, as computed by `compute_homology`.  Targets
+    are processed in dependency order (see `trivalent_families`), and
+    the trivalent fatgraphs of each family are kept in memory from
+    when they are first generated until the last target needing them
+    is done: so, each family is generated (or loaded from a
+    checkpoint file) only once.
+
+    The computation state of all targets is saved into directory
+    `checkpoint_dir`, or, if this is `None`, into the default
+    checkpoint directory of each target (see
+    `default_checkpoint_dir`).
+    """
+    families = trivalent_families(targets)
+    order = [ T for T in families if T in targets ]
+    # last target needing each family
+    last = dict()
+    for T in order:
+        for F in trivalent_families([T]):
+            last[F] = T
+    for F in families:
+        keep_trivalent_graphs(*F)
+    try:
+        for (g, n) in order:
+            runtime.options.checkpoint_dir = (checkpoint_dir or default_checkpoint_dir(g,n))
+            logging.info("Computing homology of M_{%d,%d};"
+                         " saving computation state to directory '%s'",
+                         g, n, runtime.options.checkpoint_dir)
+            characters = [ ]
+            estimate.start_run(g, n)
+            hs = compute_homology(g, n, characters)
+            estimate.record_run(runtime.options.checkpoint_dir)
+            logging.info("Homology computation took %.3fs.",
+                         timing.get("compute_homology(%d,%d)" % (g,n)))
+            for F in families:
+                if last[F] == (g,n):
+                    release_trivalent_graphs(*F)
+            yield (g, n, hs, characters)
+    finally:
+        for F in families:
+            release_trivalent_graphs(*F)
+
+
+def default_checkpoint_dir(g, n):
+    """
+    Return the path name of the default checkpoint directory for
+    `M_{g,n}`, i.e., ``M<g>,<n>.data`` in the current directory;
+    create the directory if it does not exist.
+
+    Raise `ValueError` if the path exists but is not a directory.
+    """
+    path = os.path.join(os.getcwd(), "M%d,%d.data" % (g,n))
+    if not os.path.isdir(path):
+        if os.path.exists(path):
+            raise ValueError("Checkpoint path '%s' exists but is not a directory." % path)
+        os.mkdir(path)
+    return path
+
+
+def print_homology(outfile, g, n, hs, characters=None):
+    """
+    Write homology ranks `hs` of `M_{g,n}` to `outfile`, followed by
+    the decomposition of each non-null homology group into
+    irreducible `S_n` representations, if it is given in
+    `characters` (see `compute_homology`).
+    """
+    for (i, h) in enumerate(hs):
+        outfile.write("h_%d(M_{%d,%d}) = %d\n" % (i, g, n, h))
+        if h > 0 and characters and len(characters[i]) > 0:
+            terms = [ ]
+            for (la, m) in sorted(characters[i].items(), reverse=True):
+                rep = "[%s]" % str.join(",", [ str(x) for x in la ])
+                if m > 1:
+                    rep = ("%d*" % m) + rep
+                terms.append(rep)
+            outfile.write("  S_%d character: %s\n" % (n, str.join(" + ", terms)))
+
+
 def compute_valences(g,n):
     """
     Compute vertex valences occurring in g,n Fatgraphs.
@@ -169,21 +429,31 @@ def compute_valences(g,n):
 
 ## main
 
-def main():
-    # XXX: I cannot figure out why I have to re-import `os`
-    # here; it has already been imported at the start of the
-    # file ...
-    import os
-
-    # disable core dumps
-    resource.setrlimit(resource.RLIMIT_CORE, (0,0))
-
-    # parse command-line options
+def make_parser():
+    """Return the `argparse.ArgumentParser` instance used to parse
+    the command line of `main`.
+    """
     import argparse
     parser = argparse.ArgumentParser(
         description="""
     Actions:
 
+      batch G N [G N ...]
+        Print homology ranks of M_{g,n} for all the given G and N,
+        each of which can be a range A-B; the computation is done in
+        a single process, and the trivalent graphs shared by several
+        M_{g,n} are generated only once.
+
+      convert SRC DST
+        Convert the matrix file SRC into DST; files with extension `.sms`
+        are in SMS text format, all others in the binary CSR format.
+
+      estimate G N
+        Print estimates of the number of graphs, the size of the boundary
+        operators, and the time and memory needed to compute the homology
+        of M_{g,n}, based on smaller M_{g,n} and on the history of previous
+        runs found in checkpoint directories.
+
       graphs G N
         Generate the graphs occurring in M_{g,n}.
 
@@ -210,6 +480,18 @@ def main():
     parser.add_argument('args', metavar='ARG', nargs='*',
                         help="Arguments depend on the actual action, see above.")
     # option arguments
+    parser.add_argument("--check-complex", dest="check_complex", default='random',
+                        choices=['random', 'exact', 'none'], metavar="METHOD",
+                        help="""Check that the product of consecutive boundary operators is null,
+    using METHOD, which is one of:
+    * random -- apply the product to a few random vectors (default);
+    * exact -- compute the full sparse matrix product;
+    * none -- skip the check.""")
+    parser.add_argument("--checkpoint-interval", dest="checkpoint_interval", type=int,
+                        default=600, metavar="SECONDS",
+                        help="""While generating a list of graphs, save the graphs found
+    so far every SECONDS seconds, so that an interrupted run can resume
+    from there; 0 disables these intermediate checkpoints (default: 600).""")
     if not cython_compiled:
         parser.add_argument("-D", "--debug", nargs='?',
                             dest="debug", default=None, const='debug',
@@ -217,21 +499,168 @@ def main():
     * pydb -- run Python debugger if an error occurs
     * profile -- dump profiler statistics in a .pf file.
     Several features may be enabled by separating them
-    with a comma, as in '-D pydb,profile'.""")
+    with a comma, as in '-D pydb,profile'.
+    With any of these, internal consistency checks are also run,
+    which makes the computation considerably slower.""")
+    parser.add_argument("--isomorphism-cache", dest="isomorphism_cache", type=int,
+                        default=ISOMORPHISMS_CACHE_SIZE, metavar="SIZE",
+                        help="""Keep the isomorphisms between graphs of up to SIZE
+    isomorphism classes in a cache shared by all graphs in the same
+    class; 0 disables the cache (default: %d).""" % ISOMORPHISMS_CACHE_SIZE)
+    parser.add_argument("--isotypic", dest="isotypic", action="store_true", default=False,
+                        help="""Split the graph complex into isotypic components for the
+    action of the symmetric group on boundary cycle labels, and compute
+    the homology of each component separately; the `homology` action
+    then also prints the decomposition of each homology group into
+    irreducible representations.""")
+    parser.add_argument("-j", "--jobs", dest="jobs", type=positive_int, default=1,
+                        help="Compute up to JOBS matrix ranks concurrently.")
     parser.add_argument("-l", "--logfile",
                         action='store', dest='logfile', default=None,
                         help="""Redirect log messages to the named file
     (by default log messages are output to STDERR).""")
+    parser.add_argument("--max-memory", dest="max_memory", type=positive_int, default=None,
+                        metavar="MB",
+                        help="""Try to use no more than MB megabytes of memory: when close to
+    the limit, drop least-recently-used cached results, and move boundary
+    operator matrices into scratch files; abort if that is not enough.
+    Unless `--rank-memory` is given, rank computations are also scheduled
+    to stay within this limit.""")
+    parser.add_argument("--memory-stats", dest="memory_stats", nargs='?', default=None,
+                        const='', metavar="FILE",
+                        help="""Sample memory usage at the start and end of each stage of
+    the computation; at the end of each layer, also count live graphs,
+    cache entries and matrix entries, and log the counts.  All samples
+    are written as a JSON report into FILE when the program exits
+    (default: the output file name followed by `.memory.json`, or
+    `mgn.memory.json` if there is no output file).""")
+    parser.add_argument("--morse", dest="morse", action="store_true", default=False,
+                        help="""Shrink the graph complex by matching pairs of graphs
+    joined by a +1/-1 boundary coefficient (algebraic Morse theory)
+    before computing ranks.  Two consecutive boundary operators at a
+    time are held in memory as dictionaries, which take several times
+    the memory of the matrices themselves.""")
     parser.add_argument("-o", "--output", dest="outfile", default=None,
                         help="Save results into named file.")
+    parser.add_argument("--progress-interval", dest="progress_interval", type=int,
+                        default=60, metavar="SECONDS",
+                        help="""While generating graphs and assembling boundary operators,
+    log the progress made and the estimated time to completion every
+    SECONDS seconds; 0 disables these reports (default: 60).""")
+    parser.add_argument("--rank-backend", dest="rank_backend", default='linbox',
+                        choices=['linbox', 'resumable'], metavar="BACKEND",
+                        help="""Compute the rank of boundary operators using BACKEND,
+    which is one of:
+    * linbox -- LinBox sparse elimination (default);
+    * resumable -- sparse elimination modulo a large prime, which saves
+      its state periodically into the checkpoint directory, so that an
+      interrupted rank computation can resume from there.""")
+    parser.add_argument("--rank-checkpoint-interval", dest="rank_checkpoint_interval",
+                        type=int, default=3600, metavar="SECONDS",
+                        help="""With `--rank-backend resumable`, save the elimination
+    state every SECONDS seconds; 0 disables these intermediate
+    checkpoints (default: 3600).""")
+    parser.add_argument("--rank-memory", dest="rank_memory", type=positive_int, default=None,
+                        metavar="MB",
+                        help="""Do not start a new rank computation if the estimated memory
+    needed by all running ones would exceed MB megabytes.""")
+    parser.add_argument("--reorder", dest="reorder", default='none',
+                        choices=['none', 'degree'], metavar="METHOD",
+                        help="""Permute rows and columns of the boundary operators
+    before computing their rank, using METHOD, which is one of:
+    * none -- keep the order in which graphs are generated (default);
+    * degree -- sort columns by number of non-zero entries, and rows
+      by their leftmost entry, to limit fill-in during elimination.""")
     parser.add_argument("-s", "--checkpoint", dest="checkpoint_dir", default=None,
                         help="Directory for saving computation state.")
+    parser.add_argument("--shared-store", dest="shared_store", default=None, metavar="DIR",
+                        help="""Share graph lists with other concurrently-running jobs
+    through directory DIR: lists computed by other jobs are read from
+    there instead of being computed again.""")
+    parser.add_argument("--stats", dest="stats", nargs='?', default=None, const='',
+                        metavar="FILE",
+                        help="""Count isomorphism calls, cache hits and misses, facets
+    and edge contractions, and write them, together with the time
+    taken by each stage of the computation, as a JSON report into FILE
+    when the program exits (default: the output file name followed by
+    `.stats.json`, or `mgn.stats.json` if there is no output file).""")
+    parser.add_argument("--status-file", dest="status_file", default=None, metavar="FILE",
+                        help="""Also write each progress report (see `--progress-interval`)
+    into FILE, in JSON format, replacing its previous contents.""")
     parser.add_argument("-u", "--afresh", dest="restart", action="store_false", default=True,
                         help="Do NOT restart computation from the saved state in checkpoint directory.")
+    parser.add_argument("--verify", dest="verify", action="store_true", default=False,
+                        help="""Compute the rank of every boundary operator, even those
+    that can be derived from the known homology groups, and cross-check results.""")
     parser.add_argument("-v", "--verbose",
                         action="count", dest="verbose", default=0,
                         help="Print informational and status messages as the computation goes on.")
     parser.add_argument('-V', '--version', action='version', version=__version__)
+    return parser
+
+
+def configure(**options):
+    """Set runtime options for computing in-process, as if the
+    corresponding command-line options were given to `main`.
+
+    Options are given by keyword, using the names of the attributes
+    of the parsed command line (i.e., the long option name with
+    dashes replaced by underscores); all others take their default
+    value.  This allows using the functions in this module (e.g.,
+    `compute_homology`) from a Python program, without spawning an
+    external process::
+
+      >>> options = configure(checkpoint_dir=None, verbose=1)
+      >>> options.verbose
+      1
+      >>> compute_homology(0, 3)
+      [1, 0, 0]
+
+    An unknown option name raises `TypeError`::
+
+      >>> configure(no_such_option=1)
+      Traceback (most recent call last):
+        ...
+      TypeError: Unknown option 'no_such_option'
+
+    Unless option `checkpoint_dir` is given a directory name,
+    computation state is neither saved nor loaded.  Keyword argument `checks` sets
+    `runtime.checks`; by default, internal consistency checks are
+    disabled, as they are when running `main` without `-D`.
+
+    Return the options object, which is also made available to all
+    loaded modules as `runtime.options`.
+    """
+    checks = options.pop('checks', False)
+    cmdline = make_parser().parse_args(['help'])
+    cmdline.action = None
+    cmdline.args = [ ]
+    for (name, value) in options.iteritems():
+        if not hasattr(cmdline, name):
+            raise TypeError("Unknown option '%s'" % name)
+        setattr(cmdline, name, value)
+    if cmdline.checkpoint_dir is None:
+        # no checkpointing at all, see the `selftest` action in `main`
+        del cmdline.checkpoint_dir
+    runtime.options = cmdline
+    runtime.checks = checks
+    if cmdline.max_memory is not None:
+        memory.set_budget(cmdline.max_memory)
+    isomorphisms_cache.resize(cmdline.isomorphism_cache)
+    return cmdline
+
+
+def main():
+    # XXX: I cannot figure out why I have to re-import `os`
+    # here; it has already been imported at the start of the
+    # file ...
+    import os
+
+    # disable core dumps
+    resource.setrlimit(resource.RLIMIT_CORE, (0,0))
+
+    # parse command-line options
+    parser = make_parser()
     cmdline = parser.parse_args()
 
     # make options available to loaded modules
@@ -260,13 +689,9 @@ def main():
                         format="%(asctime)s [%(levelname)s] %(message)s",
                         datefmt="%H:%M:%S")
 
-    # ensure the proper optimization level is selected
-    if __debug__ and cmdline.debug is None:
-        try:
-            os.execl(sys.executable, *([sys.executable, '-O'] + sys.argv))
-        finally:
-            logging.warning("Could not execute '%s', ignoring '-O' option." 
-                            % str.join(" ", [sys.executable, '-O'] + sys.argv))
+    # internal consistency checks are costly: only run them when
+    # debugging (use `python -O` to also skip the cheap assertions)
+    runtime.checks = (__debug__ and not cython_compiled and cmdline.debug is not None)
 
     # enable optional features
     if not cython_compiled and cmdline.debug is not None:
@@ -286,7 +711,39 @@ def main():
                 logging.debug("Started call profiling with 'hotshot' module.")
             except ImportError:
                 logging.warning("Could not import 'hotshot' - call profiling *not* enabled.")
-
+    if cmdline.stats is not None:
+        if cmdline.stats == '':
+            cmdline.stats = (cmdline.outfile or 'mgn') + '.stats.json'
+        timing.enabled = True
+        timing.save_report_at_exit(cmdline.stats)
+    if cmdline.memory_stats is not None:
+        if cmdline.memory_stats == '':
+            cmdline.memory_stats = (cmdline.outfile or 'mgn') + '.memory.json'
+        memory.enable()
+        if memory.tracemalloc is None:
+            logging.info("Module 'tracemalloc' not available:"
+                         " Python allocations will not be traced.")
+        memory.save_report_at_exit(cmdline.memory_stats)
+    if cmdline.max_memory is not None:
+        memory.set_budget(cmdline.max_memory)
+    isomorphisms_cache.resize(cmdline.isomorphism_cache)
+
+
+    # convert -- convert matrix files between SMS and binary CSR format
+    # (do this before the 'N1,N2' hack below mangles file names)
+    if 'convert' == cmdline.action:
+        if len(cmdline.args) != 2:
+            parser.print_help()
+            sys.exit(1)
+        (src, dst) = cmdline.args
+        try:
+            convert_matrix(src, dst)
+        except (IOError, OverflowError, ValueError), error:
+            logging.error("Cannot convert matrix file '%s' into '%s': %s",
+                          src, dst, str(error))
+            sys.exit(1)
+        logging.info("Converted matrix file '%s' into '%s'", src, dst)
+        sys.exit(0)
 
     # hack to allow 'N1,N2,...' or 'N1 N2 ...' syntaxes
     for (i, arg) in enumerate(cmdline.args):
@@ -428,7 +885,30 @@ def main():
         if not ok:
             failures += 1
 
+        ## 4. run with the same temporary directory, reducing the
+        ## complex: homology ranks must be the same as computed directly
+        sys.stdout.write("Checking homology algorithm (Morse reduction)\n")
+
+        morse = runtime.options.morse
+        runtime.options.morse = True
+        ok = run_homology_selftest(sys.stdout)
+        if not ok:
+            failures += 1
+        runtime.options.morse = morse
+
+        ## 5. run with the same temporary directory, splitting the
+        ## complex into isotypic components
+        sys.stdout.write("Checking homology algorithm (isotypic components)\n")
+
+        isotypic = runtime.options.isotypic
+        runtime.options.isotypic = True
+        ok = run_homology_selftest(sys.stdout)
+        if not ok:
+            failures += 1
+        runtime.options.isotypic = isotypic
+
         # remove anything in the temporary directory
+        checkpoint_writer.wait()
         if failures == 0:
             for entry in os.listdir(runtime.options.checkpoint_dir):
                 os.remove(os.path.join(runtime.options.checkpoint_dir, entry))
@@ -441,44 +921,90 @@ def main():
         sys.exit(failures)
 
 
-    # common code for invocations of `graphs`, `homology` and `valences`
-    if len(cmdline.args) < 2:
-        parser.print_help()
-        sys.exit(1)
-    try:
-        g = int(cmdline.args[0])
-        if g < 0:
-            raise ValueError
-    except ValueError:
-        sys.stderr.write("Invalid value '%s' for argument G: " \
-                         "should be positive integer.\n" \
-                         % (cmdline.args[0],))
-        sys.exit(1)
-    try:
-        n = positive_int(cmdline.args[1])
-    except ValueError, msg:
-        sys.stderr.write("Invalid value '%s' for argument N: " \
-                         "should be non-negative integer.\n" \
-                         % (cmdline.args[1],))
-        sys.exit(1)
+    # common code for invocations of `estimate`, `graphs`, `homology`, `latex` and `valences`
+    if 'batch' != cmdline.action:
+        if len(cmdline.args) < 2:
+            parser.print_help()
+            sys.exit(1)
+        try:
+            g = int(cmdline.args[0])
+            if g < 0:
+                raise ValueError
+        except ValueError:
+            sys.stderr.write("Invalid value '%s' for argument G: " \
+                             "should be positive integer.\n" \
+                             % (cmdline.args[0],))
+            sys.exit(1)
+        try:
+            n = positive_int(cmdline.args[1])
+        except ValueError, msg:
+            sys.stderr.write("Invalid value '%s' for argument N: " \
+                             "should be non-negative integer.\n" \
+                             % (cmdline.args[1],))
+            sys.exit(1)
 
-    # make g,n available to loaded modules
-    runtime.g = g
-    runtime.n = n
+        # make g,n available to loaded modules
+        runtime.g = g
+        runtime.n = n
 
-    # ensure checkpoint path is defined and valid
-    if runtime.options.checkpoint_dir is None:
-        runtime.options.checkpoint_dir = os.path.join(os.getcwd(), "M%d,%d.data" % (g,n))
-        if not os.path.isdir(runtime.options.checkpoint_dir):
-            if os.path.exists(runtime.options.checkpoint_dir):
-                logging.error("Checkpoint path '%s' exists but is not a directory. Aborting.",
-                              runtime.options.checkpoint_dir)
+        # ensure checkpoint path is defined and valid
+        # (`estimate` only reads checkpoint directories)
+        if runtime.options.checkpoint_dir is None and 'estimate' != cmdline.action:
+            try:
+                runtime.options.checkpoint_dir = default_checkpoint_dir(g,n)
+            except ValueError, error:
+                logging.error("%s Aborting.", error)
                 sys.exit(1)
-            else:
-                os.mkdir(runtime.options.checkpoint_dir)
-    logging.info("Saving computation state to directory '%s'", runtime.options.checkpoint_dir)
+        if runtime.options.checkpoint_dir is not None:
+            logging.info("Saving computation state to directory '%s'",
+                         runtime.options.checkpoint_dir)
+    if runtime.options.shared_store is not None:
+        logging.info("Sharing graph lists with other jobs through directory '%s'",
+                     runtime.options.shared_store)
     if not runtime.options.restart:
-        logging.warning("NOT restarting: will ignore any saved state in checkpoint directory '%s'")
+        logging.warning("NOT restarting: will ignore any saved state in checkpoint directory.")
+
+
+    # batch -- compute homology ranks of several M_{g,n}
+    if 'batch' == cmdline.action:
+        try:
+            targets = parse_targets(cmdline.args)
+        except ValueError, error:
+            sys.stderr.write("Invalid arguments to 'batch': %s\n" % error)
+            sys.exit(1)
+        if len(targets) == 0:
+            parser.print_help()
+            sys.exit(1)
+        if runtime.options.checkpoint_dir is None:
+            # check all checkpoint paths before starting
+            for (g, n) in targets:
+                try:
+                    default_checkpoint_dir(g,n)
+                except ValueError, error:
+                    logging.error("%s Aborting.", error)
+                    sys.exit(1)
+        for (g, n, hs, characters) in compute_homology_batch(targets,
+                                                             runtime.options.checkpoint_dir):
+            print_homology(outfile, g, n, hs, characters)
+            outfile.flush()
+        if cmdline.outfile is not None:
+            logging.info("Results written to file '%s'" % cmdline.outfile)
+
+
+    # estimate -- predict size of the graph complex and resources needed
+    elif 'estimate' == cmdline.action:
+        dirs = glob.glob(os.path.join(os.getcwd(), 'M*,*.data'))
+        if runtime.options.checkpoint_dir is not None:
+            dirs.append(runtime.options.checkpoint_dir)
+        if runtime.options.shared_store is not None:
+            store = SharedStore(runtime.options.shared_store)
+        else:
+            store = None
+        # graphs generated for sampling need not be saved
+        del runtime.options.checkpoint_dir
+        estimate.estimate(g, n, dirs, store, outfile)
+        if cmdline.outfile is not None:
+            logging.info("Results written to file '%s'" % cmdline.outfile)
 
 
     # valences -- show vertex valences for given g,n
@@ -493,7 +1019,9 @@ def main():
     elif "graphs" == cmdline.action:
         logging.info("Will save graph list files into directory '%s'.",
                      runtime.options.checkpoint_dir)
+        estimate.start_run(g, n)
         graphs, D = compute_graphs(g,n)
+        estimate.record_run(runtime.options.checkpoint_dir)
         logging.info("Graph family computation took %.3fs.",
                      timing.get("compute_graphs(%d,%d)" % (g,n)))
 
@@ -501,13 +1029,15 @@ def main():
     # homology -- compute homology ranks
     elif 'homology' == cmdline.action:
         # compute graph complex and its homology ranks
-        hs = compute_homology(g, n)
+        characters = [ ]
+        estimate.start_run(g, n)
+        hs = compute_homology(g, n, characters)
+        estimate.record_run(runtime.options.checkpoint_dir)
         logging.info("Homology computation took %.3fs.",
                      timing.get("compute_homology(%d,%d)" % (g,n)))
 
         # print results
-        for (i, h) in enumerate(hs):
-            outfile.write("h_%d(M_{%d,%d}) = %d\n" % (i, g, n, h))
+        print_homology(outfile, g, n, hs, characters)
         if cmdline.outfile is not None:
             logging.info("Results written to file '%s'" % cmdline.outfile)
 
@@ -565,10 +1095,12 @@ def main():
             p = len(all_graphs[num_edges-1]) if (num_edges-1 in all_graphs) else 0
             q = len(all_graphs[num_edges]) if (num_edges in all_graphs) else 0
             r = num_edges - min_num_edges + 1
-            matrix_file = os.path.join(dir, ("M%d,%d-D%d.sms" % (g,n,r)))
-            if os.path.exists(matrix_file):
-                d = SimpleMatrix(p, q)
-                d.load(matrix_file)
+            d = None
+            for ext in ['csr', 'sms']:
+                matrix_file = os.path.join(dir, ("M%d,%d-D%d.%s" % (g,n,r,ext)))
+                if os.path.exists(matrix_file):
+                    d = load_matrix(matrix_file)
+                    break
 
             k0 = 0
             for j, G in enumerate(graphs):
@@ -616,6 +1148,12 @@ def main():
     except:
         pass
 
+    # wait for checkpoint files still being written
+    checkpoint_writer.wait()
+    logging.info("Writing checkpoint files took %.3fs (in the background;"
+                 " computation waited %.3fs for it)",
+                 checkpoint_writer.io_time, checkpoint_writer.wait_time)
+
     # print CPU time usage
     cputime_s = resource.getrusage(resource.RUSAGE_SELF)[0]
     seconds = cputime_s % 60
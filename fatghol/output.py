@@ -23,6 +23,7 @@ __docformat__ = 'reStructuredText'
 
 
 import datetime
+import itertools
 import os.path
 import tempita
 
@@ -236,8 +237,7 @@ class LaTeXOutput(object):
         """
         parts = [ r"$", (r"D(%s) = " % name) ]
         cnt = 0
-        for i in xrange(D.num_rows):
-            coeff = D.getEntry(i, j)
+        for (i, coeff) in itertools.izip(*D.column(j)):
             if coeff == 0:
                 continue # with next graph
             elif coeff == +1:
@@ -0,0 +1,169 @@
+#! /usr/bin/env python
+#
+"""
+Progress and ETA reports for long-running loops.
+
+A `Progress` instance is told, by calls to its `update` method, how
+many of the items in a loop have been processed so far; at most once
+every `progress_interval` seconds (a runtime option), it logs a line
+with the number of items done out of the total, any additional
+counters given to `update`, the current throughput and the estimated
+time to completion.  The throughput is averaged over the last few
+reports, so that the estimate follows changes in the cost per item::
+
+  >>> p = Progress("Test", 100, interval=0.001)
+  >>> time.sleep(0.01)
+  >>> p.update(50, accepted=10)
+  >>> p.last['done'], p.last['total'], p.last['accepted']
+  (50, 100, 10)
+
+If the `status_file` runtime option is set, each report is also
+written into that file, in JSON format, for external monitoring
+tools to poll; the file is replaced atomically, so it can be read at
+any time.
+"""
+#
+#   Copyright (C) 2008-2012 Riccardo Murri <riccardo.murri@gmail.com>
+#   All rights reserved.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+__docformat__ = 'reStructuredText'
+
+
+from collections import deque
+import json
+import logging
+import os
+import time
+
+from fatghol.runtime import runtime
+
+
+#: Default number of seconds between two progress reports.
+PROGRESS_INTERVAL = 60
+
+#: Number of past reports over which throughput is averaged.
+WINDOW = 10
+
+
+class Progress(object):
+    """Report progress of a loop over `total` items, labeled `label`.
+
+    Optional argument `done` is the number of items already
+    processed (e.g., by an interrupted run that is being resumed);
+    they do not count towards the throughput.  Optional argument
+    `interval` overrides the `progress_interval` runtime option; if
+    it is not positive, no report is ever made.
+    """
+
+    def __init__(self, label, total, done=0, interval=None):
+        self.label = label
+        self.total = total
+        if interval is None:
+            try:
+                interval = runtime.options.progress_interval
+            except AttributeError:
+                interval = PROGRESS_INTERVAL
+        self.interval = interval
+        try:
+            self.status_file = runtime.options.status_file
+        except AttributeError:
+            self.status_file = None
+        self.started = time.time()
+        if interval > 0:
+            self.next = self.started + interval
+        else:
+            self.next = float('inf')
+        #: pairs `(time, done)` of the last `WINDOW` reports
+        self.history = deque([(self.started, done)], WINDOW)
+        #: data of the last report
+        self.last = None
+
+    #@cython.locals(done=cython.long)
+    def update(self, done, **counters):
+        """Signal that `done` items out of the total have been
+        processed; additional keyword arguments are counters (e.g.,
+        the number of graphs accepted so far) to be reported.
+        """
+        now = time.time()
+        if now < self.next:
+            return
+        self.next = now + self.interval
+        (then, done0) = self.history[0]
+        if done == self.history[-1][1]:
+            return
+        self.history.append((now, done))
+        if now > then and done > done0:
+            rate = (done - done0) / (now - then)
+            eta = (self.total - done) / rate
+        else:
+            rate = None
+            eta = None
+        self.last = dict(label=self.label, done=done, total=self.total,
+                         rate=rate, eta=eta, elapsed=(now - self.started),
+                         updated=now, pid=os.getpid())
+        self.last.update(counters)
+        logging.info("  %s: %d/%d (%.1f%%)%s; %s",
+                     self.label, done, self.total,
+                     (100.0 * done / self.total) if self.total > 0 else 100.0,
+                     str.join("", [ (", %s %d" % (name, value))
+                                    for (name, value) in sorted(counters.items()) ]),
+                     ("%.1f/s, ETA %s" % (rate, _fmt_seconds(eta))) if rate else "ETA unknown")
+        if self.status_file:
+            self._write_status()
+
+    def _write_status(self):
+        # write a new file and rename it, so that readers never see a
+        # partially-written file
+        tmp = self.status_file + '.tmp'
+        try:
+            with open(tmp, 'w') as status:
+                json.dump(self.last, status, indent=1, sort_keys=True)
+            os.rename(tmp, self.status_file)
+        except (IOError, OSError), error:
+            logging.warning("Could not write status file '%s': %s",
+                            self.status_file, error)
+            self.status_file = None
+
+
+def _fmt_seconds(t):
+    """Format a duration in seconds for printing.
+
+    Examples::
+
+      >>> _fmt_seconds(42.1)
+      '42s'
+      >>> _fmt_seconds(3725)
+      '1h02m'
+      >>> _fmt_seconds(2*86400 + 7200)
+      '2d02h'
+    """
+    t = int(t + 0.5)
+    if t < 60:
+        return "%ds" % t
+    elif t < 3600:
+        return "%dm%02ds" % (t // 60, t % 60)
+    elif t < 86400:
+        return "%dh%02dm" % (t // 3600, (t % 3600) // 60)
+    else:
+        return "%dd%02dh" % (t // 86400, (t % 86400) // 3600)
+
+
+## main: run tests
+
+if "__main__" == __name__:
+    import doctest
+    doctest.testmod(name="progress",
+                    optionflags=doctest.NORMALIZE_WHITESPACE)
@@ -58,6 +58,16 @@ cdef class BoundaryCycle(frozenset):
 
 cpdef list MgnTrivalentGraphsRecursiveGenerator(int g, int n)
 
+cdef class _PartialList(object):
+    cdef int interval
+    cdef str filename
+    cdef long saved
+    cdef long position
+    cdef double last
+    cpdef tuple resume(self)
+    cpdef update(self, long k, list graphs)
+    cpdef remove(self)
+
 cdef class MgnGraphsIterator(BufferingIterator):
     cdef readonly int g
     cdef readonly int n
@@ -29,12 +29,14 @@ __docformat__ = 'reStructuredText'
 from collections import defaultdict, Iterator
 import logging
 import os.path
+import time
 
 ## application-local imports
 
 import fatghol
 from fatghol.cache import (
     Caching,
+    LRUCache,
     ocache0,
     ocache_contract,
     ocache_eq,
@@ -45,7 +47,16 @@ from fatghol.cyclicseq import CyclicList, CyclicTuple
 from fatghol.iterators import (
     BufferingIterator,
     )
-from fatghol.loadsave import load, save
+from fatghol.loadsave import (
+    append_graphs_chunk,
+    checkpoint_writer,
+    load_graphs,
+    load_graphs_chunks,
+    save_graphs,
+    SharedStore,
+    )
+import fatghol.memory as memory
+from fatghol.progress import Progress
 from fatghol.runtime import runtime
 import fatghol.timing as timing
 from fatghol.utils import (
@@ -58,6 +69,17 @@ from fatghol.utils import (
 
 ## main
 
+#: Default number of entries in `isomorphisms_cache`.
+ISOMORPHISMS_CACHE_SIZE = 10000
+
+#: Process-wide cache of `Fatgraph` isomorphisms: map the canonical
+#: form of a graph (see `Fatgraph.canonical_form`) to the list of its
+#: automorphisms, each one a triple `(pv, rot, pe)` of lists.  Unlike
+#: the per-graph cache of `Fatgraph.isomorphisms`, this is shared by
+#: all graphs in the same isomorphism class.
+isomorphisms_cache = LRUCache(ISOMORPHISMS_CACHE_SIZE)
+
+
 class BoundaryCycle(frozenset):
     """A boundary cycle of a Fatgraph.
 
@@ -202,13 +224,14 @@ class Isomorphism(object):
         assert len(pv) == target.num_vertices
         assert len(pe) == source.num_edges
         assert len(pe) == target.num_edges
-        assert set(pv.keys()) == set(range(source.num_vertices))
-        assert set(pv.values()) == set(range(target.num_vertices)), \
-               ("Got pv.values=%r but target.num_vertices=%r"
-                " (and target=%r): number of elements do not match!"
-                % (pv.values(), target.num_vertices, target))
-        assert set(pe.keys()) == set(range(source.num_edges))
-        assert set(pe.values()) == set(range(target.num_edges))
+        if runtime.checks:
+            assert set(pv.keys()) == set(range(source.num_vertices))
+            assert set(pv.values()) == set(range(target.num_vertices)), \
+                   ("Got pv.values=%r but target.num_vertices=%r"
+                    " (and target=%r): number of elements do not match!"
+                    % (pv.values(), target.num_vertices, target))
+            assert set(pe.keys()) == set(range(source.num_edges))
+            assert set(pe.values()) == set(range(target.num_edges))
 
         self.source = source
         self.target = target
@@ -399,7 +422,9 @@ class Fatgraph(EqualIfIsomorphic):
               >>> g1 = Fatgraph([Vertex([2,0,1]), Vertex([2,1,0])])
 
             Note that the list of vertices is assigned, *not copied*
-            into the instance variable.
+            into the instance variable.  Keyword arguments `edges`,
+            `orientation` and `boundary_cycles` can supply the
+            corresponding attributes, instead of computing them.
 
         or:
 
@@ -479,7 +504,11 @@ class Fatgraph(EqualIfIsomorphic):
             else:
                 self.edge_numbering = [ x for x in xrange(self.num_edges) ]
 
-            self.boundary_cycles = self.compute_boundary_cycles()
+            if 'boundary_cycles' in kwargs:
+                # e.g., when loading graphs from a checkpoint file
+                self.boundary_cycles = kwargs.get('boundary_cycles')
+            else:
+                self.boundary_cycles = self.compute_boundary_cycles()
             self.num_boundary_cycles = len(self.boundary_cycles)
 
             # by Euler, V-E+n=2-2*g
@@ -488,7 +517,8 @@ class Fatgraph(EqualIfIsomorphic):
 
         # before computing invariants, check that internal data
         # structures are in a consistent state
-        assert self.__ok()
+        if runtime.checks:
+            assert self.__ok()
 
         # used for isomorphism testing
         EqualIfIsomorphic.__init__(self, (
@@ -975,6 +1005,8 @@ class Fatgraph(EqualIfIsomorphic):
         """
         assert not self.is_loop(edge), \
                "Fatgraph.contract: cannot contract a loop."
+        if timing.enabled:
+            timing.count('contractions')
         assert (edge >= 0) and (edge < self.num_edges), \
                "Fatgraph.contract: invalid edge number (%d):"\
                " must be in range 0..%d" \
@@ -1097,7 +1129,7 @@ class Fatgraph(EqualIfIsomorphic):
             else:
                 # pass corner unchanged
                 new_bcy.append(corner)
-        if __debug__:
+        if runtime.checks:
             cnt = {}
             for corner in new_bcy:
                 try:
@@ -1145,10 +1177,11 @@ class Fatgraph(EqualIfIsomorphic):
                     orbits[x].update(orbits[y])
                     del orbits[y]
         # check that all elements lie in some orbit
-        assert sum(len(set(o)) for o in orbits.itervalues()) == self.num_edges, \
-               "Fatgraph.edge_orbits():" \
-               " Computed orbits `%s` do not exhaust edge set `%s`" \
-               " [%s.edge_orbits() -> %s]" % (orbits, range(self.num_edges), self, orbits)
+        if runtime.checks:
+            assert sum(len(set(o)) for o in orbits.itervalues()) == self.num_edges, \
+                   "Fatgraph.edge_orbits():" \
+                   " Computed orbits `%s` do not exhaust edge set `%s`" \
+                   " [%s.edge_orbits() -> %s]" % (orbits, range(self.num_edges), self, orbits)
         return orbits
 
 
@@ -1188,10 +1221,11 @@ class Fatgraph(EqualIfIsomorphic):
                     orbits[p].update(orbits[q])
                     del orbits[q]
         # check that all elements lie in some orbit
-        assert sum(len(set(o)) for o in orbits.itervalues()) == len(edge_pairs), \
-               "Fatgraph.edge_pair_orbits():" \
-               " Computed orbits `%s` do not exhaust edge pairs set `%s`" \
-               " [%s.edge_pair_orbits() -> %s]" % (orbits, edge_pairs, self, orbits)
+        if runtime.checks:
+            assert sum(len(set(o)) for o in orbits.itervalues()) == len(edge_pairs), \
+                   "Fatgraph.edge_pair_orbits():" \
+                   " Computed orbits `%s` do not exhaust edge pairs set `%s`" \
+                   " [%s.edge_pair_orbits() -> %s]" % (orbits, edge_pairs, self, orbits)
         return orbits
 
 
@@ -1394,7 +1428,66 @@ class Fatgraph(EqualIfIsomorphic):
           >>> g2 = Fatgraph([Vertex([1, 0, 5, 6]), Vertex([1, 0, 2]), Vertex([5, 2, 3]), Vertex([8, 4, 3]), Vertex([7, 7, 6]), Vertex([4, 8, 9, 9])])
           >>> len(list(Fatgraph.isomorphisms(g1, g2)))
           0
+
+        Isomorphisms are also cached process-wide, in
+        `isomorphisms_cache`: if `G1` and `G2` have different
+        canonical forms (see `canonical_form`), there are no
+        isomorphisms; otherwise, they are computed from the
+        automorphisms of the canonical form, if known, without any
+        search::
+
+          >>> G3 = Fatgraph([Vertex([0, 0, 1]), Vertex([2, 2, 1])])
+          >>> sorted(str(f) for f in G1.isomorphisms(G3))
+          ['({0: 0, 1: 1}, [2, 2], {0: 2, 1: 0, 2: 1})', '({0: 1, 1: 0}, [2, 2], {0: 0, 1: 2, 2: 1})']
+        """
+        if isomorphisms_cache.maxsize <= 0:
+            return G1._search_isomorphisms(G2)
+        (code1, c1) = G1.canonical_form()
+        (code2, c2) = G2.canonical_form()
+        if code1 != code2:
+            return iter([])
+        automorphisms = isomorphisms_cache.get(code1)
+        if timing.enabled:
+            timing.count('cache.isomorphisms_cache.hits' if automorphisms is not None
+                         else 'cache.isomorphisms_cache.misses')
+        if automorphisms is None:
+            # search for isomorphisms, and store them as automorphisms
+            # of the canonical form
+            result = list(G1._search_isomorphisms(G2))
+            valences1 = [ len(v) for v in G1.vertices ]
+            valences = [ 0 ] * G1.num_vertices
+            for (i, j) in enumerate(c1[0]):
+                valences[j] = valences1[i]
+            c1_inverse = _invert_relabelling(c1, valences1)
+            automorphisms = [ ]
+            for f in result:
+                f = ([ f.pv[i] for i in xrange(G1.num_vertices) ],
+                     f.rot,
+                     [ f.pe[x] for x in xrange(G1.num_edges) ])
+                automorphisms.append(
+                    _compose_relabellings(c2, _compose_relabellings(f, c1_inverse, valences),
+                                          valences))
+            isomorphisms_cache.put(code1, automorphisms)
+            return iter(result)
+        else:
+            valences1 = [ len(v) for v in G1.vertices ]
+            valences2 = [ len(v) for v in G2.vertices ]
+            c2_inverse = _invert_relabelling(c2, valences2)
+            result = [ ]
+            for a in automorphisms:
+                (pv, rot, pe) = _compose_relabellings(
+                    c2_inverse, _compose_relabellings(a, c1, valences1), valences1)
+                result.append(Isomorphism(G1, G2, Permutation(enumerate(pv)),
+                                          rot, Permutation(enumerate(pe))))
+            return iter(result)
+
+
+    def _search_isomorphisms(G1, G2):
+        """Iterate over `Fatgraph` isomorphisms from `G1` to `G2`,
+        searching for them; see `isomorphisms`.
         """
+        if timing.enabled:
+            timing.count('isomorphisms.calls')
         # if graphs differ in vertex valences, no isomorphisms
         vs1 = G1._valence_spectrum()
         vs2 = G2._valence_spectrum()
@@ -1410,6 +1503,8 @@ class Fatgraph(EqualIfIsomorphic):
         v1 = G1.vertices[v1_index]
         for v2_index in Fatgraph._compatible_vertices(v1, G2, indexes):
             for rot in xrange(valence):
+                if timing.enabled:
+                    timing.count('isomorphisms.seeds')
                 try:
                     # pass 0: init new (pv, rots, pe) triple
                     pv = Permutation()
@@ -1422,7 +1517,7 @@ class Fatgraph(EqualIfIsomorphic):
                         continue # to next `rot`
                     pv[v1_index] = v2_index
                     rots[v1_index] = rot
-                    if __debug__:
+                    if runtime.checks:
                         for x in v1:
                             assert x in pe, "Edge `%d` of vertex `%s` (in graph `%s`) not mapped to any edge of graph `%s` (at line 1740, `pe=%s`)" % (x, v1, G1, G2, pe)
 
@@ -1432,7 +1527,7 @@ class Fatgraph(EqualIfIsomorphic):
                         neighborhood = []
                         for (i1, i2, r) in nexts:
                             (pv, rots, pe) = Fatgraph._extend_map(pv, rots, pe, G1, i1, r, G2, i2)
-                            if __debug__:
+                            if runtime.checks:
                                 for x in G1.vertices[i1]:
                                     assert x in pe, "Edge `%d` of vertex `%s` (in graph `%s`) not mapped to any edge of graph `%s` (at line 1751, `pe=%s`)" % (x, G1.vertices[i1], G1, G2, pe)
                             neighborhood += Fatgraph._neighbors(pv, pe, G1, i1, G2, i2)
@@ -1445,6 +1540,101 @@ class Fatgraph(EqualIfIsomorphic):
                 # finally
                 yield Isomorphism(G1, G2, pv, rots, pe)
 
+    @ocache0
+    def canonical_form(self):
+        """Return a pair `(code, relabelling)`: `code` is the same for
+        all graphs isomorphic to this one (and only for them), and
+        `relabelling` is an isomorphism onto the *canonical form*, the
+        graph whose vertices are described by `code`.
+
+        The canonical form is obtained by renumbering vertices and
+        edges in the order they are reached by a breadth-first visit
+        of the graph, starting at a given vertex and position: `code`
+        is the smallest (in lexicographic order) of the sequences of
+        renumbered vertices, each one preceded by its valence, taken
+        over all the starting vertices returned by
+        `_starting_vertices` and all starting positions.  The
+        relabelling is a triple `(pv, rot, pe)` of lists, with the
+        same meaning as in `isomorphisms`.
+
+        Examples::
+
+          >>> G1 = Fatgraph([Vertex([2, 1, 1]), Vertex([2, 0, 0])])
+          >>> G1.canonical_form()
+          ((3, 0, 0, 1, 3, 1, 2, 2), ([0, 1], [2, 0], [2, 0, 1]))
+          >>> G2 = Fatgraph([Vertex([2, 2, 0]), Vertex([1, 1, 0])])
+          >>> G2.canonical_form()[0] == G1.canonical_form()[0]
+          True
+          >>> G3 = Fatgraph([Vertex([2, 1, 0]), Vertex([2, 0, 1])])
+          >>> G3.canonical_form()[0] == G1.canonical_form()[0]
+          False
+        """
+        (valence, starts) = self._starting_vertices()
+        best = None
+        for v0 in starts:
+            for r0 in xrange(valence):
+                result = self._relabel(v0, r0, best)
+                if result is not None:
+                    (best, relabelling) = result
+        return (tuple(best), relabelling)
+
+
+    #@cython.locals(v0=cython.int, r0=cython.int, best=list,
+    #               k=cython.int, v=cython.int, r=cython.int, l=cython.int,
+    #               i=cython.int, pos=cython.int, x=cython.int, n=cython.int,
+    #               smaller=cython.bint)
+    def _relabel(self, v0, r0, best):
+        """Return a pair `(code, relabelling)`, computed by a
+        breadth-first visit starting at position `r0` of vertex `v0`
+        (see `canonical_form`), or `None` if `code` is not smaller
+        than the sequence `best`.
+        """
+        vertices = self.vertices
+        edges = self.edges
+        pv = { v0:0 }
+        starting = { v0:r0 }
+        pe = dict()
+        order = [ v0 ]
+        code = [ ]
+        smaller = (best is None)
+        k = 0
+        while k < len(order):
+            v = order[k]
+            vertex = vertices[v]
+            r = starting[v]
+            l = len(vertex)
+            code.append(l)
+            for i in xrange(l):
+                pos = (r + i) % l
+                x = vertex[pos]
+                if x not in pe:
+                    pe[x] = len(pe)
+                    # the other end of edge `x` may be a new vertex
+                    ((a, pa), (b, pb)) = edges[x].endpoints
+                    if (a, pa) == (v, pos):
+                        (a, pa) = (b, pb)
+                    if a not in pv:
+                        pv[a] = len(order)
+                        starting[a] = pa
+                        order.append(a)
+                code.append(pe[x])
+            if not smaller:
+                # compare with the corresponding part of `best`
+                for n in xrange(len(code) - l - 1, len(code)):
+                    if code[n] < best[n]:
+                        smaller = True
+                        break
+                    elif code[n] > best[n]:
+                        return None
+            k += 1
+        if not smaller:
+            return None
+        return (code,
+                ([ pv[v] for v in xrange(len(vertices)) ],
+                 [ (-starting[v]) % len(vertices[v]) for v in xrange(len(vertices)) ],
+                 [ pe[x] for x in xrange(len(edges)) ]))
+
+
     ## auxiliary functions for `Fatgraph.isomorphism`
 
     @ocache0
@@ -1468,16 +1658,17 @@ class Fatgraph(EqualIfIsomorphic):
             l = len(vertex)
             result[l].append(index)
         # consistency checks
-        assert set(result.keys()) == set(self.vertex_valences()), \
-               "Fatgraph.valence_spectrum:" \
-               "Computed valence spectrum `%s` does not exhaust all " \
-               " vertex valences %s" \
-               % (result, self.vertex_valences())
-        assert set(concat(result.values())) \
-               == set(range(self.num_vertices)), \
-               "Fatgraph.valence_spectrum:" \
-               "Computed valence spectrum `%s` does not exhaust all " \
-               " %d vertex indices" % (result, self.num_vertices)
+        if runtime.checks:
+            assert set(result.keys()) == set(self.vertex_valences()), \
+                   "Fatgraph.valence_spectrum:" \
+                   "Computed valence spectrum `%s` does not exhaust all " \
+                   " vertex valences %s" \
+                   % (result, self.vertex_valences())
+            assert set(concat(result.values())) \
+                   == set(range(self.num_vertices)), \
+                   "Fatgraph.valence_spectrum:" \
+                   "Computed valence spectrum `%s` does not exhaust all " \
+                   " %d vertex indices" % (result, self.num_vertices)
         return result
 
     @ocache0
@@ -1637,7 +1828,75 @@ class Fatgraph(EqualIfIsomorphic):
         return frozenset(len(v) for v in self.vertices)
 
 
+
+#@cython.locals(g=tuple, f=tuple, valences=list)
+def _compose_relabellings(g, f, valences):
+    """Return the composition of `f` followed by `g`, where `f` and
+    `g` are triples `(pv, rot, pe)` of lists, as returned by
+    `Fatgraph.canonical_form`; `valences` is the list of vertex
+    valences of the source graph of `f`.
+
+    Examples::
+
+      >>> f = ([1, 0], [1, 0], [0, 2, 1])
+      >>> _compose_relabellings(f, f, [3, 3])
+      ([0, 1], [1, 1], [0, 1, 2])
+    """
+    (pv1, rot1, pe1) = f
+    (pv2, rot2, pe2) = g
+    return ([ pv2[j] for j in pv1 ],
+            [ (rot1[i] + rot2[j]) % valences[i] for (i, j) in enumerate(pv1) ],
+            [ pe2[y] for y in pe1 ])
+
+
+#@cython.locals(f=tuple, valences=list)
+def _invert_relabelling(f, valences):
+    """Return the inverse of `f`, a triple `(pv, rot, pe)` of lists
+    as returned by `Fatgraph.canonical_form`; `valences` is the list
+    of vertex valences of the source graph of `f`.
+
+    Examples::
+
+      >>> f = ([1, 0], [1, 0], [1, 2, 0])
+      >>> _invert_relabelling(f, [3, 3])
+      ([1, 0], [0, 2], [2, 0, 1])
+      >>> _compose_relabellings(_invert_relabelling(f, [3, 3]), f, [3, 3])
+      ([0, 1], [0, 0], [0, 1, 2])
+    """
+    (pv, rot, pe) = f
+    pv_ = [ 0 ] * len(pv)
+    rot_ = [ 0 ] * len(pv)
+    for (i, j) in enumerate(pv):
+        pv_[j] = i
+        rot_[j] = (-rot[i]) % valences[i]
+    pe_ = [ 0 ] * len(pe)
+    for (x, y) in enumerate(pe):
+        pe_[y] = x
+    return (pv_, rot_, pe_)
+
     
+#: Trivalent graphs of the families `(g,n)` that are kept in memory
+#: once generated (see `keep_trivalent_graphs`); the value is `None`
+#: until a family has been generated.
+_kept_trivalent_graphs = dict()
+
+
+def keep_trivalent_graphs(g, n):
+    """Keep the trivalent graphs of `M_{g,n}` in memory, once
+    generated, so that later calls to
+    `MgnTrivalentGraphsRecursiveGenerator(g,n)` need not generate
+    them (or load them from a checkpoint file) again.
+    """
+    _kept_trivalent_graphs.setdefault((g,n), None)
+
+
+def release_trivalent_graphs(g, n):
+    """Stop keeping the trivalent graphs of `M_{g,n}` in memory, see
+    `keep_trivalent_graphs`.
+    """
+    _kept_trivalent_graphs.pop((g,n), None)
+
+
 def MgnTrivalentGraphsRecursiveGenerator(g, n):
     """Return a list of all connected trivalent fatgraphs having the
     prescribed genus `g` and number of boundary cycles `n`.
@@ -1684,12 +1943,14 @@ def MgnTrivalentGraphsRecursiveGenerator(g, n):
         except AttributeError:
             # test run, `runtime.options` not defined
             checkpoint = None
+        store = _shared_store()
+        key = ('MgnTrivalentGraphsRecursiveGenerator', g, n, 4*g + 2*n - 4)
 
-        # try loading from file
-        unique = None
-        if checkpoint and runtime.options.restart:
+        # try the graphs kept in memory, then loading from file
+        unique = _kept_trivalent_graphs.get((g,n))
+        if unique is None and checkpoint and runtime.options.restart:
             try:
-                unique = load(checkpoint)
+                unique = load_graphs(checkpoint)
                 if unique is not None:
                     logging.debug("  Loaded %d trivalent graphs from file '%s'",
                                   len(unique), checkpoint)
@@ -1697,13 +1958,23 @@ def MgnTrivalentGraphsRecursiveGenerator(g, n):
                 logging.debug("  Could not load saved state from file '%s': %s",
                               checkpoint, error.message)
                 # ignore error and proceed
+        # try the graphs computed by another job
+        if unique is None and store is not None and runtime.options.restart:
+            unique = store.get(key)
 
         if unique is None:
-            # could not restore from saved state, have to compute
-            unique = [ ]
+            # could not restore from saved state, have to compute;
+            # maybe resume from the graphs found by an interrupted run
+            partial = _PartialList(checkpoint)
+            (start, unique) = partial.resume()
+            for G in unique:
+                yield G
             discarded = 0
             timing.start("MgnTrivalentGraphsRecursiveGenerator(%d,%d)" % (g,n))
-            for G in _MgnTrivalentGraphsRecursiveGenerator_main(g,n):
+            for (k, G) in _MgnTrivalentGraphsRecursiveGenerator_main(g,n, start):
+                # all candidates from the parent graphs before the
+                # `k`-th one have been processed
+                partial.update(k, unique)
                 # XXX: should this check be done in  *_main(g,n)?
                 if (G.genus, G.num_boundary_cycles) != (g,n) or (G in unique):
                     discarded += 1
@@ -1721,40 +1992,157 @@ def MgnTrivalentGraphsRecursiveGenerator(g, n):
                     G._cache_isomorphisms.clear() # XXX: private impl. detail!
                 except AttributeError:
                     pass
-            # save to checkpoint file (if defined)
-            if checkpoint:
-                save(unique, checkpoint)
+            # save to shared store or checkpoint file (if defined)
+            if checkpoint or store is not None:
+                checkpoint_writer.submit(checkpoint or store.entry(key), _save_graph_list,
+                                         unique, checkpoint, partial, store, key)
+            if (g,n) in _kept_trivalent_graphs:
+                _kept_trivalent_graphs[(g,n)] = unique
         else:
             # re-use loaded graphs
+            if (g,n) in _kept_trivalent_graphs:
+                _kept_trivalent_graphs[(g,n)] = unique
             for G in unique:
                 yield G
 
 
-def _MgnTrivalentGraphsRecursiveGenerator_main(g,n):
+def _MgnTrivalentGraphsRecursiveGenerator_main(g,n, start=0):
+    """Iterate over pairs `(k, G)`, where `G` is a candidate trivalent
+    graph, obtained from the `k`-th parent graph.
+
+    Parent graphs are numbered consecutively across the three passes
+    below; candidates are only generated from the parent graphs from
+    the `start`-th one onwards.
+    """
+    k = -1
     logging.debug("  MgnTrivalentGraphsRecursiveGenerator(%d,%d): "
                   "pass 1: hang a circle to all edges of graphs in M_{%d,%d} ..." % (g,n, g,n-1))
     for G in MgnTrivalentGraphsRecursiveGenerator(g,n-1):
+        k += 1
+        if k < start:
+            continue
         for x in G.edge_orbits():
-            yield G.hangcircle(x,0)
-            yield G.hangcircle(x,1)
+            yield (k, G.hangcircle(x,0))
+            yield (k, G.hangcircle(x,1))
 
     logging.debug("  MgnTrivalentGraphsRecursiveGenerator(%d,%d): "
                   "pass 2: bridge all edges of a single graph in M_{%d,%d} ..." % (g,n, g,n-1))
     for G in MgnTrivalentGraphsRecursiveGenerator(g,n-1):
+        k += 1
+        if k < start:
+            continue
         for (x,y) in G.edge_pair_orbits():
-                yield G.bridge(x,0, y,0)
-                yield G.bridge(x,0, y,1)
-                yield G.bridge(x,1, y,0)
-                yield G.bridge(x,1, y,1)
+                yield (k, G.bridge(x,0, y,0))
+                yield (k, G.bridge(x,0, y,1))
+                yield (k, G.bridge(x,1, y,0))
+                yield (k, G.bridge(x,1, y,1))
 
     logging.debug("  MgnTrivalentGraphsRecursiveGenerator(%d,%d): "
                   "pass 3: bridge all edges of a single graph in M_{%d,%d} ..." % (g,n, g-1,n+1))
     for G in MgnTrivalentGraphsRecursiveGenerator(g-1,n+1):
+        k += 1
+        if k < start:
+            continue
         for (x,y) in G.edge_pair_orbits():
-                yield G.bridge(x,0, y,0)
-                yield G.bridge(x,0, y,1)
-                yield G.bridge(x,1, y,0)
-                yield G.bridge(x,1, y,1)
+                yield (k, G.bridge(x,0, y,0))
+                yield (k, G.bridge(x,0, y,1))
+                yield (k, G.bridge(x,1, y,0))
+                yield (k, G.bridge(x,1, y,1))
+
+
+def _save_graph_list(graphs, checkpoint, partial, store=None, key=None):
+    """Save the complete list of `graphs` into the shared store
+    `store` under `key`, and only then remove the partial list file
+    of `partial`.
+
+    If there is no shared store, or the entry could not be written
+    there because another process is writing it, the list is saved
+    into file `checkpoint` instead (if it is not `None`).
+    """
+    if store is None or not store.put(key, graphs):
+        if checkpoint:
+            save_graphs(graphs, checkpoint)
+    partial.remove()
+
+
+def _shared_store():
+    """Return the `SharedStore` named by the `shared_store` runtime
+    option, or `None` if there is none.
+    """
+    try:
+        path = runtime.options.shared_store
+    except AttributeError:
+        # test run, `runtime.options` not defined
+        return None
+    if path is None:
+        return None
+    return SharedStore(path)
+
+
+class _PartialList(object):
+    """Periodically save the graphs found so far while generating a
+    list of graphs, so that the generation can be resumed if the
+    program is interrupted.
+
+    Graphs are generated from a sequence of parent graphs: calling
+    `update(k, graphs)` signals that all parent graphs before the
+    `k`-th one have been processed, and `graphs` is the list of
+    graphs found so far.  If more than `checkpoint_interval` seconds
+    (a runtime option) have elapsed since the last save, the graphs
+    found since then are appended, together with `k`, to the partial
+    list file, i.e., the checkpoint file name plus a ``.partial``
+    suffix.  Method `resume` returns the position and graphs saved
+    by a previous run, and `remove` deletes the partial list file
+    once the complete list has been saved.
+    """
+
+    def __init__(self, checkpoint):
+        try:
+            self.interval = runtime.options.checkpoint_interval
+        except AttributeError:
+            self.interval = 0
+        if checkpoint and self.interval > 0:
+            self.filename = checkpoint + '.partial'
+        else:
+            self.filename = None
+        self.saved = 0
+        self.position = 0
+        self.last = time.time()
+
+    def resume(self):
+        """Return a pair `(position, graphs)`: the graphs saved by an
+        interrupted run, and the index of the first parent graph
+        that was not processed.
+        """
+        if self.filename is None:
+            return (0, [ ])
+        if not runtime.options.restart:
+            self.remove()
+            return (0, [ ])
+        (self.position, graphs) = load_graphs_chunks(self.filename)
+        self.saved = len(graphs)
+        if self.position > 0:
+            logging.info("  Resuming from file '%s': %d graphs found so far,"
+                         " starting from parent graph #%d",
+                         self.filename, len(graphs), self.position)
+        return (self.position, graphs)
+
+    #@cython.locals(k=cython.long, graphs=list)
+    def update(self, k, graphs):
+        if self.filename is None or k == self.position:
+            return
+        self.position = k
+        if time.time() - self.last < self.interval:
+            return
+        append_graphs_chunk(self.filename, k, graphs[self.saved:])
+        logging.debug("  Saved %d more graphs into file '%s' (position: %d)",
+                      len(graphs) - self.saved, self.filename, k)
+        self.saved = len(graphs)
+        self.last = time.time()
+
+    def remove(self):
+        if self.filename is not None and os.path.exists(self.filename):
+            os.remove(self.filename)
 
     ## logging.debug("  MgnTrivalentGraphsRecursiveGenerator(%d,%d): "
     ##               "pass 4: bridge two graphs of such that g_1+g_2=%d, n_1+n_2=%d ..." % (g,n, g,n+1)) 
@@ -1843,12 +2231,14 @@ class MgnGraphsIterator(BufferingIterator):
         except AttributeError:
             # running a test, so no `runtime.options` defined
             checkpoint = None
+        store = _shared_store()
+        key = ('MgnGraphsIterator', self.g, self.n, self._num_vertices)
 
         # try loading `next_batch` from old persisted state
         next_batch = None
         if checkpoint and runtime.options.restart:
             try:
-                next_batch = load(checkpoint)
+                next_batch = load_graphs(checkpoint)
                 if next_batch is not None:
                     logging.info("  Loaded graphs with %d vertices from file '%s'",
                                  self._num_vertices, checkpoint)
@@ -1856,15 +2246,31 @@ class MgnGraphsIterator(BufferingIterator):
                 logging.debug("  Could not retrieve state from file '%s': %s",
                               checkpoint, error.message)
                 # ignore error, continue generating graphs
+        # try the graphs computed by another job
+        if next_batch is None and store is not None and runtime.options.restart:
+            next_batch = store.get(key)
+            if next_batch is not None:
+                logging.info("  Loaded graphs with %d vertices from shared store '%s'",
+                             self._num_vertices, store.path)
 
         if next_batch is None:
-            # really compute `next_batch`
+            # really compute `next_batch`; maybe resume from the
+            # graphs found by an interrupted run
             logging.debug("Generating graphs with %d vertices ...",
                          self._num_vertices)
             discarded = 0
-            next_batch = []
+            partial = _PartialList(checkpoint)
+            (start, next_batch) = partial.resume()
+            progress = Progress("Graphs with %d vertices, parent graphs processed"
+                                % self._num_vertices, len(self._batch), start)
             timing.start("MgnGraphsIterator: %d vertices" % self._num_vertices)
-            for graph in self._batch:
+            for (k, graph) in enumerate(self._batch):
+                if k < start:
+                    continue # with next `graph`
+                partial.update(k, next_batch)
+                progress.update(k, accepted=len(next_batch), discarded=discarded)
+                if memory.max_memory is not None:
+                    memory.check_budget("Graphs with %d vertices" % self._num_vertices)
                 # contract all edges
                 for edge in graph.edge_orbits():
                     if not graph.is_loop(edge):
@@ -1878,10 +2284,13 @@ class MgnGraphsIterator(BufferingIterator):
             logging.info("  Found %d distinct unique fatgraphs with %d vertices, discarded %d duplicates. (Elapsed: %.3fs)",
                          len(self._batch), self._num_vertices, discarded,
                          timing.get("MgnGraphsIterator: %d vertices" % self._num_vertices))
-            if checkpoint is not None:
-                save(next_batch, checkpoint)
-                
+            if checkpoint is not None or store is not None:
+                checkpoint_writer.submit(checkpoint or store.entry(key), _save_graph_list,
+                                         next_batch, checkpoint, partial, store, key)
+
         self._batch = next_batch
+        if memory.enabled:
+            memory.census("MgnGraphsIterator: %d vertices" % self._num_vertices)
         self._num_vertices -= 1
         return next_batch
 
@@ -44,6 +44,12 @@ class Monostate(object):
 
 runtime = Monostate()
 
+#: If `False`, the consistency checks in ``if runtime.checks:`` blocks
+#: are skipped.  By default, checks are run unless Python assertions
+#: are disabled (i.e., Python was started with the ``-O`` option);
+#: this can be changed at any time, without restarting the interpreter.
+runtime.checks = __debug__
+
 
 ## main: run tests
 
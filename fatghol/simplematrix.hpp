@@ -32,10 +32,23 @@
 #ifndef SIMPLE_HPP
 #define SIMPLE_HPP
 
+#include <algorithm>
 #include <cassert>
+#include <cstdio>
+#include <cstring>
 #include <fstream>
+#include <map>
+#include <stdexcept>
 #include <string>
 #include <iostream>
+#include <vector>
+
+#include <fcntl.h>
+#include <stdint.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <sys/time.h>
+#include <unistd.h>
 
 #ifdef FATGHOL_USE_RHEINFALL
 # include <rheinfall/rank.hpp>
@@ -61,9 +74,120 @@ public:
   /** Return the value of entry at row @a i and column @j */
   int getEntry(int const i, int const j) const;
 
+  /** Return number of non-zero entries stored in this matrix. */
+  unsigned long nnz(void) const;
+
+  /** Add entries @a values[k] at row @a rows[k] and column @a cols[k],
+      for each @a k; the three arrays must have the same length. */
+  void addToEntries(const int *rows, size_t const nrows,
+                    const int *cols, size_t const ncols,
+                    const int *values, size_t const nvalues);
+
+  /** Return number of non-zero entries in row @a i. */
+  unsigned long rowSize(int const i) const;
+
+  /** Return number of non-zero entries in column @a j. */
+  unsigned long columnSize(int const j) const;
+
+  /** Store column indices and values of the non-zero entries of row
+      @a i into the given arrays; return the number of entries stored. */
+  unsigned long getRowEntries(int const i,
+                              int *cols, size_t const ncols,
+                              int *values, size_t const nvalues) const;
+
+  /** Store row indices and values of the non-zero entries of column
+      @a j into the given arrays; return the number of entries stored. */
+  unsigned long getColumnEntries(int const j,
+                                 int *rows, size_t const nrows,
+                                 int *values, size_t const nvalues) const;
+
+  /** Store row indices, column indices and values of all non-zero
+      entries into the given arrays; return the number of entries stored. */
+  unsigned long getEntries(int *rows, size_t const nrows,
+                           int *cols, size_t const ncols,
+                           int *values, size_t const nvalues) const;
+
+  /** Label the connected components of the bipartite graph having
+   * rows and columns as vertices, and an edge joining row `i` to
+   * column `j` iff entry `(i,j)` is non-zero.
+   *
+   * Store into @a rows[i] the number of the component row `i`
+   * belongs to, and into @a cols[j] the one of column `j`; rows and
+   * columns with no non-zero entries are labeled `-1`.  Components
+   * are numbered from 0, in the order of their first row.  Return
+   * the number of components.
+   */
+  int getComponents(int *rows, size_t const nrows,
+                    int *cols, size_t const ncols) const;
+
+  /** Add the non-zero entries of row @a rows[k] of @a A to row @a k
+      of this matrix, moving each entry from column @a j to column @a
+      cols[j]; entries with negative @a cols[j] are not copied. */
+  void addRows(const SimpleMatrix &A,
+               const int *rows, size_t const nrows,
+               const int *cols, size_t const ncols);
+
   /** Return rank of this matrix. */
   unsigned long rank(void);
 
+  /** Strategies for computing the rank with `rankWith`. */
+  enum RankMethod {
+    RANK_PIVOT_LINEAR = 0, /**< LinBox sparse elimination, linear pivoting */
+    RANK_PIVOT_NONE = 1,   /**< LinBox sparse elimination, no pivoting */
+    RANK_BLACKBOX = 2      /**< LinBox default (black-box, as of 1.1.7) */
+  };
+
+  /** Return rank of this matrix, computed with strategy @a method
+   * (one of the `RankMethod` values), instead of the one chosen at
+   * compile time; used for comparing strategies on the same matrix.
+   *
+   * Throws `std::invalid_argument` if @a method is not known, or if
+   * LinBox is not used.
+   */
+  unsigned long rankWith(int const method);
+
+  /** Permute rows and columns to limit fill-in during elimination.
+   *
+   * Columns are sorted by increasing number of non-zero entries (a
+   * static approximation of minimum-degree ordering); rows are then
+   * sorted by the position of their leftmost non-zero entry, and
+   * rows with the same leftmost entry by increasing length, so that
+   * the matrix gets close to echelon form.  The rank is preserved,
+   * but entries are moved: any other use of the matrix after this
+   * call is meaningless.
+   */
+  void reorderByDegree(void);
+
+  /** Return rank of this matrix, computed by sparse Gaussian
+   * elimination modulo the prime @a ELIMINATION_MODULUS, saving the
+   * elimination state into file @a checkpoint every @a interval
+   * seconds (never, if @a interval is not positive).
+   *
+   * Rows are grouped by the column of their leftmost non-zero entry,
+   * and columns are processed left to right: one of the rows
+   * starting at the current column (the shortest one) is taken as
+   * pivot, and subtracted from the others, which then start at a
+   * later column; the pivot row is then dropped.  The elimination
+   * state consists of the index of the next column to process, the
+   * number of pivots found so far (the rank of the eliminated part)
+   * and the remaining rows, i.e., the active submatrix; see
+   * `saveElimination` for the file format.
+   *
+   * If file @a checkpoint holds a snapshot of the elimination of
+   * this same matrix, the computation resumes from there; a last
+   * snapshot, with no active rows left, is saved when the
+   * computation completes.  If @a checkpoint is `NULL`, nothing is
+   * saved or loaded.  The matrix itself is not modified.
+   *
+   * The rank modulo a prime equals the rank over the rationals,
+   * unless the prime divides all the maximal non-vanishing minors;
+   * for matrices with small entries (like the boundary operators of
+   * the graph complex) this is very unlikely.
+   *
+   * Throws `std::runtime_error` if a snapshot cannot be written.
+   */
+  unsigned long rankResumable(const char *const checkpoint, double const interval);
+
   const int num_rows;
   const int num_columns;
 
@@ -71,13 +195,140 @@ public:
   friend bool is_null_product(const SimpleMatrix &M1,
                               const SimpleMatrix &M2);
 
+  /** Return `false` if product of given matrices is certainly not
+      null, and `true` if it is null with high probability. */
+  friend bool is_null_product_randomized(const SimpleMatrix &M1,
+                                         const SimpleMatrix &M2,
+                                         int const trials,
+                                         unsigned long const seed);
+
   /** Dump entries to named file */
   void save(const char *const filename);
 
-  /** Load entries from named file.  Return true on successful load, and false on error. */
+  /** Load entries from named file.  Return true on successful load, and false on error.
+      Both the text SMS format and the binary CSR format (see `saveBinary`) are accepted. */
   bool load(const char *const filename);
 
+  /** Dump entries to named file, in binary CSR format.
+   *
+   * The file layout is as follows (all integers in native byte order):
+   *   - header: the 4 bytes "FGSM", then as 32-bit integers the
+   *     format version (1), the byte-order mark 0x01020304, the
+   *     number of rows, the number of columns and a zero padding
+   *     word; finally, the number of non-zero entries (64-bit);
+   *   - row offsets: `num_rows+1` 64-bit integers; the column indices
+   *     and values of entries in row `i` are stored at positions
+   *     `offsets[i]` to `offsets[i+1]-1` in the arrays below;
+   *   - column indices: one 32-bit integer per non-zero entry;
+   *   - values: one signed byte per non-zero entry;
+   *   - Adler-32 checksum of all the preceding bytes (32-bit).
+   *
+   * Throws `std::overflow_error` if an entry does not fit in a
+   * signed byte, and `std::runtime_error` on I/O errors.
+   */
+  void saveBinary(const char *const filename) const;
+
 private:
+  /** Load entries from named binary CSR file, by memory-mapping it.
+      Return true on successful load, and false on error. */
+  bool loadBinary(const char *const filename);
+
+  /** Update Adler-32 checksum @a sum with the given data. */
+  static uint32_t adler32(uint32_t const sum, const unsigned char *data, size_t const len);
+
+  /** Number of entries copied by `loadBinary` between two calls to `_dropPages`. */
+  static const uint64_t _DROP_PAGES_INTERVAL = 1 << 20;
+
+  /** Release the whole pages of the memory map starting at @a base
+      that lie between @a from and @a to. */
+  static void _dropPages(const unsigned char *const base,
+                         const void *const from, const void *const to);
+
+  /** Compare indices by the value they are associated to in @a key. */
+  struct _LessByKey {
+    _LessByKey(const std::vector<uint64_t> &key): key_(key) { };
+    bool operator()(int const a, int const b) const { return key_[a] < key_[b]; };
+    const std::vector<uint64_t> &key_;
+  };
+
+  /** Compare pairs by their first element only. */
+  struct _LessByFirst {
+    template <typename P>
+    bool operator()(const P &a, const P &b) const { return a.first < b.first; };
+  };
+
+  /** Modulus of the arithmetic used by `rankResumable`: the prime 2^31-1. */
+  static const uint32_t ELIMINATION_MODULUS = 2147483647u;
+
+  /** Sparse row of a matrix modulo @a ELIMINATION_MODULUS: pairs
+      (column, value) sorted by column, with non-zero values. */
+  typedef std::vector< std::pair<int32_t, uint32_t> > _ModularRow;
+  /** Rows of the active submatrix, grouped by their leftmost column. */
+  typedef std::vector< std::vector<_ModularRow> > _RowsByLeadingColumn;
+
+  struct _EliminationHeader {
+    char magic[4];
+    uint32_t version;
+    uint32_t byteorder;
+    uint32_t modulus;
+    int32_t num_rows;
+    int32_t num_columns;
+    uint32_t fingerprint;
+    int32_t column;
+    uint64_t rank;
+    uint64_t num_active;
+    uint64_t nnz;
+  };
+
+  /** Return a checksum of the entries of this matrix, used to tell
+      whether an elimination snapshot belongs to it. */
+  uint32_t fingerprint(void) const;
+
+  /** Save the elimination state into file @a filename.
+   *
+   * The file layout is as follows (all integers in native byte order):
+   *   - header: the 4 bytes "FGEL", then as 32-bit integers the
+   *     format version (1), the byte-order mark 0x01020304, the
+   *     modulus, the number of rows, the number of columns, the
+   *     fingerprint of the matrix and the index of the next column
+   *     to process; then, as 64-bit integers, the number of pivots
+   *     found so far, the number of active rows and their total
+   *     number of non-zero entries;
+   *   - for each active row, the number of its non-zero entries
+   *     (32-bit) followed by pairs of 32-bit integers (column, value);
+   *   - Adler-32 checksum of all the preceding bytes (32-bit).
+   *
+   * The state is written into a temporary file, which is then
+   * renamed to @a filename, so that @a filename always holds a
+   * complete snapshot.
+   */
+  void saveElimination(const char *const filename, uint32_t const fingerprint,
+                       int const column, unsigned long const rank,
+                       const _RowsByLeadingColumn &rows) const;
+
+  /** Load elimination state saved by `saveElimination` into @a
+      column, @a rank and @a rows.  Return false if the file does not
+      exist, is corrupted, or belongs to a different matrix. */
+  bool loadElimination(const char *const filename, uint32_t const fingerprint,
+                       int &column, unsigned long &rank,
+                       _RowsByLeadingColumn &rows) const;
+
+  /** Return the inverse of @a a modulo @a ELIMINATION_MODULUS. */
+  static uint32_t inverse(uint32_t const a);
+
+  /** Return the current time, in seconds since the epoch. */
+  static double now(void);
+
+  struct _BinaryHeader {
+    char magic[4];
+    uint32_t version;
+    uint32_t byteorder;
+    int32_t num_rows;
+    int32_t num_columns;
+    uint32_t padding;
+    uint64_t nnz;
+  };
+
 #ifdef FATGHOL_USE_RHEINFALL
   typedef std::pair< const int,long >                  _coord_and_val;
   typedef std::map< int, long, std::less<int> >    _simplerow;
@@ -154,6 +405,289 @@ SimpleMatrix::getEntry(int const i, int const j) const
 }
 
 
+inline
+unsigned long
+SimpleMatrix::nnz() const
+{
+  unsigned long count = 0;
+#ifdef FATGHOL_USE_RHEINFALL
+  for(_simplerows::const_iterator r = m.begin(); r != m.end(); ++r)
+    count += r->second.size();
+#else // use LinBox
+  for(_MatrixType::ConstRowIterator r = m.rowBegin(); r != m.rowEnd(); ++r)
+    count += r->size();
+#endif
+  return count;
+}
+
+
+inline
+void
+SimpleMatrix::addToEntries(const int *rows, size_t const nrows,
+                           const int *cols, size_t const ncols,
+                           const int *values, size_t const nvalues)
+{
+  if (nrows != ncols or nrows != nvalues)
+    throw std::invalid_argument("Arrays of row indices, column indices"
+                                " and values must have the same length");
+  for (size_t k = 0; k < nvalues; ++k) {
+    if (rows[k] < 0 or rows[k] >= num_rows or cols[k] < 0 or cols[k] >= num_columns)
+      throw std::out_of_range("Matrix index out of range");
+    addToEntry(rows[k], cols[k], values[k]);
+  };
+}
+
+
+inline
+unsigned long
+SimpleMatrix::rowSize(int const i) const
+{
+  if (i < 0 or i >= num_rows)
+    throw std::out_of_range("Row index out of range");
+#ifdef FATGHOL_USE_RHEINFALL
+  _simplerows::const_iterator r = m.find(i);
+  return (r == m.end()? 0 : r->second.size());
+#else // use LinBox
+  return (m.rowBegin() + i)->size();
+#endif
+}
+
+
+inline
+unsigned long
+SimpleMatrix::columnSize(int const j) const
+{
+  if (j < 0 or j >= num_columns)
+    throw std::out_of_range("Column index out of range");
+  unsigned long count = 0;
+#ifdef FATGHOL_USE_RHEINFALL
+  for(_simplerows::const_iterator r = m.begin(); r != m.end(); ++r)
+    count += r->second.count(j);
+#else // use LinBox
+  for(_MatrixType::ConstRowIterator r = m.rowBegin(); r != m.rowEnd(); ++r)
+    for (_MatrixType::Row::const_iterator x = r->begin(); x != r->end(); ++x)
+      if (static_cast<int>(x->first) == j)
+        ++count;
+#endif
+  return count;
+}
+
+
+inline
+unsigned long
+SimpleMatrix::getRowEntries(int const i,
+                            int *cols, size_t const ncols,
+                            int *values, size_t const nvalues) const
+{
+  if (ncols != nvalues)
+    throw std::invalid_argument("Arrays of column indices and values"
+                                " must have the same length");
+  if (rowSize(i) > nvalues)
+    throw std::length_error("Arrays too short to hold all entries of the row");
+  unsigned long k = 0;
+#ifdef FATGHOL_USE_RHEINFALL
+  _simplerows::const_iterator r = m.find(i);
+  if (r != m.end())
+    for (_simplerow::const_iterator x = r->second.begin(); x != r->second.end(); ++x, ++k) {
+      cols[k] = x->first;
+      values[k] = x->second;
+    };
+#else // use LinBox
+  _MatrixType::Row const& r = *(m.rowBegin() + i);
+  for (_MatrixType::Row::const_iterator x = r.begin(); x != r.end(); ++x, ++k) {
+    double value = 0;
+    ZZ.convert(value, x->second);
+    cols[k] = x->first;
+    values[k] = value;
+  };
+#endif
+  return k;
+}
+
+
+inline
+unsigned long
+SimpleMatrix::getColumnEntries(int const j,
+                               int *rows, size_t const nrows,
+                               int *values, size_t const nvalues) const
+{
+  if (nrows != nvalues)
+    throw std::invalid_argument("Arrays of row indices and values"
+                                " must have the same length");
+  if (columnSize(j) > nvalues)
+    throw std::length_error("Arrays too short to hold all entries of the column");
+  unsigned long k = 0;
+#ifdef FATGHOL_USE_RHEINFALL
+  for(_simplerows::const_iterator r = m.begin(); r != m.end(); ++r) {
+    _simplerow::const_iterator x = r->second.find(j);
+    if (x != r->second.end()) {
+      rows[k] = r->first;
+      values[k] = x->second;
+      ++k;
+    };
+  };
+#else // use LinBox
+  int i = 0;
+  for(_MatrixType::ConstRowIterator r = m.rowBegin(); r != m.rowEnd(); ++r, ++i)
+    for (_MatrixType::Row::const_iterator x = r->begin(); x != r->end(); ++x)
+      if (static_cast<int>(x->first) == j) {
+        double value = 0;
+        ZZ.convert(value, x->second);
+        rows[k] = i;
+        values[k] = value;
+        ++k;
+        break;
+      };
+#endif
+  return k;
+}
+
+
+inline
+unsigned long
+SimpleMatrix::getEntries(int *rows, size_t const nrows,
+                         int *cols, size_t const ncols,
+                         int *values, size_t const nvalues) const
+{
+  if (nrows != ncols or nrows != nvalues)
+    throw std::invalid_argument("Arrays of row indices, column indices"
+                                " and values must have the same length");
+  if (nnz() > nvalues)
+    throw std::length_error("Arrays too short to hold all entries of the matrix");
+  unsigned long k = 0;
+#ifdef FATGHOL_USE_RHEINFALL
+  for(_simplerows::const_iterator r = m.begin(); r != m.end(); ++r)
+    for (_simplerow::const_iterator x = r->second.begin(); x != r->second.end(); ++x, ++k) {
+      rows[k] = r->first;
+      cols[k] = x->first;
+      values[k] = x->second;
+    };
+#else // use LinBox
+  int i = 0;
+  for(_MatrixType::ConstRowIterator r = m.rowBegin(); r != m.rowEnd(); ++r, ++i)
+    for (_MatrixType::Row::const_iterator x = r->begin(); x != r->end(); ++x, ++k) {
+      double value = 0;
+      ZZ.convert(value, x->second);
+      rows[k] = i;
+      cols[k] = x->first;
+      values[k] = value;
+    };
+#endif
+  return k;
+}
+
+
+inline
+int
+SimpleMatrix::getComponents(int *rows, size_t const nrows,
+                            int *cols, size_t const ncols) const
+{
+  if (nrows < static_cast<size_t>(num_rows) or ncols < static_cast<size_t>(num_columns))
+    throw std::length_error("Arrays too short to hold labels of all rows and columns");
+
+  // union-find forest on rows (numbered `0..num_rows-1`) and columns
+  // (numbered `num_rows..num_rows+num_columns-1`)
+  std::vector<int> parent(num_rows + num_columns);
+  for (int k = 0; k < num_rows + num_columns; ++k)
+    parent[k] = k;
+  std::vector<bool> nonzero(num_rows + num_columns, false);
+#define FATGHOL_FIND_ROOT(root, k) \
+  root = (k); \
+  while (parent[root] != root) { \
+    parent[root] = parent[parent[root]]; \
+    root = parent[root]; \
+  }
+  int a, b;
+#ifdef FATGHOL_USE_RHEINFALL
+  for(_simplerows::const_iterator r = m.begin(); r != m.end(); ++r)
+    for(_simplerow::const_iterator x = r->second.begin(); x != r->second.end(); ++x) {
+      if (0 == x->second)
+        continue;
+      const int i = r->first;
+      const int j = num_rows + x->first;
+#else // use LinBox
+  int i = 0;
+  for(_MatrixType::ConstRowIterator r = m.rowBegin(); r != m.rowEnd(); ++r, ++i)
+    for (_MatrixType::Row::const_iterator x = r->begin(); x != r->end(); ++x) {
+      double value = 0;
+      ZZ.convert(value, x->second);
+      if (0 == value)
+        continue;
+      const int j = num_rows + x->first;
+#endif
+      nonzero[i] = nonzero[j] = true;
+      FATGHOL_FIND_ROOT(a, i);
+      FATGHOL_FIND_ROOT(b, j);
+      if (a != b)
+        parent[b] = a;
+    };
+
+  // number components in the order of their first row
+  std::vector<int> label(num_rows + num_columns, -1);
+  int count = 0;
+  for (int k = 0; k < num_rows + num_columns; ++k) {
+    if (not nonzero[k]) {
+      if (k < num_rows)
+        rows[k] = -1;
+      else
+        cols[k - num_rows] = -1;
+      continue;
+    };
+    FATGHOL_FIND_ROOT(a, k);
+    if (-1 == label[a])
+      label[a] = count++;
+    if (k < num_rows)
+      rows[k] = label[a];
+    else
+      cols[k - num_rows] = label[a];
+  };
+#undef FATGHOL_FIND_ROOT
+  return count;
+}
+
+
+inline
+void
+SimpleMatrix::addRows(const SimpleMatrix &A,
+                      const int *rows, size_t const nrows,
+                      const int *cols, size_t const ncols)
+{
+  if (nrows > static_cast<size_t>(num_rows))
+    throw std::length_error("More source rows than rows in destination matrix");
+  if (ncols < static_cast<size_t>(A.num_columns))
+    throw std::length_error("Column map shorter than number of columns in source matrix");
+  for (size_t k = 0; k < nrows; ++k) {
+    if (rows[k] < 0 or rows[k] >= A.num_rows)
+      throw std::out_of_range("Source row index out of range");
+#ifdef FATGHOL_USE_RHEINFALL
+    _simplerows::const_iterator r = A.m.find(rows[k]);
+    if (r == A.m.end())
+      continue;
+    for(_simplerow::const_iterator x = r->second.begin(); x != r->second.end(); ++x) {
+      const int j = cols[x->first];
+      if (j < 0 or 0 == x->second)
+        continue;
+      if (j >= num_columns)
+        throw std::out_of_range("Destination column index out of range");
+      addToEntry(k, j, x->second);
+    };
+#else // use LinBox
+    _MatrixType::ConstRowIterator r = A.m.rowBegin() + rows[k];
+    for (_MatrixType::Row::const_iterator x = r->begin(); x != r->end(); ++x) {
+      const int j = cols[x->first];
+      double value = 0;
+      ZZ.convert(value, x->second);
+      if (j < 0 or 0 == value)
+        continue;
+      if (j >= num_columns)
+        throw std::out_of_range("Destination column index out of range");
+      m.refEntry(k, j) += x->second;
+    };
+#endif
+  };
+}
+
+
 inline
 unsigned long
 SimpleMatrix::rank()
@@ -185,39 +719,694 @@ SimpleMatrix::rank()
 }
 
 
+inline
+unsigned long
+SimpleMatrix::rankWith(int const method)
+{
+#ifdef FATGHOL_USE_RHEINFALL
+  throw std::invalid_argument("Rank strategies can only be chosen when using LinBox");
+#else
+  if (method < RANK_PIVOT_LINEAR or method > RANK_BLACKBOX)
+    throw std::invalid_argument("Unknown rank computation strategy");
+  if (num_rows == 0 or num_columns == 0)
+    return 0;
+
+  unsigned long r;
+  if (RANK_BLACKBOX == method)
+    r = LinBox::rank(r, m);
+  else {
+    LinBox::Method::SparseElimination se;
+    se.strategy(RANK_PIVOT_LINEAR == method?
+                LinBox::Specifier::PIVOT_LINEAR : LinBox::Specifier::PIVOT_NONE);
+    r = LinBox::rank(r, m, se);
+  };
+  return r;
+#endif
+}
+
+
+inline
+void
+SimpleMatrix::reorderByDegree()
+{
+  if (num_rows == 0 or num_columns == 0)
+    return;
+
+  // order columns by increasing number of non-zero entries
+  std::vector<uint64_t> colsize(num_columns, 0);
+#ifdef FATGHOL_USE_RHEINFALL
+  for(_simplerows::const_iterator r = m.begin(); r != m.end(); ++r)
+    for(_simplerow::const_iterator x = r->second.begin(); x != r->second.end(); ++x)
+      ++colsize[x->first];
+#else // use LinBox
+  for(_MatrixType::ConstRowIterator r = m.rowBegin(); r != m.rowEnd(); ++r)
+    for (_MatrixType::Row::const_iterator x = r->begin(); x != r->end(); ++x)
+      ++colsize[x->first];
+#endif
+  std::vector<int> order(num_columns);
+  for (int j = 0; j < num_columns; ++j)
+    order[j] = j;
+  std::stable_sort(order.begin(), order.end(), _LessByKey(colsize));
+  std::vector<int> colperm(num_columns);
+  for (int k = 0; k < num_columns; ++k)
+    colperm[order[k]] = k;
+
+  // renumber columns, and order rows by leftmost entry and then by
+  // length; empty rows go last
+  std::vector<uint64_t> rowkey(num_rows,
+                               static_cast<uint64_t>(num_columns) * (num_columns + 1));
+#ifdef FATGHOL_USE_RHEINFALL
+  _simplerows renumbered;
+  for(_simplerows::const_iterator r = m.begin(); r != m.end(); ++r) {
+    _simplerow &row = renumbered[r->first];
+    for(_simplerow::const_iterator x = r->second.begin(); x != r->second.end(); ++x)
+      row[colperm[x->first]] = x->second;
+    if (not row.empty())
+      rowkey[r->first] = static_cast<uint64_t>(row.begin()->first) * (num_columns + 1) + row.size();
+  };
+#else // use LinBox
+  int i = 0;
+  for(_MatrixType::RowIterator r = m.rowBegin(); r != m.rowEnd(); ++r, ++i) {
+    for (_MatrixType::Row::iterator x = r->begin(); x != r->end(); ++x)
+      x->first = colperm[x->first];
+    std::sort(r->begin(), r->end(), _LessByFirst());
+    if (not r->empty())
+      rowkey[i] = static_cast<uint64_t>(r->front().first) * (num_columns + 1) + r->size();
+  };
+#endif
+  order.resize(num_rows);
+  for (int i = 0; i < num_rows; ++i)
+    order[i] = i;
+  std::stable_sort(order.begin(), order.end(), _LessByKey(rowkey));
+
+  // move rows to their new positions
+#ifdef FATGHOL_USE_RHEINFALL
+  m.clear();
+  for (int k = 0; k < num_rows; ++k) {
+    _simplerows::iterator r = renumbered.find(order[k]);
+    if (r != renumbered.end() and not r->second.empty())
+      m[k].swap(r->second);
+  };
+#else // use LinBox
+  std::vector<_MatrixType::Row> rows(num_rows);
+  for (int k = 0; k < num_rows; ++k)
+    rows[k].swap(*(m.rowBegin() + order[k]));
+  for (int k = 0; k < num_rows; ++k)
+    (m.rowBegin() + k)->swap(rows[k]);
+#endif
+}
+
+
+inline
+unsigned long
+SimpleMatrix::rankResumable(const char *const checkpoint, double const interval)
+{
+  if (num_rows == 0 or num_columns == 0)
+    return 0;
+
+  uint64_t const p = ELIMINATION_MODULUS;
+  uint32_t const sum = fingerprint();
+  _RowsByLeadingColumn rows(num_columns);
+  int column = 0;
+  unsigned long r = 0;
+  if (NULL == checkpoint or not loadElimination(checkpoint, sum, column, r, rows)) {
+    // start afresh: reduce entries modulo `p`
+    column = 0;
+    r = 0;
+    std::vector<int> cols;
+    std::vector<int> values;
+    for (int i = 0; i < num_rows; ++i) {
+      size_t const n = rowSize(i);
+      if (0 == n)
+        continue;
+      cols.resize(n);
+      values.resize(n);
+      getRowEntries(i, &cols[0], n, &values[0], n);
+      _ModularRow row;
+      row.reserve(n);
+      for (size_t k = 0; k < n; ++k) {
+        int64_t const v = ((values[k] % (int64_t)p) + p) % p;
+        if (0 != v)
+          row.push_back(std::make_pair(static_cast<int32_t>(cols[k]), static_cast<uint32_t>(v)));
+      };
+      if (row.empty())
+        continue;
+      std::sort(row.begin(), row.end(), _LessByFirst());
+      rows[row.front().first].push_back(_ModularRow());
+      rows[row.front().first].back().swap(row);
+    };
+  };
+
+  double last = now();
+  for (; column < num_columns; ++column) {
+    std::vector<_ModularRow> &bucket = rows[column];
+    if (bucket.empty())
+      continue;
+    // take the shortest row as pivot, to limit fill-in
+    size_t k0 = 0;
+    for (size_t k = 1; k < bucket.size(); ++k)
+      if (bucket[k].size() < bucket[k0].size())
+        k0 = k;
+    bucket[k0].swap(bucket.back());
+    const _ModularRow &pivot = bucket.back();
+    uint64_t const inv = inverse(pivot.front().second);
+    for (size_t k = 0; k+1 < bucket.size(); ++k) {
+      // subtract `f` times the pivot row, so that the leading entries cancel
+      const _ModularRow &row = bucket[k];
+      uint64_t const f = (row.front().second * inv) % p;
+      _ModularRow result;
+      result.reserve(row.size() + pivot.size() - 2);
+      _ModularRow::const_iterator x = row.begin() + 1;
+      _ModularRow::const_iterator y = pivot.begin() + 1;
+      while (x != row.end() or y != pivot.end()) {
+        if (y == pivot.end() or (x != row.end() and x->first < y->first)) {
+          result.push_back(*x);
+          ++x;
+        }
+        else {
+          uint64_t const fy = (f * y->second) % p;
+          uint64_t v = p - fy;
+          int32_t j = y->first;
+          if (x != row.end() and x->first == y->first) {
+            v = (x->second + v) % p;
+            ++x;
+          };
+          ++y;
+          if (0 != v)
+            result.push_back(std::make_pair(j, static_cast<uint32_t>(v)));
+        };
+      };
+      if (not result.empty()) {
+        std::vector<_ModularRow> &dest = rows[result.front().first];
+        dest.push_back(_ModularRow());
+        dest.back().swap(result);
+      };
+    };
+    ++r;
+    std::vector<_ModularRow>().swap(bucket);
+    if (NULL != checkpoint and interval > 0 and now() - last >= interval) {
+      saveElimination(checkpoint, sum, column+1, r, rows);
+      last = now();
+    };
+  };
+
+  if (NULL != checkpoint)
+    saveElimination(checkpoint, sum, num_columns, r, rows);
+  return r;
+}
+
+
+inline
+uint32_t
+SimpleMatrix::inverse(uint32_t const a)
+{
+  // extended Euclidean algorithm
+  int64_t t0 = 0, t1 = 1;
+  int64_t r0 = ELIMINATION_MODULUS, r1 = a;
+  while (r1 != 0) {
+    int64_t const q = r0 / r1;
+    int64_t tmp = r0 - q*r1; r0 = r1; r1 = tmp;
+    tmp = t0 - q*t1; t0 = t1; t1 = tmp;
+  };
+  if (t0 < 0)
+    t0 += ELIMINATION_MODULUS;
+  return static_cast<uint32_t>(t0);
+}
+
+
+inline
+double
+SimpleMatrix::now()
+{
+  struct timeval tv;
+  gettimeofday(&tv, NULL);
+  return tv.tv_sec + 1e-6 * tv.tv_usec;
+}
+
+
+inline
+uint32_t
+SimpleMatrix::fingerprint() const
+{
+  uint32_t sum = 1;
+  std::vector<int> cols;
+  std::vector<int> values;
+  for (int i = 0; i < num_rows; ++i) {
+    size_t const n = rowSize(i);
+    int32_t const header[2] = { i, static_cast<int32_t>(n) };
+    sum = adler32(sum, reinterpret_cast<const unsigned char*>(header), sizeof(header));
+    if (0 == n)
+      continue;
+    cols.resize(n);
+    values.resize(n);
+    getRowEntries(i, &cols[0], n, &values[0], n);
+    sum = adler32(sum, reinterpret_cast<const unsigned char*>(&cols[0]), n * sizeof(int));
+    sum = adler32(sum, reinterpret_cast<const unsigned char*>(&values[0]), n * sizeof(int));
+  };
+  return sum;
+}
+
+
+inline
+void
+SimpleMatrix::saveElimination(const char *const filename, uint32_t const fingerprint,
+                              int const column, unsigned long const rank,
+                              const _RowsByLeadingColumn &rows) const
+{
+  _EliminationHeader header;
+  std::memcpy(header.magic, "FGEL", 4);
+  header.version = 1;
+  header.byteorder = 0x01020304;
+  header.modulus = ELIMINATION_MODULUS;
+  header.num_rows = num_rows;
+  header.num_columns = num_columns;
+  header.fingerprint = fingerprint;
+  header.column = column;
+  header.rank = rank;
+  header.num_active = 0;
+  header.nnz = 0;
+  for (int j = column; j < num_columns; ++j)
+    for (std::vector<_ModularRow>::const_iterator row = rows[j].begin(); row != rows[j].end(); ++row) {
+      header.num_active += 1;
+      header.nnz += row->size();
+    };
+
+  std::string const tmpname = std::string(filename) + ".tmp";
+  std::ofstream output(tmpname.c_str(), std::ios::out | std::ios::binary | std::ios::trunc);
+  if (not output.is_open())
+    throw std::runtime_error("Cannot open file for writing");
+  uint32_t checksum = 1;
+  const char *chunk;
+  size_t len;
+#define FATGHOL_WRITE_CHUNK(ptr, nbytes) \
+  chunk = reinterpret_cast<const char*>(ptr); \
+  len = (nbytes); \
+  checksum = adler32(checksum, reinterpret_cast<const unsigned char*>(chunk), len); \
+  output.write(chunk, len);
+  FATGHOL_WRITE_CHUNK(&header, sizeof(header));
+  for (int j = column; j < num_columns; ++j)
+    for (std::vector<_ModularRow>::const_iterator row = rows[j].begin(); row != rows[j].end(); ++row) {
+      uint32_t const n = row->size();
+      FATGHOL_WRITE_CHUNK(&n, sizeof(n));
+      FATGHOL_WRITE_CHUNK(&(*row)[0], n * sizeof(_ModularRow::value_type));
+    };
+#undef FATGHOL_WRITE_CHUNK
+  // checksum is written last, so that a truncated file is detected
+  output.write(reinterpret_cast<const char*>(&checksum), sizeof(checksum));
+  output.close();
+  if (output.fail()) {
+    std::remove(tmpname.c_str());
+    throw std::runtime_error("Error writing elimination state file");
+  };
+  // make sure data is on disk before replacing the previous snapshot
+  int const fd = open(tmpname.c_str(), O_RDONLY);
+  if (fd >= 0) {
+    fsync(fd);
+    close(fd);
+  };
+  if (0 != std::rename(tmpname.c_str(), filename)) {
+    std::remove(tmpname.c_str());
+    throw std::runtime_error("Cannot rename elimination state file");
+  };
+}
+
+
+inline
+bool
+SimpleMatrix::loadElimination(const char *const filename, uint32_t const fingerprint,
+                              int &column, unsigned long &rank,
+                              _RowsByLeadingColumn &rows) const
+{
+  int fd = open(filename, O_RDONLY);
+  if (fd < 0)
+    return false;
+  struct stat st;
+  if (0 != fstat(fd, &st) or st.st_size < (off_t)(sizeof(_EliminationHeader) + sizeof(uint32_t))) {
+    close(fd);
+    return false;
+  };
+  size_t const size = st.st_size;
+  void *const map = mmap(NULL, size, PROT_READ, MAP_PRIVATE, fd, 0);
+  close(fd);
+  if (MAP_FAILED == map)
+    return false;
+  const unsigned char *const data = static_cast<const unsigned char*>(map);
+
+  bool ok = false;
+  _EliminationHeader header;
+  std::memcpy(&header, data, sizeof(header));
+  if (0 == std::memcmp(header.magic, "FGEL", 4)
+      and 1 == header.version
+      and 0x01020304 == header.byteorder
+      and ELIMINATION_MODULUS == header.modulus
+      and header.num_rows == num_rows
+      and header.num_columns == num_columns
+      and header.fingerprint == fingerprint
+      and header.column >= 0 and header.column <= num_columns
+      and size == (sizeof(_EliminationHeader)
+                   + header.num_active * sizeof(uint32_t)
+                   + header.nnz * sizeof(_ModularRow::value_type)
+                   + sizeof(uint32_t)))
+    {
+      uint32_t checksum;
+      std::memcpy(&checksum, data + size - sizeof(uint32_t), sizeof(uint32_t));
+      if (checksum == adler32(1, data, size - sizeof(uint32_t)))
+        ok = true;
+    };
+
+  if (ok) {
+    const unsigned char *pos = data + sizeof(_EliminationHeader);
+    for (uint64_t k = 0; k < header.num_active; ++k) {
+      uint32_t n;
+      std::memcpy(&n, pos, sizeof(n));
+      pos += sizeof(n);
+      _ModularRow row(n);
+      if (n > 0)
+        std::memcpy(&row[0], pos, n * sizeof(_ModularRow::value_type));
+      pos += n * sizeof(_ModularRow::value_type);
+      if (row.empty() or row.front().first < header.column or row.back().first >= num_columns) {
+        ok = false;
+        break;
+      };
+      rows[row.front().first].push_back(_ModularRow());
+      rows[row.front().first].back().swap(row);
+    };
+    if (ok) {
+      column = header.column;
+      rank = header.rank;
+    }
+    else
+      _RowsByLeadingColumn(num_columns).swap(rows);
+  };
+
+  munmap(map, size);
+  return ok;
+}
+
+
+/** Sparse product test: each row of @a A is multiplied by @a B,
+ * visiting only the non-zero entries of both matrices.
+ */
 inline
 bool
 is_null_product(const SimpleMatrix &A, const SimpleMatrix &B)
 {
   assert (A.num_columns == B.num_rows);
+  std::map<int, long> row;
 #ifdef FATGHOL_USE_RHEINFALL
-  for(int i=0; i<A.num_rows; i++) {
-    for (int j=0; j<B.num_columns; j++) {
-      long x = 0;
-      for (int k=0; k<A.num_columns; k++)
-        x += A.m.getEntry(i,k) * B.m.getEntry(k,j);
-      if (not (x == 0))
-        return false;
+  for(SimpleMatrix::_simplerows::const_iterator i = A.m.begin(); i != A.m.end(); ++i) {
+    row.clear();
+    for (SimpleMatrix::_simplerow::const_iterator k = i->second.begin(); k != i->second.end(); ++k) {
+      SimpleMatrix::_simplerows::const_iterator Bk = B.m.find(k->first);
+      if (Bk == B.m.end())
+        continue;
+      for (SimpleMatrix::_simplerow::const_iterator j = Bk->second.begin(); j != Bk->second.end(); ++j)
+        row[j->first] += k->second * j->second;
     };
+    for (std::map<int, long>::const_iterator x = row.begin(); x != row.end(); ++x)
+      if (not (x->second == 0))
+        return false;
   };
 #else // use LinBox
   assert (A.m.coldim() == B.m.rowdim());
-  SimpleMatrix::_CoefficientRingType ZZ;
-  for(int i=0; i<A.m.rowdim(); i++) {
-    for (int j=0; j<B.m.coldim(); j++) {
-      SimpleMatrix::_CoefficientRingType::Element x;
-      ZZ.init(x, 0);
-      for (int k=0; k<A.m.coldim(); k++)
-        x += A.m.getEntry(i,k) * B.m.getEntry(k,j);
-      if (not (x == 0))
+  for(SimpleMatrix::_MatrixType::ConstRowIterator i = A.m.rowBegin(); i != A.m.rowEnd(); ++i) {
+    row.clear();
+    for (SimpleMatrix::_MatrixType::Row::const_iterator k = i->begin(); k != i->end(); ++k) {
+      double a = 0;
+      A.ZZ.convert(a, k->second);
+      SimpleMatrix::_MatrixType::Row const& Bk = *(B.m.rowBegin() + k->first);
+      for (SimpleMatrix::_MatrixType::Row::const_iterator j = Bk.begin(); j != Bk.end(); ++j) {
+        double b = 0;
+        B.ZZ.convert(b, j->second);
+        row[j->first] += static_cast<long>(a) * static_cast<long>(b);
+      };
+    };
+    for (std::map<int, long>::const_iterator x = row.begin(); x != row.end(); ++x)
+      if (not (x->second == 0))
         return false;
-    }
-  }
+  };
+#endif
+  return true;
+}
+
+
+/** Freivalds' test: check that `A * (B * x) == 0 (mod p)` for @a
+ * trials random vectors `x`; the work is linear in the number of
+ * non-zero entries of @a A and @a B.  If the product is not null,
+ * each trial detects it with probability at least `1 - 1/p`, where
+ * `p` is the prime 2^31-1.
+ */
+inline
+bool
+is_null_product_randomized(const SimpleMatrix &A, const SimpleMatrix &B,
+                           int const trials, unsigned long const seed)
+{
+  assert (A.num_columns == B.num_rows);
+  const unsigned long long p = 2147483647ULL; // 2^31-1
+  // xorshift64 pseudo-random generator; state must be non-zero
+  unsigned long long state = seed? seed : 88172645463325252ULL;
+  std::vector<unsigned long long> x(B.num_columns), y(B.num_rows);
+  for (int t = 0; t < trials; ++t) {
+    for (int j = 0; j < B.num_columns; ++j) {
+      state ^= state << 13;
+      state ^= state >> 7;
+      state ^= state << 17;
+      x[j] = state % p;
+    };
+    // y = B * x (mod p)
+    std::fill(y.begin(), y.end(), 0);
+#ifdef FATGHOL_USE_RHEINFALL
+    for(SimpleMatrix::_simplerows::const_iterator k = B.m.begin(); k != B.m.end(); ++k)
+      for (SimpleMatrix::_simplerow::const_iterator j = k->second.begin(); j != k->second.end(); ++j)
+        y[k->first] = (y[k->first] + ((j->second % (long)p + p) % p) * x[j->first]) % p;
+#else // use LinBox
+    int k = 0;
+    for(SimpleMatrix::_MatrixType::ConstRowIterator Bk = B.m.rowBegin(); Bk != B.m.rowEnd(); ++Bk, ++k)
+      for (SimpleMatrix::_MatrixType::Row::const_iterator j = Bk->begin(); j != Bk->end(); ++j) {
+        double b = 0;
+        B.ZZ.convert(b, j->second);
+        y[k] = (y[k] + ((static_cast<long long>(b) % (long long)p + p) % p) * x[j->first]) % p;
+      };
+#endif
+    // z = A * y (mod p), must be null
+#ifdef FATGHOL_USE_RHEINFALL
+    for(SimpleMatrix::_simplerows::const_iterator i = A.m.begin(); i != A.m.end(); ++i) {
+      unsigned long long z = 0;
+      for (SimpleMatrix::_simplerow::const_iterator k = i->second.begin(); k != i->second.end(); ++k)
+        z = (z + ((k->second % (long)p + p) % p) * y[k->first]) % p;
+      if (z != 0)
+        return false;
+    };
+#else // use LinBox
+    for(SimpleMatrix::_MatrixType::ConstRowIterator i = A.m.rowBegin(); i != A.m.rowEnd(); ++i) {
+      unsigned long long z = 0;
+      for (SimpleMatrix::_MatrixType::Row::const_iterator k = i->begin(); k != i->end(); ++k) {
+        double a = 0;
+        A.ZZ.convert(a, k->second);
+        z = (z + ((static_cast<long long>(a) % (long long)p + p) % p) * y[k->first]) % p;
+      };
+      if (z != 0)
+        return false;
+    };
 #endif
+  };
   return true;
 }
 
 
+inline
+uint32_t
+SimpleMatrix::adler32(uint32_t const sum, const unsigned char *data, size_t const len)
+{
+  const uint32_t base = 65521;
+  // largest `n` such that 255n(n+1)/2 + (n+1)(base-1) <= 2^32-1: the
+  // sums can grow for this many bytes before they must be reduced
+  // modulo `base` (same as zlib's `NMAX`)
+  const size_t nmax = 5552;
+  uint32_t a = sum & 0xffff;
+  uint32_t b = (sum >> 16) & 0xffff;
+  size_t k = 0;
+  while (k < len) {
+    size_t const end = std::min(len, k + nmax);
+    for (; k < end; ++k) {
+      a += data[k];
+      b += a;
+    };
+    a %= base;
+    b %= base;
+  };
+  return (b << 16) | a;
+}
+
+
+inline
+void
+SimpleMatrix::_dropPages(const unsigned char *const base,
+                         const void *const from, const void *const to)
+{
+  size_t const page = sysconf(_SC_PAGESIZE);
+  size_t const start = (static_cast<const unsigned char*>(from) - base + page - 1) / page * page;
+  size_t const end = (static_cast<const unsigned char*>(to) - base) / page * page;
+  if (start < end)
+    madvise(const_cast<unsigned char*>(base) + start, end - start, MADV_DONTNEED);
+}
+
+
+inline
+bool
+SimpleMatrix::loadBinary(const char *const filename)
+{
+  int fd = open(filename, O_RDONLY);
+  if (fd < 0)
+    return false;
+  struct stat st;
+  if (0 != fstat(fd, &st) or st.st_size < (off_t)(sizeof(_BinaryHeader) + sizeof(uint32_t))) {
+    close(fd);
+    return false;
+  };
+  size_t const size = st.st_size;
+  void *const map = mmap(NULL, size, PROT_READ, MAP_PRIVATE, fd, 0);
+  close(fd);
+  if (MAP_FAILED == map)
+    return false;
+  // the file is read front to back, twice: once for the checksum,
+  // and once to copy the entries
+  madvise(map, size, MADV_SEQUENTIAL);
+  const unsigned char *const data = static_cast<const unsigned char*>(map);
+
+  bool ok = false;
+  _BinaryHeader header;
+  std::memcpy(&header, data, sizeof(header));
+  if (0 == std::memcmp(header.magic, "FGSM", 4)
+      and 1 == header.version
+      and 0x01020304 == header.byteorder
+      and header.num_rows == num_rows
+      and header.num_columns == num_columns
+      and size == (sizeof(_BinaryHeader)
+                   + (num_rows + 1) * sizeof(uint64_t)
+                   + header.nnz * (sizeof(uint32_t) + sizeof(int8_t))
+                   + sizeof(uint32_t)))
+    {
+      uint32_t checksum;
+      std::memcpy(&checksum, data + size - sizeof(uint32_t), sizeof(uint32_t));
+      if (checksum == adler32(1, data, size - sizeof(uint32_t)))
+        ok = true;
+    };
+  // the pages read for the checksum are not needed until the copy
+  // reaches them
+  madvise(map, size, MADV_DONTNEED);
+
+  if (ok) {
+    const uint64_t *const offsets =
+      reinterpret_cast<const uint64_t*>(data + sizeof(_BinaryHeader));
+    const uint32_t *const cols =
+      reinterpret_cast<const uint32_t*>(offsets + num_rows + 1);
+    const int8_t *const values =
+      reinterpret_cast<const int8_t*>(cols + header.nnz);
+    uint64_t copied = 0;
+    for (int i = 0; i < num_rows; ++i) {
+#ifdef FATGHOL_USE_RHEINFALL
+      for (uint64_t k = offsets[i]; k < offsets[i+1]; ++k)
+        m[i][cols[k]] = values[k];
+#else // use LinBox
+      // entries are sorted by column index within each row, so they
+      // can be appended directly to the row storage
+      _MatrixType::Row& row = *(m.rowBegin() + i);
+      row.reserve(offsets[i+1] - offsets[i]);
+      for (uint64_t k = offsets[i]; k < offsets[i+1]; ++k) {
+        _CoefficientRingType::Element a;
+        ZZ.init(a, values[k]);
+        row.push_back(std::make_pair(static_cast<size_t>(cols[k]), a));
+      };
+#endif
+      // entries are copied into the rows, so drop the pages of the
+      // file that have been consumed: the memory needed is then that
+      // of the matrix itself, plus a window of the file
+      if (offsets[i+1] - copied >= _DROP_PAGES_INTERVAL) {
+        _dropPages(data, cols + copied, cols + offsets[i+1]);
+        _dropPages(data, values + copied, values + offsets[i+1]);
+        copied = offsets[i+1];
+      };
+    };
+  };
+
+  munmap(map, size);
+  return ok;
+}
+
+
+inline
+void
+SimpleMatrix::saveBinary(const char *const filename) const
+{
+  _BinaryHeader header;
+  std::memcpy(header.magic, "FGSM", 4);
+  header.version = 1;
+  header.byteorder = 0x01020304;
+  header.num_rows = num_rows;
+  header.num_columns = num_columns;
+  header.padding = 0;
+  header.nnz = nnz();
+
+  std::vector<uint64_t> offsets;
+  offsets.reserve(num_rows + 1);
+  std::vector<uint32_t> cols;
+  cols.reserve(header.nnz);
+  std::vector<int8_t> values;
+  values.reserve(header.nnz);
+  offsets.push_back(0);
+#ifdef FATGHOL_USE_RHEINFALL
+  for (int i = 0; i < num_rows; ++i) {
+    _simplerows::const_iterator r = m.find(i);
+    if (r != m.end())
+      for(_simplerow::const_iterator x = r->second.begin(); x != r->second.end(); ++x) {
+        if (x->second < -128 or x->second > 127)
+          throw std::overflow_error("Matrix entry does not fit in binary format");
+        cols.push_back(x->first);
+        values.push_back(x->second);
+      };
+    offsets.push_back(cols.size());
+  };
+#else // use LinBox
+  for(_MatrixType::ConstRowIterator r = m.rowBegin(); r != m.rowEnd(); ++r) {
+    for (_MatrixType::Row::const_iterator x = r->begin(); x != r->end(); ++x) {
+      double value = 0;
+      ZZ.convert(value, x->second);
+      if (value < -128 or value > 127)
+        throw std::overflow_error("Matrix entry does not fit in binary format");
+      cols.push_back(x->first);
+      values.push_back(static_cast<int8_t>(value));
+    };
+    offsets.push_back(cols.size());
+  };
+#endif
+
+  std::ofstream output(filename, std::ios::out | std::ios::binary | std::ios::trunc);
+  if (not output.is_open())
+    throw std::runtime_error("Cannot open file for writing");
+  uint32_t checksum = 1;
+  const char *chunk;
+  size_t len;
+#define FATGHOL_WRITE_CHUNK(ptr, nbytes) \
+  chunk = reinterpret_cast<const char*>(ptr); \
+  len = (nbytes); \
+  checksum = adler32(checksum, reinterpret_cast<const unsigned char*>(chunk), len); \
+  output.write(chunk, len);
+  FATGHOL_WRITE_CHUNK(&header, sizeof(header));
+  FATGHOL_WRITE_CHUNK(&offsets[0], offsets.size() * sizeof(uint64_t));
+  if (header.nnz > 0) {
+    FATGHOL_WRITE_CHUNK(&cols[0], cols.size() * sizeof(uint32_t));
+    FATGHOL_WRITE_CHUNK(&values[0], values.size() * sizeof(int8_t));
+  };
+#undef FATGHOL_WRITE_CHUNK
+  // checksum is written last, so that a truncated file is detected
+  output.write(reinterpret_cast<const char*>(&checksum), sizeof(checksum));
+  output.close();
+  if (output.fail())
+    throw std::runtime_error("Error writing binary matrix file");
+}
+
+
 inline
 bool
 SimpleMatrix::load(const char *const filename)
@@ -226,6 +1415,16 @@ SimpleMatrix::load(const char *const filename)
   if ((not input.is_open()) or input.bad())
     return false;
 
+  // binary CSR files start with a magic string
+  char magic[4] = { 0, 0, 0, 0 };
+  input.read(magic, 4);
+  if (input.gcount() == 4 and 0 == std::memcmp(magic, "FGSM", 4)) {
+    input.close();
+    return loadBinary(filename);
+  };
+  input.clear();
+  input.seekg(0);
+
 #ifdef FATGHOL_USE_RHEINFALL
   // XXX: this is basically ripped off Rheinfall's "rank.hpp"
   int nrows, ncols;
@@ -33,4 +33,179 @@
 #include "simplematrix.hpp"
 %}
 
+%include "exception.i"
+
+%{
+// Release the GIL for the lifetime of an instance; unlike
+// `Py_BEGIN_ALLOW_THREADS`/`Py_END_ALLOW_THREADS`, this is safe
+// when the wrapped code throws a C++ exception.
+struct _ReleaseGIL {
+  PyThreadState *_state;
+  _ReleaseGIL() : _state(PyEval_SaveThread()) { };
+  ~_ReleaseGIL() { PyEval_RestoreThread(_state); };
+};
+%}
+
+// Bulk entry insertion and export: arrays of C `int` are passed in
+// and out through the buffer interface (e.g., `array.array('i')` or
+// NumPy `intc` arrays), without copying and without crossing the
+// Python/C++ boundary once per entry.
+%typemap(in) (const int *INPUT_BUFFER, size_t const INPUT_LENGTH) {
+  const void *buf;
+  Py_ssize_t len;
+  if (-1 == PyObject_AsReadBuffer($input, &buf, &len))
+    SWIG_fail;
+  if (0 != len % sizeof(int))
+    SWIG_exception_fail(SWIG_ValueError, "Buffer size is not a multiple of the C `int` size");
+  $1 = (int*) buf;
+  $2 = len / sizeof(int);
+}
+%typemap(in) (int *OUTPUT_BUFFER, size_t const OUTPUT_LENGTH) {
+  void *buf;
+  Py_ssize_t len;
+  if (-1 == PyObject_AsWriteBuffer($input, &buf, &len))
+    SWIG_fail;
+  if (0 != len % sizeof(int))
+    SWIG_exception_fail(SWIG_ValueError, "Buffer size is not a multiple of the C `int` size");
+  $1 = (int*) buf;
+  $2 = len / sizeof(int);
+}
+%apply (const int *INPUT_BUFFER, size_t const INPUT_LENGTH) {
+  (const int *rows, size_t const nrows),
+  (const int *cols, size_t const ncols),
+  (const int *values, size_t const nvalues)
+};
+%apply (int *OUTPUT_BUFFER, size_t const OUTPUT_LENGTH) {
+  (int *rows, size_t const nrows),
+  (int *cols, size_t const ncols),
+  (int *values, size_t const nvalues)
+};
+
+// turn C++ exceptions raised on invalid arguments into Python exceptions
+%exception {
+  try {
+    $action
+  }
+  catch (std::out_of_range& ex) {
+    SWIG_exception(SWIG_IndexError, ex.what());
+  }
+  catch (std::invalid_argument& ex) {
+    SWIG_exception(SWIG_ValueError, ex.what());
+  }
+  catch (std::length_error& ex) {
+    SWIG_exception(SWIG_ValueError, ex.what());
+  }
+  catch (std::overflow_error& ex) {
+    SWIG_exception(SWIG_OverflowError, ex.what());
+  }
+  catch (std::runtime_error& ex) {
+    SWIG_exception(SWIG_IOError, ex.what());
+  }
+}
+
+// release the GIL while computing the rank (or preparing for it), so
+// that the ranks of several matrices can be computed concurrently from
+// Python threads
+%exception SimpleMatrix::rank {
+  try {
+    _ReleaseGIL nogil;
+    $action
+  }
+  catch (std::bad_alloc& ex) {
+    SWIG_exception(SWIG_MemoryError, ex.what());
+  }
+}
+%exception SimpleMatrix::rankWith {
+  try {
+    _ReleaseGIL nogil;
+    $action
+  }
+  catch (std::invalid_argument& ex) {
+    SWIG_exception(SWIG_ValueError, ex.what());
+  }
+}
+%exception SimpleMatrix::reorderByDegree {
+  try {
+    _ReleaseGIL nogil;
+    $action
+  }
+  catch (std::bad_alloc& ex) {
+    SWIG_exception(SWIG_MemoryError, ex.what());
+  }
+}
+
+%exception SimpleMatrix::rankResumable {
+  try {
+    _ReleaseGIL nogil;
+    $action
+  }
+  catch (std::runtime_error& ex) {
+    SWIG_exception(SWIG_IOError, ex.what());
+  }
+}
+
+// release the GIL while writing matrices to file, so that checkpoints
+// can be written by a background thread while computation goes on
+%exception SimpleMatrix::save {
+  try {
+    _ReleaseGIL nogil;
+    $action
+  }
+  catch (std::runtime_error& ex) {
+    SWIG_exception(SWIG_IOError, ex.what());
+  }
+}
+%exception SimpleMatrix::saveBinary {
+  try {
+    _ReleaseGIL nogil;
+    $action
+  }
+  catch (std::overflow_error& ex) {
+    SWIG_exception(SWIG_OverflowError, ex.what());
+  }
+  catch (std::runtime_error& ex) {
+    SWIG_exception(SWIG_IOError, ex.what());
+  }
+}
+
 %include simplematrix.hpp
+
+%extend SimpleMatrix {
+%pythoncode %{
+    def row(self, i):
+        """Return the non-zero entries of row `i`, as a pair
+        `(cols, values)` of `array.array('i')` instances.
+        """
+        n = self.rowSize(i)
+        cols = _array.array('i', [0]) * n
+        values = _array.array('i', [0]) * n
+        self.getRowEntries(i, cols, values)
+        return (cols, values)
+
+    def column(self, j):
+        """Return the non-zero entries of column `j`, as a pair
+        `(rows, values)` of `array.array('i')` instances; row indices
+        are listed in increasing order.
+        """
+        n = self.columnSize(j)
+        rows = _array.array('i', [0]) * n
+        values = _array.array('i', [0]) * n
+        self.getColumnEntries(j, rows, values)
+        return (rows, values)
+
+    def entries(self):
+        """Return all non-zero entries, as a triple `(rows, cols,
+        values)` of `array.array('i')` instances, ordered by row.
+        """
+        n = self.nnz()
+        rows = _array.array('i', [0]) * n
+        cols = _array.array('i', [0]) * n
+        values = _array.array('i', [0]) * n
+        self.getEntries(rows, cols, values)
+        return (rows, cols, values)
+%}
+}
+
+%pythoncode %{
+import array as _array
+%}
@@ -1,7 +1,45 @@
 #! /usr/bin/env python
 #
 """
-Utilities for timing sections of code.
+Utilities for timing sections of code, and counting events.
+
+Timed sections of code ("stages") can be nested: a stage started
+while another one is running (in the same thread) is recorded as a
+child of it, so the recorded times form a tree.  For each stage, the
+number of times it was run, and the total wall-clock and CPU time
+spent in it, are recorded::
+
+  >>> reset()
+  >>> start("outer")
+  >>> for i in xrange(3):
+  ...   with stage("inner"):
+  ...     pass
+  >>> stop("outer")
+  >>> [ (s['name'], s['calls']) for s in report()['stages'] ]
+  [('outer', 1)]
+  >>> [ (s['name'], s['calls']) for s in report()['stages'][0]['children'] ]
+  [('inner', 3)]
+
+Function `count` always updates the named counter; code that
+should not pay for statistics when they are not wanted (e.g., in
+inner loops) checks the module-level variable `enabled` before
+calling it::
+
+  >>> import fatghol.timing as timing
+  >>> if timing.enabled:
+  ...   timing.count("calls")
+  >>> timing.report()['counters']
+  {}
+  >>> timing.enabled = True
+  >>> if timing.enabled:
+  ...   timing.count("calls"); timing.count("calls", 2)
+  >>> timing.report()['counters']
+  {'calls': 3}
+  >>> timing.enabled = False
+  >>> timing.reset()
+
+Use `save_report` (or `save_report_at_exit`) to write all recorded
+data into a JSON file.
 """
 #
 #   Copyright (C) 2008-2012 Riccardo Murri <riccardo.murri@gmail.com>
@@ -23,47 +61,226 @@ Utilities for timing sections of code.
 __docformat__ = 'reStructuredText'
 
 
+import atexit
+from collections import defaultdict
+import json
+import logging
+import threading
 import time
 
 
-_times = { }
-_started = { }
+#: If `False`, statistics are not wanted: callers should check this
+#: before calling `count`, which does not look at it.
+enabled = False
+
+#: If not `None`, called as `boundary_hook(label, event)` whenever a
+#: stage is started (`event` is ``'start'``) or stopped (``'stop'``);
+#: see `fatghol.memory`.
+boundary_hook = None
+
+
+class _Stage(object):
+    """Times recorded for a stage, and for the stages nested in it."""
+
+    __slots__ = ['name', 'calls', 'wall', 'cpu', 'children']
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.children = [ ]
+
+    def child(self, name):
+        """Return the child stage named `name`, creating it if needed."""
+        for node in self.children:
+            if node.name == name:
+                return node
+        node = _Stage(name)
+        self.children.append(node)
+        return node
+
+    def as_dict(self, running):
+        (wall, cpu) = (self.wall, self.cpu)
+        # add time spent so far in runs still in progress
+        for (wall0, cpu0) in running.get(id(self), []):
+            wall += time.time() - wall0
+            cpu += time.clock() - cpu0
+        return dict(name=self.name, calls=self.calls, wall=wall, cpu=cpu,
+                    running=(id(self) in running),
+                    children=[ node.as_dict(running) for node in self.children ])
+
+
+_root = _Stage(None)
+_lock = threading.Lock()
+_local = threading.local()
+#: stacks of running stages of all threads
+_stacks = [ ]
+#: wall-clock and CPU time of the last completed run of each stage
+_last = dict()
+_counters = defaultdict(int)
+
+
+def _stack():
+    """Return the stack of running stages of the calling thread."""
+    try:
+        return _local.stack
+    except AttributeError:
+        _local.stack = [ ]
+        with _lock:
+            _stacks.append(_local.stack)
+        return _local.stack
 
 
 def start(label):
     """Start a clock.
 
+    The stage is recorded as nested in the last stage started (and
+    not yet stopped) in the same thread.  The same label may be
+    started again before it is stopped (e.g., in a recursive
+    function): the inner run is then recorded as a distinct, nested
+    stage.
+
     :param str label: Arbitrary string identifying this clock for
     later reference.
     """
-    _started[label] = time.clock()
+    if boundary_hook is not None:
+        boundary_hook(label, 'start')
+    stack = _stack()
+    with _lock:
+        if len(stack) > 0:
+            node = stack[-1][0].child(label)
+        else:
+            node = _root.child(label)
+    stack.append((node, time.time(), time.clock()))
 
 
 def stop(label):
     """
     Stop a clock, given its reference label.
 
+    Stages need not be stopped in the reverse order they were
+    started: the most recently started run of `label` is stopped.
+
     :param str label: Arbitrary string identifying this clock;
     must match one of the arguments given to `timing.start`.
 
     :raise KeyError: If `label` was never passed to `timing.start`.
-    
+
     """
-    _times[label] = time.clock() - _started[label]
-    del _started[label]
+    stack = _stack()
+    for i in xrange(len(stack)-1, -1, -1):
+        if stack[i][0].name == label:
+            break
+    else:
+        raise KeyError(label)
+    (node, wall0, cpu0) = stack.pop(i)
+    wall = time.time() - wall0
+    cpu = time.clock() - cpu0
+    with _lock:
+        node.calls += 1
+        node.wall += wall
+        node.cpu += cpu
+        _last[label] = (wall, cpu)
+    if boundary_hook is not None:
+        boundary_hook(label, 'stop')
 
 
 def get(label):
-    """Return the time elapsed between the `start` and `stop` calls to
-    the clock named `label`, as single floating-point number
-    expressing the duration in seconds.
+    """Return the wall-clock time elapsed between the `start` and
+    `stop` calls of the last completed run of the clock named
+    `label`, as single floating-point number expressing the duration
+    in seconds.
 
     :raise KeyError: If `label` was never passed to `timing.stop`.
 
     """
-    return _times[label]
-    #return (delta.day*86400 + delta.hour*3600 + delta.minute*60 
-    #        + delta.second + (delta.microsecond / 1000000.0))
+    return _last[label][0]
+
+
+def get_cpu(label):
+    """Like `get`, but return the CPU time (of the whole process)."""
+    return _last[label][1]
+
+
+class stage(object):
+    """Context manager timing the enclosed block as stage `label`,
+    see `start`.
+    """
+
+    __slots__ = ['label']
+
+    def __init__(self, label):
+        self.label = label
+
+    def __enter__(self):
+        start(self.label)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        stop(self.label)
+        return False
+
+
+def count(name, n=1):
+    """Add `n` to the counter named `name`.
+
+    Counters are updated regardless of the value of `enabled`: check
+    it before calling this function.
+    """
+    _counters[name] += n
+
+
+def reset():
+    """Forget all recorded times and counters."""
+    with _lock:
+        del _root.children[:]
+        _last.clear()
+        _counters.clear()
+
+
+def report():
+    """Return a dictionary with all the recorded data.
+
+    Key `stages` maps to a list of the top-level stages, each of which
+    is a dictionary with keys `name`, `calls`, `wall` (total
+    wall-clock time in seconds), `cpu` (total CPU time of the whole
+    process in seconds), `running` (`True` if the stage has not been
+    stopped yet; its times then include the run in progress) and
+    `children` (list of nested stages).  Key `counters` maps to a
+    dictionary of counter values.
+    """
+    with _lock:
+        running = defaultdict(list)
+        for stack in _stacks:
+            for (node, wall0, cpu0) in stack:
+                running[id(node)].append((wall0, cpu0))
+        return dict(
+            stages=[ node.as_dict(running) for node in _root.children ],
+            counters=dict(_counters),
+            )
+
+
+def save_report(filename):
+    """Write the data returned by `report` into file `filename`, in
+    JSON format.
+    """
+    with open(filename, 'w') as output:
+        json.dump(report(), output, indent=1, sort_keys=True)
+
+
+def save_report_at_exit(filename):
+    """Arrange for `save_report` to be called when the program exits;
+    if that fails, just log an error.
+    """
+    def _save():
+        try:
+            save_report(filename)
+            logging.info("Timing and counters report written to file '%s'", filename)
+        except Exception, error:
+            logging.error("Could not write timing and counters report to file '%s': %s",
+                          filename, error)
+    atexit.register(_save)
 
 
 ## main: run tests
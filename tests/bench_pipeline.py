@@ -0,0 +1,344 @@
+#! /usr/bin/env python
+"""
+Time each stage of the graph homology computation on a graded set of
+cases, and compare the timings against a saved baseline.
+
+Usage: bench_pipeline.py [options] [G,N ...]
+
+Stages timed separately for each M_{g,n} are:
+
+  trivalent   generation of the trivalent graphs;
+  contract    contraction of edges and deduplication, layer by layer;
+  pools       construction of the `NumberedFatgraphPool` instances
+              and of the chain complex;
+  assembly    computation of the boundary operator matrices;
+  save, load  writing graph lists and matrices into checkpoint files,
+              and reading them back;
+  ranks       computation of the matrix ranks (and homology).
+
+With no G,N arguments, the cases in `QUICK` are run; with option
+`--all`, also the larger ones in `CASES` (up to M_{1,4} and M_{2,2},
+which take hours).  Option `--until STAGE` skips all stages after
+STAGE.  In addition, for each case an isomorphism micro-benchmark
+times comparisons between (copies of) a sample of its graphs.
+
+Each case is run `--repeat` times, every time in a separate process so
+that caches are cold and peak memory usage can be measured; the
+minimum time of each stage is reported.  Results are printed as a
+table, and can be saved into a JSON file with `--save FILE`.
+
+With `--compare BASELINE`, results are compared with those in the
+JSON file BASELINE, and any stage that takes more than `--threshold`
+percent (default: 10) longer is flagged as a regression; the exit
+status is then 1.  Stages taking less than `MIN_TIME` seconds in
+both runs are never flagged, as their timings are mostly noise.
+Give `--compare BASELINE RESULTS` to compare two saved files without
+running anything.
+"""
+
+import argparse
+from collections import defaultdict
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from fatghol.graph_homology import MgnChainComplex, NumberedFatgraphPool
+from fatghol.loadsave import load_graphs, load_matrix, save_graphs, save_matrix
+from fatghol.rg import Fatgraph, MgnGraphsIterator, isomorphisms_cache
+import fatghol.timing as timing
+
+
+#: Cases run by default, in order of increasing cost.
+QUICK = [(0,4), (1,1), (0,5), (1,2), (2,1)]
+
+#: All cases run with `--all`.
+CASES = QUICK + [(1,3), (0,6), (2,2), (1,4)]
+
+#: Stages, in the order they are run.
+STAGES = ['trivalent', 'contract', 'pools', 'assembly', 'save', 'load', 'ranks']
+
+#: Timings below this (in seconds) are too short to flag regressions.
+MIN_TIME = 0.05
+
+#: Number of graphs per layer used in isomorphism micro-benchmarks.
+ISO_SAMPLE = 25
+
+#: Number of times each isomorphism micro-benchmark is repeated
+#: (on fresh copies of the graphs) within a single run.
+ISO_ROUNDS = 10
+
+
+def run_case(g, n, until='ranks'):
+    """Run the stages of the computation of the homology of M_{g,n}
+    up to `until`, and return a dictionary mapping stage names to
+    the time taken (in seconds), plus the following keys: `graphs`
+    (total number of graphs), `nnz` (total number of non-zero entries
+    in the boundary operators), `homology` (list of ranks of the
+    homology groups), `maxrss` (peak memory usage, in KiB).
+    """
+    result = dict()
+    last = STAGES.index(until)
+
+    # trivalent graphs, contraction and deduplication are timed by
+    # `MgnGraphsIterator` itself
+    timing.reset()
+    graphs = list(MgnGraphsIterator(g,n))
+    result['graphs'] = len(graphs)
+    stages = timing.report()['stages']
+    result['trivalent'] = sum(s['wall'] for s in stages
+                              if s['name'] == "MgnGraphsIterator: trivalent graphs")
+    result['contract'] = sum(s['wall'] for s in stages
+                             if s['name'].endswith(" vertices"))
+
+    if last >= STAGES.index('pools'):
+        start = time.time()
+        top_dimension = 6*g + 3*n - 6
+        C = MgnChainComplex(top_dimension)
+        for graph in graphs:
+            pool = NumberedFatgraphPool(graph)
+            if pool.is_orientable:
+                C.module[graph.num_edges - 1].aggregate(pool)
+        result['pools'] = time.time() - start
+
+    if last >= STAGES.index('assembly'):
+        start = time.time()
+        D = C.compute_boundary_operators()
+        result['assembly'] = time.time() - start
+        result['nnz'] = sum(D.matrix(i).nnz() for i in xrange(1, len(D))
+                            if D[i][1] > 0 and D[i][2] > 0)
+
+    if last >= STAGES.index('save'):
+        tmpdir = tempfile.mkdtemp(prefix='bench_pipeline.')
+        try:
+            layers = defaultdict(list)
+            for graph in graphs:
+                layers[graph.num_vertices].append(graph)
+            start = time.time()
+            for (v, layer) in layers.iteritems():
+                save_graphs(layer, os.path.join(tmpdir, 'graphs%d.list' % v))
+            matrices = [ ]
+            for i in xrange(1, len(D)):
+                if D[i][1] == 0 or D[i][2] == 0:
+                    continue # with next `i`
+                filename = os.path.join(tmpdir, 'D%d.csr' % i)
+                try:
+                    save_matrix(D.matrix(i), filename)
+                except OverflowError:
+                    filename = filename[:-len('.csr')] + '.sms'
+                    save_matrix(D.matrix(i), filename)
+                matrices.append(filename)
+            result['save'] = time.time() - start
+
+            if last >= STAGES.index('load'):
+                start = time.time()
+                for v in layers:
+                    assert len(load_graphs(os.path.join(tmpdir, 'graphs%d.list' % v))) \
+                           == len(layers[v])
+                for filename in matrices:
+                    assert load_matrix(filename) is not None
+                result['load'] = time.time() - start
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    if last >= STAGES.index('ranks'):
+        start = time.time()
+        result['homology'] = list(D.compute_homology_ranks())
+        result['ranks'] = time.time() - start
+
+    result['maxrss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return result
+
+
+def run_isomorphisms(g, n):
+    """Time isomorphism computations among graphs of M_{g,n}.
+
+    From each layer, `ISO_SAMPLE` graphs are taken; for each of
+    them, all isomorphisms between two fresh copies (so that no cached
+    result is used; `isomorphisms_cache` is also cleared before each
+    round) are enumerated, and a copy is compared for
+    equality with the next graph in the sample; this is repeated
+    `ISO_ROUNDS` times.  Return a dictionary mapping ``isomorphisms``
+    and ``compare`` to the total time taken (in seconds), and
+    ``calls`` to the number of pairs of graphs tried in each round.
+    """
+    layers = defaultdict(list)
+    for graph in MgnGraphsIterator(g,n):
+        if len(layers[graph.num_vertices]) < ISO_SAMPLE:
+            layers[graph.num_vertices].append(graph)
+    pairs = [ ]
+    for layer in layers.itervalues():
+        for (k, graph) in enumerate(layer):
+            pairs.append((graph, layer[(k+1) % len(layer)]))
+    (isomorphisms, compare) = (0.0, 0.0)
+    for dummy in xrange(ISO_ROUNDS):
+        # make copies in advance, so only the comparison is timed
+        copies = [ (Fatgraph(G1), Fatgraph(G1), Fatgraph(G1), Fatgraph(G2))
+                   for (G1, G2) in pairs ]
+        isomorphisms_cache.clear()
+        start = time.time()
+        for (G1, G1_, G1__, G2) in copies:
+            for f in G1.isomorphisms(G1_):
+                pass
+        isomorphisms += time.time() - start
+        start = time.time()
+        for (G1, G1_, G1__, G2) in copies:
+            G1__ == G2
+        compare += time.time() - start
+    return dict(isomorphisms=isomorphisms, compare=compare, calls=len(pairs))
+
+
+def run_in_child(func, *args):
+    # run in a separate process, so that caches are cold and peak
+    # memory usage of each case can be measured independently
+    (rfd, wfd) = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        try:
+            result = json.dumps(func(*args))
+        except Exception, error:
+            result = json.dumps(dict(error=str(error)))
+        os.write(wfd, result)
+        os._exit(0)
+    os.close(wfd)
+    data = ''
+    while True:
+        chunk = os.read(rfd, 4096)
+        if not chunk:
+            break
+        data += chunk
+    os.close(rfd)
+    os.waitpid(pid, 0)
+    result = json.loads(data)
+    if 'error' in result:
+        raise RuntimeError("Benchmark %s%r failed: %s"
+                           % (func.__name__, args, result['error']))
+    return result
+
+
+def best_of(repeat, func, *args):
+    """Run `func(*args)` in a child process `repeat` times, and
+    return the result of the first run with each time replaced by
+    the minimum across all runs.
+    """
+    results = [ run_in_child(func, *args) for dummy in xrange(repeat) ]
+    best = results[0]
+    for key in best:
+        if isinstance(best[key], float):
+            best[key] = min(r[key] for r in results)
+    return best
+
+
+def print_results(results):
+    print ("%-20s %-12s %10s" % ("case", "stage", "time (s)"))
+    for name in sorted(results, key=_case_order):
+        result = results[name]
+        for stage in (STAGES + ['isomorphisms', 'compare']):
+            if stage in result:
+                print ("%-20s %-12s %10.3f" % (name, stage, result[stage]))
+        if 'maxrss' in result:
+            print ("%-20s %-12s %10d" % (name, "maxrss (KiB)", result['maxrss']))
+
+
+def compare(baseline, results, threshold):
+    """Print a comparison of `results` against `baseline`, and return
+    the number of stages that are slower by more than `threshold`
+    percent.
+    """
+    regressions = 0
+    print ("%-20s %-12s %10s %10s %8s" % ("case", "stage", "old (s)", "new (s)", "change"))
+    for name in sorted(set(baseline) & set(results), key=_case_order):
+        for stage in (STAGES + ['isomorphisms', 'compare']):
+            if stage not in baseline[name] or stage not in results[name]:
+                continue # with next `stage`
+            old = baseline[name][stage]
+            new = results[name][stage]
+            change = 100.0 * (new - old) / old if old > 0 else 0.0
+            flag = ''
+            if change > threshold and max(old, new) >= MIN_TIME:
+                flag = 'REGRESSION'
+                regressions += 1
+            print ("%-20s %-12s %10.3f %10.3f %+7.1f%% %s"
+                   % (name, stage, old, new, change, flag))
+        if results[name].get('homology') != baseline[name].get('homology'):
+            print ("%-20s homology changed: %s (was: %s)"
+                   % (name, results[name].get('homology'), baseline[name].get('homology')))
+            regressions += 1
+    return regressions
+
+
+def _case_order(name):
+    # sort `M0,4` before `isomorphisms(M0,4)`, and cases by cost
+    base = name[len('isomorphisms('):-1] if name.startswith('isomorphisms(') else name
+    (g, n) = [ int(x) for x in base[1:].split(',') ]
+    try:
+        rank = CASES.index((g,n))
+    except ValueError:
+        rank = len(CASES)
+    return (rank, g, n, name)
+
+
+def _case(arg):
+    try:
+        (g, n) = [ int(x) for x in arg.split(',') ]
+    except ValueError:
+        raise argparse.ArgumentTypeError("'%s' is not of the form G,N" % arg)
+    return (g, n)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Time each stage of the graph homology computation.")
+    parser.add_argument('cases', metavar='G,N', nargs='*', type=_case,
+                        help="Cases to run (default: %s)."
+                        % str.join(" ", [ ("%d,%d" % c) for c in QUICK ]))
+    parser.add_argument('--all', action='store_true', default=False,
+                        help="Run all cases, up to M_{1,4} and M_{2,2}.")
+    parser.add_argument('--compare', nargs='+', metavar='FILE', default=None,
+                        help="""Compare results with the baseline in the first FILE;
+    if a second FILE is given, read results from it instead of running.""")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Run each case this many times (default: 3).")
+    parser.add_argument('--save', metavar='FILE', default=None,
+                        help="Save results into FILE, in JSON format.")
+    parser.add_argument('--threshold', type=float, default=10.0, metavar='PERCENT',
+                        help="Minimum slowdown flagged as a regression (default: 10).")
+    parser.add_argument('--until', choices=STAGES, default='ranks', metavar='STAGE',
+                        help="Skip all stages after STAGE (one of: %s)."
+                        % str.join(", ", STAGES))
+    args = parser.parse_args()
+    if args.compare is not None and len(args.compare) > 2:
+        parser.error("At most two files can be given to --compare.")
+
+    if args.compare is not None and len(args.compare) == 2:
+        with open(args.compare[1], 'r') as results_file:
+            results = json.load(results_file)['results']
+    else:
+        cases = args.cases or (CASES if args.all else QUICK)
+        results = dict()
+        for (g, n) in cases:
+            name = "M%d,%d" % (g, n)
+            sys.stderr.write("Running %s ...\n" % name)
+            results[name] = best_of(args.repeat, run_case, g, n, args.until)
+            results['isomorphisms(%s)' % name] = best_of(args.repeat, run_isomorphisms, g, n)
+        print_results(results)
+        if args.save is not None:
+            with open(args.save, 'w') as output:
+                json.dump(dict(python=platform.python_version(),
+                               host=platform.node(),
+                               date=time.strftime('%Y-%m-%d %H:%M:%S'),
+                               repeat=args.repeat,
+                               results=results),
+                          output, indent=1, sort_keys=True)
+
+    if args.compare is not None:
+        with open(args.compare[0], 'r') as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        print
+        if compare(baseline, results, args.threshold) > 0:
+            sys.exit(1)
@@ -0,0 +1,272 @@
+#! /usr/bin/env python
+"""
+Compare rank computation backends on a corpus of boundary operators.
+
+Usage:
+  bench_ranks.py collect CORPUS_DIR CHECKPOINT_DIR [CHECKPOINT_DIR ...]
+  bench_ranks.py run CORPUS_DIR [options]
+
+The ``collect`` command gathers the boundary operator matrices
+(files `M<g>,<n>-D<i>.sms` or `.csr`) saved in the given checkpoint
+directories into directory CORPUS_DIR, together with a metadata file
+`corpus.json` recording, for each matrix, the M_{g,n} and index `i`
+it comes from, its dimensions and number of non-zero entries, and its
+rank if the checkpoint directory holds it (file `M<g>,<n>-rkD<i>.txt`).
+Null matrices are skipped, and matrices already in the corpus are not
+copied again.
+
+The ``run`` command computes the rank of every matrix in the corpus
+with every backend in `BACKENDS` (or those given with `--backends`),
+each time in a separate process, which is killed if it takes longer
+than `--timeout` seconds, and cannot use more than `--max-memory`
+megabytes.  The table printed at the end reports, for each matrix and
+backend, the time taken, the growth of the peak memory usage during
+the computation, and the rank; a rank that differs from the known one
+is marked with ``!``, and the fastest backend for each matrix with
+``*``.  With `--save FILE`, results are also saved in JSON format.
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import resource
+import shutil
+import signal
+import sys
+import time
+
+from fatghol.loadsave import load, load_matrix
+from fatghol.simplematrix import SimpleMatrix
+
+
+def _linbox(A):
+    return A.rank()
+
+def _pivot_linear(A):
+    return A.rankWith(SimpleMatrix.RANK_PIVOT_LINEAR)
+
+def _pivot_none(A):
+    return A.rankWith(SimpleMatrix.RANK_PIVOT_NONE)
+
+def _blackbox(A):
+    return A.rankWith(SimpleMatrix.RANK_BLACKBOX)
+
+def _degree(A):
+    A.reorderByDegree()
+    return A.rank()
+
+def _resumable(A):
+    return A.rankResumable(None, 0)
+
+#: Rank computation backends: pairs `(name, function)`, where
+#: `function` takes a `SimpleMatrix` and returns its rank.
+BACKENDS = [
+    ('linbox',       _linbox),       # strategy chosen at compile time
+    ('pivot-linear', _pivot_linear),
+    ('pivot-none',   _pivot_none),
+    ('blackbox',     _blackbox),
+    ('degree',       _degree),       # as with `mgn --reorder degree`
+    ('resumable',    _resumable),    # as with `mgn --rank-backend resumable`
+    ]
+
+METADATA = 'corpus.json'
+
+_MATRIX_FILE = re.compile(r'^M(\d+),(\d+)-D(\d+)\.(sms|csr)$')
+
+
+def load_corpus(corpus_dir):
+    """Return the list of matrix descriptions in directory `corpus_dir`."""
+    try:
+        with open(os.path.join(corpus_dir, METADATA), 'r') as metadata:
+            return json.load(metadata)
+    except IOError:
+        return [ ]
+
+
+def collect(corpus_dir, checkpoint_dirs):
+    """Copy the boundary operators saved in `checkpoint_dirs` into
+    `corpus_dir`, and update its metadata file.
+    """
+    if not os.path.isdir(corpus_dir):
+        os.makedirs(corpus_dir)
+    corpus = load_corpus(corpus_dir)
+    known = set(item['file'] for item in corpus)
+    for checkpoint_dir in checkpoint_dirs:
+        for path in sorted(glob.glob(os.path.join(checkpoint_dir, 'M*,*-D*.*'))):
+            name = os.path.basename(path)
+            match = _MATRIX_FILE.match(name)
+            if not match:
+                continue # with next `path`
+            (g, n, i) = [ int(x) for x in match.groups()[:3] ]
+            if (name in known
+                or (name.endswith('.sms') and name[:-4] + '.csr' in known)):
+                continue # with next `path`
+            A = load_matrix(path)
+            if A is None:
+                sys.stderr.write("Skipping file '%s': cannot load matrix.\n" % path)
+                continue # with next `path`
+            if A.nnz() == 0:
+                continue # with next `path`
+            try:
+                rank = load(os.path.join(checkpoint_dir, 'M%d,%d-rkD%d.txt' % (g, n, i)))[0]
+            except Exception:
+                rank = None
+            shutil.copy(path, os.path.join(corpus_dir, name))
+            corpus.append(dict(file=name, g=g, n=n, i=i,
+                               rows=A.num_rows, columns=A.num_columns, nnz=A.nnz(),
+                               rank=rank, source=os.path.abspath(checkpoint_dir)))
+            known.add(name)
+            sys.stderr.write("Added file '%s' (%dx%d, %d non-zero entries, rank %s)\n"
+                             % (name, A.num_rows, A.num_columns, A.nnz(), rank))
+    corpus.sort(key=lambda item: (item['nnz'], item['file']))
+    with open(os.path.join(corpus_dir, METADATA), 'w') as metadata:
+        json.dump(corpus, metadata, indent=1, sort_keys=True)
+    return corpus
+
+
+def measure(filename, backend):
+    A = load_matrix(filename)
+    if A is None:
+        raise ValueError("Cannot load matrix from file '%s'" % filename)
+    mem0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    r = backend(A)
+    elapsed = time.time() - start
+    mem1 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return dict(status='ok', rank=r, time=elapsed, memory=(mem1 - mem0))
+
+
+def run_in_child(filename, backend, timeout, max_memory):
+    # run in a separate process, so that peak memory usage of each
+    # rank computation can be measured independently, and time and
+    # memory limits can be enforced
+    (rfd, wfd) = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        if max_memory:
+            limit = max_memory * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        if timeout:
+            # default action of SIGALRM is to terminate the process
+            signal.alarm(timeout)
+        try:
+            result = measure(filename, backend)
+        except MemoryError:
+            result = dict(status='memory')
+        except Exception, error:
+            result = dict(status='error', error=str(error))
+        os.write(wfd, json.dumps(result))
+        os._exit(0)
+    os.close(wfd)
+    data = ''
+    while True:
+        chunk = os.read(rfd, 4096)
+        if not chunk:
+            break
+        data += chunk
+    os.close(rfd)
+    (pid, status) = os.waitpid(pid, 0)
+    if data:
+        return json.loads(data)
+    if os.WIFSIGNALED(status):
+        sig = os.WTERMSIG(status)
+        if sig == signal.SIGALRM:
+            return dict(status='timeout')
+        if max_memory and sig in (signal.SIGABRT, signal.SIGKILL, signal.SIGSEGV):
+            # C++ code aborts when memory allocation fails
+            return dict(status='memory')
+        return dict(status='signal %d' % sig)
+    return dict(status='error', error="exit code %d" % os.WEXITSTATUS(status))
+
+
+def run(corpus_dir, backends, timeout, max_memory):
+    """Compute the rank of every matrix in `corpus_dir` with every
+    one of `backends`; return the list of matrix descriptions, each
+    one with an additional key `results` mapping backend names to the
+    outcome of the computation.
+    """
+    corpus = load_corpus(corpus_dir)
+    if not corpus:
+        raise ValueError("No matrices in corpus directory '%s'" % corpus_dir)
+    for item in corpus:
+        item['results'] = dict()
+        for (name, backend) in backends:
+            sys.stderr.write("Computing rank of '%s' with backend '%s' ...\n"
+                             % (item['file'], name))
+            # JSON strings are `unicode`, but SWIG wants a `str`
+            item['results'][name] = run_in_child(os.path.join(corpus_dir, str(item['file'])),
+                                                 backend, timeout, max_memory)
+    return corpus
+
+
+def print_table(corpus, backends):
+    print ("%-16s %9s %9s %10s %9s  %-12s %10s %12s %9s"
+           % ("file", "rows", "columns", "nnz", "rank",
+              "backend", "time (s)", "mem (KiB)", "rank"))
+    for item in corpus:
+        results = item['results']
+        times = [ results[name]['time'] for (name, backend) in backends
+                  if results[name]['status'] == 'ok' ]
+        fastest = min(times) if times else None
+        first = True
+        for (name, backend) in backends:
+            result = results[name]
+            if first:
+                prefix = ("%-16s %9d %9d %10d %9s"
+                          % (item['file'], item['rows'], item['columns'], item['nnz'],
+                             item['rank'] if item['rank'] is not None else '?'))
+                first = False
+            else:
+                prefix = " " * 57
+            if result['status'] == 'ok':
+                mark = ''
+                if item['rank'] is not None and result['rank'] != item['rank']:
+                    mark += '!'
+                if result['time'] == fastest:
+                    mark += '*'
+                print ("%s  %-12s %10.3f %12d %9d %s"
+                       % (prefix, name, result['time'], result['memory'], result['rank'], mark)).rstrip()
+            elif result['status'] == 'error':
+                print ("%s  %-12s error: %s" % (prefix, name, result['error']))
+            else:
+                print ("%s  %-12s %s" % (prefix, name, result['status']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Compare rank computation backends on a corpus of boundary operators.")
+    commands = parser.add_subparsers(dest='command')
+    collect_cmd = commands.add_parser('collect', help="Gather matrices into a corpus.")
+    collect_cmd.add_argument('corpus_dir', metavar='CORPUS_DIR')
+    collect_cmd.add_argument('checkpoint_dirs', metavar='CHECKPOINT_DIR', nargs='+')
+    run_cmd = commands.add_parser('run', help="Run all backends on the corpus.")
+    run_cmd.add_argument('corpus_dir', metavar='CORPUS_DIR')
+    run_cmd.add_argument('--backends', default=None, metavar='NAMES',
+                         help="Comma-separated list of backends to run (default: all of %s)."
+                         % str.join(",", [ name for (name, backend) in BACKENDS ]))
+    run_cmd.add_argument('--max-memory', type=int, default=None, metavar='MB',
+                         help="Abort a rank computation using more than MB megabytes.")
+    run_cmd.add_argument('--save', default=None, metavar='FILE',
+                         help="Save results into FILE, in JSON format.")
+    run_cmd.add_argument('--timeout', type=int, default=3600, metavar='SECONDS',
+                         help="Abort a rank computation taking longer than this (default: 3600).")
+    args = parser.parse_args()
+
+    if args.command == 'collect':
+        collect(args.corpus_dir, args.checkpoint_dirs)
+    else:
+        backends = BACKENDS
+        if args.backends is not None:
+            names = args.backends.split(',')
+            unknown = set(names) - set(name for (name, backend) in BACKENDS)
+            if unknown:
+                parser.error("Unknown backends: %s" % str.join(", ", sorted(unknown)))
+            backends = [ (name, backend) for (name, backend) in BACKENDS if name in names ]
+        corpus = run(args.corpus_dir, backends, args.timeout, args.max_memory)
+        print_table(corpus, backends)
+        if args.save is not None:
+            with open(args.save, 'w') as output:
+                json.dump(corpus, output, indent=1, sort_keys=True)
@@ -0,0 +1,83 @@
+#! /usr/bin/env python
+"""
+Compare rank computation with and without fill-reducing reordering.
+
+Usage: bench_reorder.py MATRIX_FILE [MATRIX_FILE ...]
+
+Each file can be in SMS text format or in binary CSR format (e.g.,
+the `M<g>,<n>-D<i>.sms` or `.csr` files in a checkpoint directory).
+The rank of each matrix is computed once for every reordering method,
+each time in a separate process; the table printed at the end reports
+the rank, the time taken (reordering included) and the growth of the
+peak memory usage during elimination, which is dominated by fill-in.
+"""
+
+import os
+import resource
+import sys
+import time
+
+from fatghol.loadsave import load_matrix
+
+
+METHODS = ['none', 'degree']
+
+
+def measure(filename, method):
+    A = load_matrix(filename)
+    if A is None:
+        raise ValueError("Cannot load matrix from file '%s'" % filename)
+    mem0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    if method == 'degree':
+        A.reorderByDegree()
+    r = A.rank()
+    elapsed = time.time() - start
+    mem1 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return (A.num_rows, A.num_columns, A.nnz(), r, elapsed, mem1 - mem0)
+
+
+def run_in_child(filename, method):
+    # run in a separate process, so that peak memory usage of each
+    # rank computation can be measured independently
+    (rfd, wfd) = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        try:
+            result = measure(filename, method)
+        except Exception, error:
+            result = error
+        os.write(wfd, repr(result))
+        os._exit(0)
+    os.close(wfd)
+    data = ''
+    while True:
+        chunk = os.read(rfd, 4096)
+        if not chunk:
+            break
+        data += chunk
+    os.close(rfd)
+    os.waitpid(pid, 0)
+    if data.startswith('('):
+        return eval(data)
+    raise RuntimeError("Rank computation on file '%s' failed: %s" % (filename, data))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.stderr.write(__doc__)
+        sys.exit(1)
+
+    print ("%-24s %-8s %9s %9s %10s %9s %10s %12s"
+           % ("file", "order", "rows", "columns", "nnz", "rank", "time (s)", "fill (KiB)"))
+    for filename in sys.argv[1:]:
+        ranks = set()
+        for method in METHODS:
+            (rows, columns, nnz, r, elapsed, fill) = run_in_child(filename, method)
+            ranks.add(r)
+            print ("%-24s %-8s %9d %9d %10d %9d %10.3f %12d"
+                   % (os.path.basename(filename), method,
+                      rows, columns, nnz, r, elapsed, fill))
+        assert len(ranks) == 1, \
+               "Reordering changed the rank of matrix in file '%s'" % filename